@@ -0,0 +1,201 @@
+from typing import Dict, Any, Optional, Callable, Awaitable, Tuple
+from datetime import datetime, timedelta
+from collections import OrderedDict
+import asyncio
+import hashlib
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class CachedFailureError(Exception):
+    """Raised when a recent failure for the same prompt is served from the negative cache"""
+
+
+class ResponseCache:
+    """Content-addressed cache for LLM responses
+
+    Entries are keyed on a hash of the model ID and the normalized prompt. A bounded
+    in-memory LRU sits in front of a Mongo collection so warm entries survive restarts.
+    Each entry is fresh until ``ttl`` and then served stale for ``stale_ttl`` more
+    while a background refresh replaces it. Failures can optionally be cached for
+    ``negative_ttl`` so a broken prompt does not hammer the provider.
+
+    The collection is shared by every worker. Local copies are re-read from it after
+    ``local_ttl`` seconds so another worker's invalidation or refresh shows up, and
+    every ``prune_every`` writes the entries closest to expiry are deleted to keep it
+    near ``max_stored_entries`` instead of growing until the TTL index catches up.
+    """
+
+    def __init__(self, collection=None, max_entries: int = 2048,
+                 ttl: int = 7 * 24 * 3600, stale_ttl: int = 24 * 3600, negative_ttl: int = 0,
+                 max_stored_entries: int = 100_000, prune_every: int = 256, local_ttl: float = 60.0):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.max_stored_entries = max_stored_entries
+        self.prune_every = prune_every
+        self.local_ttl = local_ttl
+        # key -> (monotonic time the copy was loaded, entry)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._writes = 0
+        self.stats = {"hits": 0, "stale_hits": 0, "negative_hits": 0, "misses": 0,
+                      "refreshes": 0, "evictions": 0, "pruned": 0}
+
+    @staticmethod
+    def make_key(model_id: str, system_message: str, prompt: str) -> str:
+        """Hash the model ID and whitespace-normalized prompt into a cache key"""
+        normalized = "\x00".join(
+            _WHITESPACE.sub(" ", part).strip() for part in (model_id, system_message, prompt)
+        )
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    async def ensure_indexes(self):
+        """Create the key index and the TTL index that expires dead entries"""
+        if self.collection is None:
+            return
+        await self.collection.create_index("key", unique=True)
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[str]],
+                           model_id: str = "", validate: Optional[Callable[[str], Any]] = None) -> str:
+        """Return the cached response for ``key``, calling ``fetch`` on a miss
+
+        ``validate`` is applied to fresh responses before they are stored; a response
+        that fails validation is not cached.
+        """
+        now = datetime.utcnow()
+        entry = await self._lookup(key, now)
+
+        if entry is not None:
+            if now < entry["fresh_until"]:
+                if "error" in entry:
+                    self.stats["negative_hits"] += 1
+                    raise CachedFailureError(entry["error"])
+                self.stats["hits"] += 1
+                return entry["response"]
+
+            if "response" in entry:
+                # Stale-while-revalidate: answer now, refresh behind the caller
+                self.stats["stale_hits"] += 1
+                self._schedule_refresh(key, fetch, model_id, validate)
+                return entry["response"]
+
+        self.stats["misses"] += 1
+        return await self._fetch_and_store(key, fetch, model_id, validate)
+
+    async def invalidate(self, key: str):
+        """Drop an entry from both tiers
+
+        Other workers drop their local copy within ``local_ttl``.
+        """
+        self._entries.pop(key, None)
+        refresh = self._refreshing.pop(key, None)
+        if refresh is not None:
+            # Otherwise the refresh would store the entry again
+            refresh.cancel()
+        if self.collection is not None:
+            await self.collection.delete_one({"key": key})
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["stale_hits"] + self.stats["negative_hits"] + self.stats["misses"]
+        served = self.stats["hits"] + self.stats["stale_hits"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "hit_rate": served / lookups if lookups else 0.0
+        }
+
+    async def _lookup(self, key: str, now: datetime) -> Optional[Dict[str, Any]]:
+        cached = self._entries.get(key)
+        if cached is not None and self.collection is not None and time.monotonic() - cached[0] >= self.local_ttl:
+            # Re-read the shared copy to pick up other workers' invalidations and refreshes
+            del self._entries[key]
+            cached = None
+        entry = cached[1] if cached is not None else None
+
+        if entry is None and self.collection is not None:
+            entry = await self.collection.find_one({"key": key}, {"_id": 0})
+            if entry is not None:
+                self._remember(key, entry)
+        elif entry is not None:
+            self._entries.move_to_end(key)
+
+        if entry is None or now >= entry["expires_at"]:
+            return None
+        return entry
+
+    async def _fetch_and_store(self, key: str, fetch: Callable[[], Awaitable[str]],
+                               model_id: str, validate: Optional[Callable[[str], Any]],
+                               cache_failure: bool = True) -> str:
+        try:
+            response = await fetch()
+            if validate:
+                validate(response)
+        except Exception as e:
+            if cache_failure and self.negative_ttl > 0:
+                await self._store(key, {"error": str(e)}, model_id, self.negative_ttl, 0)
+            raise
+
+        await self._store(key, {"response": response}, model_id, self.ttl, self.stale_ttl)
+        return response
+
+    async def _store(self, key: str, payload: Dict[str, Any], model_id: str, ttl: int, stale_ttl: int):
+        now = datetime.utcnow()
+        entry = {
+            "key": key,
+            "model_id": model_id,
+            **payload,
+            "created_at": now,
+            "fresh_until": now + timedelta(seconds=ttl),
+            "expires_at": now + timedelta(seconds=ttl + stale_ttl)
+        }
+        self._remember(key, entry)
+
+        if self.collection is not None:
+            # Replace the whole entry so a success clears an earlier cached failure
+            await self.collection.replace_one({"key": key}, entry, upsert=True)
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                await self._prune()
+
+    async def _prune(self):
+        """Delete the stored entries closest to expiry beyond ``max_stored_entries``"""
+        excess = await self.collection.count_documents({}) - self.max_stored_entries
+        if excess <= 0:
+            return
+        cursor = self.collection.find({}, {"_id": 1}).sort("expires_at", 1).limit(excess)
+        ids = [doc["_id"] async for doc in cursor]
+        result = await self.collection.delete_many({"_id": {"$in": ids}})
+        self.stats["pruned"] += result.deleted_count
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        self._entries[key] = (time.monotonic(), entry)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _schedule_refresh(self, key: str, fetch: Callable[[], Awaitable[str]],
+                          model_id: str, validate: Optional[Callable[[str], Any]]):
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                # A failed refresh keeps serving the stale response rather than caching the error
+                await self._fetch_and_store(key, fetch, model_id, validate, cache_failure=False)
+                self.stats["refreshes"] += 1
+            except Exception as e:
+                logger.warning(f"Background refresh failed for cache key {key[:12]}: {e}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
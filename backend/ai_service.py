@@ -1,32 +1,327 @@
 import os
 import json
-from typing import Dict, List, Any, Optional
-from emergentintegrations.llm.chat import LlmChat, UserMessage
-from models import QuestionType, AIGeneratedQuestion, AIRecommendation
+import time
+import random
+import asyncio
+import hashlib
+from typing import Dict, List, Any, Optional, Tuple, Callable, AsyncIterator
+import requests
+from requests.adapters import HTTPAdapter
+from models import QuestionType
+from ai_cache import ResponseCache
+from json_stream import JSONArrayStreamParser, parse_json_array
 import uuid
-from datetime import datetime
 
-class AIService:
-    def __init__(self):
-        self.api_key = os.environ.get('EMERGENT_LLM_KEY')
-        if not self.api_key:
-            raise ValueError("EMERGENT_LLM_KEY not found in environment variables")
+# Use Claude Sonnet 4 as specified by user
+LLM_PROVIDER = "anthropic"
+LLM_MODEL = "claude-sonnet-4-20250514"
+
+
+class CircuitOpenError(Exception):
+    """Raised when the LLM provider circuit breaker is open"""
+
+
+class EmergentTransport:
+    """Sends prompts to the LLM provider through emergentintegrations"""
+    
+    def __init__(self, api_key: str, provider: str = LLM_PROVIDER, model: str = LLM_MODEL):
+        self.api_key = api_key
+        self.provider = provider
+        self.model = model
     
-    def _create_chat_session(self, system_message: str) -> LlmChat:
-        """Create a new LLM chat session with Claude Sonnet 4"""
+    async def complete(self, system_message: str, prompt: str) -> str:
+        # Imported on use, so gateways on other transports do not need the SDK
+        from emergentintegrations.llm.chat import LlmChat, UserMessage
         chat = LlmChat(
             api_key=self.api_key,
             session_id=str(uuid.uuid4()),
             system_message=system_message
         )
-        # Use Claude Sonnet 4 as specified by user
-        chat.with_model("anthropic", "claude-sonnet-4-20250514")
-        return chat
+        chat.with_model(self.provider, self.model)
+        return await chat.send_message(UserMessage(text=prompt))
     
-    async def generate_questions(self, topic_id: str, lesson_id: str, 
-                               difficulty: int, question_type: QuestionType,
-                               count: int = 5, context: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Generate AI-powered questions for a specific topic and lesson"""
+    async def stream(self, system_message: str, prompt: str) -> AsyncIterator[str]:
+        # LlmChat only returns whole responses, so the stream is a single chunk that
+        # arrives once the completion is done; set LLM_STREAM_BASE_URL to stream
+        # through an HTTP gateway instead
+        yield await self.complete(system_message, prompt)
+
+
+class HTTPTransport:
+    """Sends prompts to an HTTP completion endpoint over a pooled keep-alive session
+    
+    Used for self-hosted gateways and local fake LLM servers. The endpoint receives
+    POST {base_url}/complete with {"model", "system_message", "prompt"} and answers
+    with {"text": "..."}.
+    """
+    
+    def __init__(self, base_url: str, api_key: Optional[str] = None,
+                 model: str = LLM_MODEL, pool_size: int = 8, timeout: float = 60.0):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount(self.base_url, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+    
+    async def complete(self, system_message: str, prompt: str) -> str:
+        return await asyncio.to_thread(self._post, system_message, prompt)
+    
+    def _post(self, system_message: str, prompt: str) -> str:
+        response = self.session.post(
+            f"{self.base_url}/complete",
+            json={"model": self.model, "system_message": system_message, "prompt": prompt},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()["text"]
+    
+    async def stream(self, system_message: str, prompt: str) -> AsyncIterator[str]:
+        """Stream text chunks from POST {base_url}/stream (a chunked text/plain body)"""
+        loop = asyncio.get_running_loop()
+        chunks: "asyncio.Queue[Any]" = asyncio.Queue()
+        done = object()
+        
+        def read_stream():
+            try:
+                with self.session.post(
+                    f"{self.base_url}/stream",
+                    json={"model": self.model, "system_message": system_message, "prompt": prompt},
+                    timeout=self.timeout,
+                    stream=True
+                ) as response:
+                    response.raise_for_status()
+                    # Without a declared charset iter_content would hand back raw bytes
+                    response.encoding = response.encoding or "utf-8"
+                    for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+                        loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+                loop.call_soon_threadsafe(chunks.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+        
+        loop.run_in_executor(None, read_stream)
+        while True:
+            chunk = await chunks.get()
+            if chunk is done:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+
+class CircuitBreaker:
+    """Stops calling the provider after repeated failures, probing again after a cool-down"""
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+    
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            # Let a single probe through; its outcome closes or re-opens the circuit
+            self._probe_in_flight = True
+            return True
+        return False
+    
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+    
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self._probe_in_flight or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+    
+    def release(self):
+        """Forget a call abandoned by its caller without recording an outcome"""
+        self._probe_in_flight = False
+
+
+class LLMGateway:
+    """Shared entry point for every LLM call made by AIService
+    
+    Bounds concurrency, applies per-attempt timeouts, retries with jittered exponential
+    backoff, trips a circuit breaker on provider errors, and coalesces identical
+    in-flight prompts into a single provider call. Streams go through
+    ``stream_transport`` when one is given.
+    """
+    
+    def __init__(self, transport, max_concurrency: int = 8, timeout: float = 60.0,
+                 max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 breaker: Optional[CircuitBreaker] = None, model_id: str = LLM_MODEL,
+                 stream_transport=None):
+        self.transport = transport
+        self.stream_transport = stream_transport or transport
+        self.model_id = model_id
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.stats = {"calls": 0, "coalesced": 0, "retries": 0, "failures": 0, "rejected": 0,
+                      "prompt_chars": 0, "completion_chars": 0}
+    
+    async def complete(self, system_message: str, prompt: str) -> str:
+        """Get a completion, joining an identical request already in flight"""
+        key = hashlib.sha256(f"{system_message}\x00{prompt}".encode("utf-8")).hexdigest()
+        
+        shared = self._in_flight.get(key)
+        if shared is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(shared)
+        
+        shared = asyncio.ensure_future(self._complete_with_retries(system_message, prompt))
+        self._in_flight[key] = shared
+        shared.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(shared)
+    
+    async def _complete_with_retries(self, system_message: str, prompt: str) -> str:
+        self.stats["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self.stats["rejected"] += 1
+                raise CircuitOpenError("LLM provider circuit is open")
+            
+            try:
+                async with self._semaphore:
+                    response = await asyncio.wait_for(
+                        self.transport.complete(system_message, prompt),
+                        timeout=self.timeout
+                    )
+                self.breaker.record_success()
+                self.stats["prompt_chars"] += len(system_message) + len(prompt)
+                self.stats["completion_chars"] += len(response)
+                return response
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception:
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    self.stats["failures"] += 1
+                    raise
+            
+            # Full jitter keeps retrying clients from synchronising
+            self.stats["retries"] += 1
+            await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+    
+    async def stream(self, system_message: str, prompt: str) -> AsyncIterator[str]:
+        """Stream a completion under the same concurrency cap and circuit breaker
+        
+        ``timeout`` bounds the wait for each chunk. Streams are not retried or coalesced,
+        since chunks may already have reached the caller.
+        """
+        if not self.breaker.allow():
+            self.stats["rejected"] += 1
+            raise CircuitOpenError("LLM provider circuit is open")
+        
+        self.stats["calls"] += 1
+        async with self._semaphore:
+            chunks = self.stream_transport.stream(system_message, prompt).__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    yield chunk
+            except Exception:
+                self.breaker.record_failure()
+                self.stats["failures"] += 1
+                raise
+            except BaseException:
+                # Client disconnected or the task was cancelled mid-stream
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "in_flight": len(self._in_flight),
+            "circuit_state": self.breaker.state
+        }
+
+
+class AIService:
+    def __init__(self, gateway: Optional[LLMGateway] = None, cache: Optional[ResponseCache] = None):
+        self.api_key = os.environ.get('EMERGENT_LLM_KEY')
+        self.gateway = gateway or self._create_gateway()
+        self.cache = cache
+    
+    def _create_gateway(self) -> LLMGateway:
+        """Build the shared gateway from environment settings"""
+        max_concurrency = int(os.environ.get('LLM_MAX_CONCURRENCY', '8'))
+        timeout = float(os.environ.get('LLM_TIMEOUT_SECONDS', '60'))
+        base_url = os.environ.get('LLM_BASE_URL')
+        stream_base_url = os.environ.get('LLM_STREAM_BASE_URL')
+        
+        if base_url:
+            transport = HTTPTransport(base_url, self.api_key, pool_size=max_concurrency, timeout=timeout)
+        elif self.api_key:
+            transport = EmergentTransport(self.api_key)
+        else:
+            raise ValueError("EMERGENT_LLM_KEY not found in environment variables")
+        
+        # The provider SDK cannot stream, so streamed questions can use an HTTP gateway
+        stream_transport = None
+        if stream_base_url:
+            stream_transport = HTTPTransport(stream_base_url, self.api_key, pool_size=max_concurrency, timeout=timeout)
+        
+        return LLMGateway(
+            transport,
+            stream_transport=stream_transport,
+            max_concurrency=max_concurrency,
+            timeout=timeout,
+            max_retries=int(os.environ.get('LLM_MAX_RETRIES', '2')),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.environ.get('LLM_BREAKER_THRESHOLD', '5')),
+                reset_timeout=float(os.environ.get('LLM_BREAKER_RESET_SECONDS', '30'))
+            )
+        )
+    
+    async def _complete(self, system_message: str, user_prompt: str, cacheable: bool = False,
+                        validate: Callable[[str], Any] = json.loads) -> str:
+        """Send a prompt through the gateway, serving repeatable prompts from the response cache"""
+        if not cacheable or self.cache is None:
+            return await self.gateway.complete(system_message, user_prompt)
+        
+        key = ResponseCache.make_key(self.gateway.model_id, system_message, user_prompt)
+        return await self.cache.get_or_fetch(
+            key,
+            lambda: self.gateway.complete(system_message, user_prompt),
+            model_id=self.gateway.model_id,
+            validate=validate
+        )
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "gateway": self.gateway.get_stats(),
+            "cache": self.cache.get_stats() if self.cache else None
+        }
+    
+    def _question_prompts(self, topic_id: str, difficulty: int, question_type: QuestionType,
+                          count: int, context: Optional[str]) -> Tuple[str, str]:
+        """Build the system message and user prompt for question generation"""
         
         system_message = """You are an expert financial education content creator. Your task is to generate high-quality, educational questions that help users learn personal finance concepts effectively.
 
@@ -81,45 +376,82 @@ For each question, provide:
 Return as JSON array of question objects.
 """
         
+        return system_message, user_prompt
+    
+    def _enhance_question(self, q: Dict[str, Any], topic_id: str, lesson_id: str, difficulty: int,
+                          question_type: QuestionType, context: Optional[str]) -> Dict[str, Any]:
+        """Normalize one generated question into the Question document shape"""
+        return {
+            # Content-derived ID so a cached response maps to the same stored questions
+            "id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{topic_id}/{lesson_id}/{q.get('question', '')}")),
+            "lesson_id": lesson_id,
+            "topic_id": topic_id,
+            "question": q.get("question", ""),
+            "type": question_type.value,
+            "options": q.get("options", []) if question_type == QuestionType.MULTIPLE_CHOICE else None,
+            "correct_answer": q.get("correct_answer", ""),
+            "explanation": q.get("explanation", ""),
+            "difficulty": difficulty,
+            "xp_reward": difficulty * 5,  # More XP for harder questions
+            "hints": q.get("hints", []),
+            "tags": q.get("tags", []),
+            "is_ai_generated": True,
+            "scenario_context": context
+        }
+    
+    async def generate_questions(self, topic_id: str, lesson_id: str, 
+                               difficulty: int, question_type: QuestionType,
+                               count: int = 5, context: Optional[str] = None,
+                               use_cache: bool = True) -> List[Dict[str, Any]]:
+        """Generate AI-powered questions for a specific topic and lesson"""
+        
+        system_message, user_prompt = self._question_prompts(topic_id, difficulty, question_type, count, context)
+        
         try:
-            chat = self._create_chat_session(system_message)
-            user_message = UserMessage(text=user_prompt)
-            response = await chat.send_message(user_message)
+            response = await self._complete(system_message, user_prompt, cacheable=use_cache,
+                                            validate=parse_json_array)
             
-            # Parse the JSON response
-            questions = json.loads(response)
+            # Parse the JSON response, keeping the valid questions of malformed output
+            questions = parse_json_array(response)
             
-            # Validate and enhance questions
-            enhanced_questions = []
-            for q in questions:
-                enhanced_q = {
-                    "id": str(uuid.uuid4()),
-                    "lesson_id": lesson_id,
-                    "topic_id": topic_id,
-                    "question": q.get("question", ""),
-                    "type": question_type.value,
-                    "options": q.get("options", []) if question_type == QuestionType.MULTIPLE_CHOICE else None,
-                    "correct_answer": q.get("correct_answer", ""),
-                    "explanation": q.get("explanation", ""),
-                    "difficulty": difficulty,
-                    "xp_reward": difficulty * 5,  # More XP for harder questions
-                    "hints": q.get("hints", []),
-                    "tags": q.get("tags", []),
-                    "is_ai_generated": True,
-                    "scenario_context": context
-                }
-                enhanced_questions.append(enhanced_q)
-            
-            return enhanced_questions
+            return [
+                self._enhance_question(q, topic_id, lesson_id, difficulty, question_type, context)
+                for q in questions if isinstance(q, dict)
+            ]
             
         except Exception as e:
             print(f"Error generating questions: {e}")
             return []
     
+    async def stream_questions(self, topic_id: str, lesson_id: str,
+                               difficulty: int, question_type: QuestionType,
+                               count: int = 5, context: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream generated questions, yielding each one as soon as the LLM finishes it"""
+        
+        system_message, user_prompt = self._question_prompts(topic_id, difficulty, question_type, count, context)
+        parser = JSONArrayStreamParser()
+        
+        async for chunk in self.gateway.stream(system_message, user_prompt):
+            for q in parser.feed(chunk):
+                if isinstance(q, dict):
+                    yield self._enhance_question(q, topic_id, lesson_id, difficulty, question_type, context)
+        
+        for q in parser.close():
+            if isinstance(q, dict):
+                yield self._enhance_question(q, topic_id, lesson_id, difficulty, question_type, context)
+        
+        if parser.errors:
+            print(f"Skipped {parser.errors} malformed questions in streamed response")
+    
     async def generate_personalized_recommendations(self, user_id: str, 
                                                  user_progress: Dict[str, Any],
-                                                 learning_history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Generate personalized learning recommendations based on user progress"""
+                                                 learning_history: List[Dict[str, Any]],
+                                                 candidates: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """Generate personalized learning recommendations based on user progress
+        
+        When ``candidates`` from the local recommender are given, the LLM re-ranks and
+        explains them rather than starting from scratch.
+        """
         
         system_message = """You are an AI learning coach specializing in personalized financial education. Analyze user progress and learning patterns to provide tailored recommendations that optimize their learning journey.
 
@@ -132,13 +464,24 @@ Consider:
 
 Provide actionable, personalized recommendations."""
 
+        candidate_section = ""
+        if candidates:
+            shortlist = [
+                {"type": c["type"], "content_id": c["content_id"], "title": c.get("title", ""), "reason": c["reason"]}
+                for c in candidates
+            ]
+            candidate_section = f"""Candidate recommendations from our curriculum engine (re-rank these, improve their reasons, and add others only if clearly better):
+{json.dumps(shortlist)}
+
+"""
+        
         user_prompt = f"""
 Analyze this user's learning data and provide personalized recommendations:
 
-User Progress: {json.dumps(user_progress)}
-Learning History: {json.dumps(learning_history[-10:])}  # Last 10 activities
+User Progress: {json.dumps(user_progress, default=str)}
+Learning History: {json.dumps(learning_history[-10:], default=str)}  # Last 10 activities
 
-Provide 5-8 recommendations in the following categories:
+{candidate_section}Provide 5-8 recommendations in the following categories:
 1. Next lessons to focus on
 2. Topics to review
 3. Practice exercises
@@ -157,15 +500,15 @@ Return as JSON array.
 """
         
         try:
-            chat = self._create_chat_session(system_message)
-            user_message = UserMessage(text=user_prompt)
-            response = await chat.send_message(user_message)
+            response = await self._complete(system_message, user_prompt)
             
-            recommendations = json.loads(response)
+            recommendations = parse_json_array(response)
             
             # Enhance recommendations with IDs
             enhanced_recommendations = []
             for rec in recommendations:
+                if not isinstance(rec, dict):
+                    continue
                 enhanced_rec = {
                     "id": str(uuid.uuid4()),
                     "user_id": user_id,
@@ -189,8 +532,20 @@ Return as JSON array.
     async def generate_learning_path(self, user_id: str, 
                                    goals: List[str], 
                                    current_level: int,
-                                   available_time: int) -> Dict[str, Any]:
-        """Generate a personalized learning path"""
+                                   available_time: int,
+                                   lessons: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Generate a personalized learning path
+        
+        ``lessons`` are the curriculum lessons the path may use; the model must name each
+        recommended lesson by its ``lesson_id`` so the path's progress can be tracked.
+        """
+        
+        lesson_section = ""
+        if lessons:
+            lesson_section = f"""
+Available lessons, in prerequisite order (recommend only these, by lesson_id):
+{json.dumps(lessons)}
+"""
         
         system_message = """You are an expert curriculum designer for financial education. Create personalized learning paths that efficiently guide users toward their financial literacy goals while respecting their time constraints and current knowledge level."""
 
@@ -200,7 +555,7 @@ Create a personalized learning path for:
 Goals: {goals}
 Current Level: {current_level}/5
 Available Time: {available_time} minutes per day
-
+{lesson_section}
 Design a learning path that includes:
 1. Recommended sequence of topics and lessons
 2. Estimated timeline for completion
@@ -212,7 +567,7 @@ Provide the path structure with:
 - name: descriptive path name
 - description: overview of the path
 - estimated_completion: days to complete
-- recommended_lessons: array of lesson objects with order, priority, and rationale
+- recommended_lessons: array of lesson objects with lesson_id (from the available lessons), title, order, priority, and rationale
 - milestones: key checkpoints with goals
 - difficulty_adjustment: factor for personalizing question difficulty
 
@@ -220,9 +575,7 @@ Return as JSON object.
 """
         
         try:
-            chat = self._create_chat_session(system_message)
-            user_message = UserMessage(text=user_prompt)
-            response = await chat.send_message(user_message)
+            response = await self._complete(system_message, user_prompt, cacheable=True)
             
             learning_path = json.loads(response)
             
@@ -261,9 +614,7 @@ Return detailed analysis as JSON object with specific recommendations.
 """
         
         try:
-            chat = self._create_chat_session(system_message)
-            user_message = UserMessage(text=user_prompt)
-            response = await chat.send_message(user_message)
+            response = await self._complete(system_message, user_prompt)
             
             analysis = json.loads(response)
             return analysis
@@ -294,11 +645,10 @@ Return as JSON array of practice questions.
 """
         
         try:
-            chat = self._create_chat_session(system_message)
-            user_message = UserMessage(text=user_prompt)
-            response = await chat.send_message(user_message)
+            response = await self._complete(system_message, user_prompt, cacheable=True,
+                                            validate=parse_json_array)
             
-            content = json.loads(response)
+            content = [item for item in parse_json_array(response) if isinstance(item, dict)]
             
             # Add metadata to each item
             for item in content:
@@ -0,0 +1,361 @@
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import datetime, date, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+import asyncio
+import hashlib
+import logging
+import math
+import uuid
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ALL = "_all"
+NO_TOPIC = "_none"
+CHECKPOINT_ID = "user_activities"
+
+# HyperLogLog with 2^10 registers: about 3% standard error on distinct counts
+HLL_PRECISION = 10
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_ALPHA = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+
+# Fixed-bin histograms act as mergeable quantile sketches
+SCORE_BIN_WIDTH = 5
+SCORE_BINS = 100 // SCORE_BIN_WIDTH + 1
+TIME_BINS = 25  # log2 buckets of seconds
+XP_BINS = 16  # log2 buckets of XP
+
+# Batch IDs kept on each cube cell; only the batch being folded can be replayed
+BATCH_MARKERS = 20
+
+
+def hll_register(user_id: str) -> Tuple[int, int]:
+    """Register index and rank (position of the first set bit) for one value"""
+    h = int.from_bytes(hashlib.blake2b(user_id.encode(), digest_size=8).digest(), "big")
+    index = h >> (64 - HLL_PRECISION)
+    rest = h & ((1 << (64 - HLL_PRECISION)) - 1)
+    return index, (64 - HLL_PRECISION) - rest.bit_length() + 1
+
+
+def hll_estimate(registers: np.ndarray) -> int:
+    estimate = HLL_ALPHA * HLL_REGISTERS ** 2 / np.sum(np.power(2.0, -registers))
+    empty = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * HLL_REGISTERS and empty:
+        # Linear counting is more accurate for small cardinalities
+        estimate = HLL_REGISTERS * math.log(HLL_REGISTERS / empty)
+    return int(round(estimate))
+
+
+def histogram_quantile(counts: np.ndarray, q: float, edges: np.ndarray) -> Optional[float]:
+    """Quantile from bin counts, interpolating linearly inside the bin"""
+    total = counts.sum()
+    if total == 0:
+        return None
+    cumulative = np.cumsum(counts)
+    target = q * total
+    i = int(np.searchsorted(cumulative, target))
+    before = cumulative[i - 1] if i > 0 else 0
+    fraction = (target - before) / counts[i] if counts[i] else 0.0
+    return round(float(edges[i] + fraction * (edges[i + 1] - edges[i])), 1)
+
+
+def log2_edges(bins: int) -> np.ndarray:
+    """Edges of ``bins`` log2 buckets: [0, 1), [1, 3), [3, 7), ..."""
+    return np.append(0.0, np.power(2.0, np.arange(1, bins + 1)) - 1)
+
+
+def log2_histogram(rows: np.ndarray, values: np.ndarray, n_cells: int, bins: int) -> np.ndarray:
+    """Per-cell counts of non-negative ``values`` in log2 buckets; negative values are missing"""
+    present = values >= 0
+    value_bins = np.minimum(np.floor(np.log2(np.maximum(values, 0) + 1)), bins - 1).astype(np.int64)
+    hist = np.zeros((n_cells, bins), dtype=np.int64)
+    np.add.at(hist, (rows[present], value_bins[present]), 1)
+    return hist
+
+
+SCORE_EDGES = np.append(np.arange(SCORE_BINS) * SCORE_BIN_WIDTH, 100 + SCORE_BIN_WIDTH).astype(np.float64)
+TIME_EDGES = log2_edges(TIME_BINS)
+XP_EDGES = log2_edges(XP_BINS)
+
+
+class AnalyticsRollup:
+    """Incremental daily cubes over ``user_activities`` for admin analytics
+
+    Each run reads only activities after the checkpoint and folds them into
+    ``analytics_daily`` documents keyed by (date, topic_id, activity_type): counts
+    and XP via ``$inc``, score, time and XP histograms via ``$inc`` on bins, and
+    HyperLogLog registers for distinct users via ``$max``. Every activity also
+    lands in the day's (``_all``, ``_all``) cell, so DAU is a single document read.
+    Activities younger than ``settle_seconds`` are left for the next run, so writes
+    that commit slightly out of timestamp order are not skipped by the checkpoint.
+
+    Every worker runs the rollup, so each batch is first claimed on the checkpoint
+    document with a compare-and-set that records its range under a lease. The fold
+    tags each cell with the batch ID and skips cells that already carry it, so a
+    batch taken over after its lease expired (its worker died mid-fold) is not
+    counted twice.
+    """
+
+    def __init__(self, db, curriculum, batch_size: int = 5000, interval: int = 300,
+                 settle_seconds: float = 10.0, lease_seconds: float = 120.0):
+        self.activities_collection = db.user_activities
+        self.cubes_collection = db.analytics_daily
+        self.state_collection = db.analytics_rollup_state
+        self.curriculum = curriculum
+        self.batch_size = batch_size
+        self.interval = interval
+        self.settle_seconds = settle_seconds
+        self.lease_seconds = lease_seconds
+        self.owner = str(uuid.uuid4())
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    async def ensure_indexes(self):
+        """Create indexes backing the delta scan and cube queries"""
+        await self.activities_collection.create_index([("created_at", 1), ("id", 1)])
+        await self.cubes_collection.create_index(
+            [("date", 1), ("topic_id", 1), ("activity_type", 1)], unique=True
+        )
+
+    async def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run()
+            except Exception as e:
+                logger.error(f"Analytics rollup failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run(self) -> Dict[str, int]:
+        """Fold activities recorded since the last run into the daily cubes
+
+        Stops early when another worker holds the lease on the next batch.
+        """
+        async with self._lock:
+            stats = {"activities": 0, "cells_updated": 0}
+            settled_before = datetime.utcnow() - timedelta(seconds=self.settle_seconds)
+
+            while True:
+                state = await self.state_collection.find_one({"_id": CHECKPOINT_ID}) or {}
+                pending = state.get("pending")
+                if pending and pending["expires_at"] > datetime.utcnow():
+                    break
+                if pending:
+                    # Take over a batch whose worker died: same range, same batch ID
+                    batch = await self._read_batch(state, until=(pending["created_at"], pending["id"]))
+                    batch_id = pending["batch_id"]
+                else:
+                    batch = await self._read_batch(state, settled_before=settled_before)
+                    if not batch:
+                        break
+                    pending = {"created_at": batch[-1]["created_at"], "id": batch[-1]["id"]}
+                    batch_id = str(uuid.uuid4())
+                if not await self._claim(state, pending, batch_id):
+                    break
+
+                if batch:
+                    stats["cells_updated"] += await self._fold(batch, batch_id)
+                    stats["activities"] += len(batch)
+                await self.state_collection.update_one(
+                    {"_id": CHECKPOINT_ID, "pending.batch_id": batch_id},
+                    {
+                        "$set": {"created_at": pending["created_at"], "id": pending["id"],
+                                 "updated_at": datetime.utcnow()},
+                        "$unset": {"pending": ""}
+                    }
+                )
+            return stats
+
+    async def _read_batch(self, state: Dict[str, Any], settled_before: Optional[datetime] = None,
+                          until: Optional[Tuple[datetime, str]] = None) -> List[Dict[str, Any]]:
+        """Activities after the checkpoint, up to ``settled_before`` or through the ``until`` key"""
+        conditions: List[Dict[str, Any]] = []
+        if state.get("created_at") is not None:
+            conditions.append({"$or": [
+                {"created_at": {"$gt": state["created_at"]}},
+                {"created_at": state["created_at"], "id": {"$gt": state["id"]}}
+            ]})
+        if until is not None:
+            conditions.append({"$or": [
+                {"created_at": {"$lt": until[0]}},
+                {"created_at": until[0], "id": {"$lte": until[1]}}
+            ]})
+        else:
+            conditions.append({"created_at": {"$lte": settled_before}})
+        cursor = self.activities_collection.find(
+            {"$and": conditions},
+            {"_id": 0, "id": 1, "user_id": 1, "activity_type": 1, "content_id": 1,
+             "xp_earned": 1, "metadata.score": 1, "metadata.time_spent": 1, "created_at": 1}
+        ).sort([("created_at", 1), ("id", 1)])
+        if until is None:
+            cursor = cursor.limit(self.batch_size)
+        return await cursor.to_list(None)
+
+    async def _claim(self, state: Dict[str, Any], pending: Dict[str, Any], batch_id: str) -> bool:
+        """Lease the batch ending at ``pending`` to this worker; False if the checkpoint moved first"""
+        expected = {"_id": CHECKPOINT_ID, "created_at": state.get("created_at"), "id": state.get("id")}
+        if state.get("pending"):
+            expected["pending.batch_id"] = state["pending"]["batch_id"]
+            expected["pending.expires_at"] = state["pending"]["expires_at"]
+        else:
+            expected["pending"] = None
+        try:
+            claimed = await self.state_collection.find_one_and_update(
+                expected,
+                {"$set": {"pending": {
+                    "batch_id": batch_id,
+                    "created_at": pending["created_at"],
+                    "id": pending["id"],
+                    "owner": self.owner,
+                    "expires_at": datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+                }}},
+                projection={"_id": 1},
+                upsert=not state
+            )
+        except DuplicateKeyError:
+            # Another worker created the checkpoint first
+            return False
+        return claimed is not None or not state
+
+    async def _fold(self, activities: List[Dict[str, Any]], batch_id: str) -> int:
+        """Add one batch to its cube cells; cells already tagged with ``batch_id`` are left alone"""
+        lesson_topics = self.curriculum.snapshot.lesson_topic_ids
+        cells: Dict[Tuple[str, str, str], int] = {}
+        rows, xp, scores, times, registers, ranks = [], [], [], [], [], []
+
+        for activity in activities:
+            day = activity["created_at"].date().isoformat()
+            topic_id = lesson_topics.get(activity.get("content_id")) or NO_TOPIC
+            register, rank = hll_register(activity["user_id"])
+            metadata = activity.get("metadata") or {}
+            for key in ((day, topic_id, activity["activity_type"]), (day, ALL, ALL)):
+                rows.append(cells.setdefault(key, len(cells)))
+                xp.append(activity.get("xp_earned", 0))
+                scores.append(metadata.get("score", -1) if metadata.get("score") is not None else -1)
+                times.append(metadata.get("time_spent", -1) if metadata.get("time_spent") is not None else -1)
+                registers.append(register)
+                ranks.append(rank)
+
+        n_cells = len(cells)
+        rows = np.array(rows)
+        scores = np.array(scores, dtype=np.float64)
+        times = np.array(times, dtype=np.float64)
+        counts = np.bincount(rows, minlength=n_cells)
+        xp_sums = np.bincount(rows, weights=np.array(xp, dtype=np.float64), minlength=n_cells)
+
+        has_score = scores >= 0
+        score_bins = np.minimum(np.clip(scores, 0, 100) // SCORE_BIN_WIDTH, SCORE_BINS - 1).astype(np.int64)
+        score_hist = np.zeros((n_cells, SCORE_BINS), dtype=np.int64)
+        np.add.at(score_hist, (rows[has_score], score_bins[has_score]), 1)
+
+        time_hist = log2_histogram(rows, times, n_cells, TIME_BINS)
+        xp_hist = log2_histogram(rows, np.array(xp, dtype=np.float64), n_cells, XP_BINS)
+
+        hll = np.zeros((n_cells, HLL_REGISTERS), dtype=np.int64)
+        np.maximum.at(hll, (rows, np.array(registers)), np.array(ranks))
+
+        operations = []
+        for (day, topic_id, activity_type), i in cells.items():
+            increments = {"count": int(counts[i]), "xp": int(xp_sums[i])}
+            increments.update({f"score_hist.{b}": int(score_hist[i, b]) for b in np.flatnonzero(score_hist[i])})
+            increments.update({f"time_hist.{b}": int(time_hist[i, b]) for b in np.flatnonzero(time_hist[i])})
+            increments.update({f"xp_hist.{b}": int(xp_hist[i, b]) for b in np.flatnonzero(xp_hist[i])})
+            operations.append(UpdateOne(
+                {"date": day, "topic_id": topic_id, "activity_type": activity_type, "batches": {"$ne": batch_id}},
+                {
+                    "$inc": increments,
+                    "$max": {f"hll.{r}": int(hll[i, r]) for r in np.flatnonzero(hll[i])},
+                    "$push": {"batches": {"$each": [batch_id], "$slice": -BATCH_MARKERS}}
+                },
+                upsert=True
+            ))
+        try:
+            await self.cubes_collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # A cell that already has the batch does not match, and its upsert hits the unique index
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            return len(operations) - len(errors)
+        return len(operations)
+
+    async def query(self, start: date, end: date, topic_id: Optional[str] = None,
+                    activity_type: Optional[str] = None) -> Dict[str, Any]:
+        """Per-day and whole-range metrics from the cubes
+
+        Without filters the day totals are used; a filter sums over matching cells,
+        merging their HyperLogLog registers for distinct users.
+        """
+        filter_query: Dict[str, Any] = {"date": {"$gte": start.isoformat(), "$lte": end.isoformat()}}
+        if topic_id is None and activity_type is None:
+            filter_query.update({"topic_id": ALL, "activity_type": ALL})
+        else:
+            filter_query["topic_id"] = topic_id if topic_id is not None else {"$ne": ALL}
+            if activity_type is not None:
+                filter_query["activity_type"] = activity_type
+
+        cells = await self.cubes_collection.find(filter_query, {"_id": 0, "batches": 0}).to_list(None)
+
+        days: Dict[str, Dict[str, Any]] = {}
+        for cell in cells:
+            day = days.setdefault(cell["date"], self._empty_metrics())
+            self._merge(day, cell)
+
+        total = self._empty_metrics()
+        for day in days.values():
+            for key in ("count", "xp"):
+                total[key] += day[key]
+            total["score_hist"] += day["score_hist"]
+            total["time_hist"] += day["time_hist"]
+            total["xp_hist"] += day["xp_hist"]
+            np.maximum(total["hll"], day["hll"], out=total["hll"])
+
+        return {
+            "days": [{"date": d, **self._summarize(days[d])} for d in sorted(days)],
+            "total": self._summarize(total)
+        }
+
+    @staticmethod
+    def _empty_metrics() -> Dict[str, Any]:
+        return {
+            "count": 0, "xp": 0,
+            "score_hist": np.zeros(SCORE_BINS, dtype=np.int64),
+            "time_hist": np.zeros(TIME_BINS, dtype=np.int64),
+            "xp_hist": np.zeros(XP_BINS, dtype=np.int64),
+            "hll": np.zeros(HLL_REGISTERS, dtype=np.int64)
+        }
+
+    @staticmethod
+    def _merge(metrics: Dict[str, Any], cell: Dict[str, Any]):
+        metrics["count"] += cell.get("count", 0)
+        metrics["xp"] += cell.get("xp", 0)
+        for b, n in cell.get("score_hist", {}).items():
+            metrics["score_hist"][int(b)] += n
+        for b, n in cell.get("time_hist", {}).items():
+            metrics["time_hist"][int(b)] += n
+        for b, n in cell.get("xp_hist", {}).items():
+            metrics["xp_hist"][int(b)] += n
+        for r, rank in cell.get("hll", {}).items():
+            metrics["hll"][int(r)] = max(metrics["hll"][int(r)], rank)
+
+    @staticmethod
+    def _summarize(metrics: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "count": metrics["count"],
+            "xp": metrics["xp"],
+            "distinct_users": hll_estimate(metrics["hll"]),
+            "score_median": histogram_quantile(metrics["score_hist"], 0.5, SCORE_EDGES),
+            "score_p90": histogram_quantile(metrics["score_hist"], 0.9, SCORE_EDGES),
+            "time_spent_median": histogram_quantile(metrics["time_hist"], 0.5, TIME_EDGES),
+            "time_spent_p90": histogram_quantile(metrics["time_hist"], 0.9, TIME_EDGES),
+            "xp_median": histogram_quantile(metrics["xp_hist"], 0.5, XP_EDGES),
+            "xp_p90": histogram_quantile(metrics["xp_hist"], 0.9, XP_EDGES)
+        }
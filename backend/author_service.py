@@ -0,0 +1,175 @@
+from typing import Dict, Any, Optional
+from datetime import datetime, timedelta
+from collections import OrderedDict
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Profile fields copied onto every post an author writes
+IDENTITY_FIELDS = ("username", "display_name", "avatar_url")
+
+
+class AuthorSnapshotService:
+    """Service for caching author identity and keeping copies embedded in community posts fresh
+
+    Snapshots are cached per worker for ``max_age`` seconds, so a profile change made
+    through another worker can still be embedded in posts written during that window.
+    Fan-out ends by rewriting the posts created since the change once every worker's
+    cached copy has expired.
+    """
+
+    def __init__(self, db, cache_size: int = 10000, batch_size: int = 500, max_age: float = 30.0):
+        self.db = db
+        self.user_profiles_collection = db.user_profiles
+        self.fanout_jobs_collection = db.author_fanout_jobs
+        # Collections holding posts with embedded author fields
+        self.post_collections = [db.discussions, db.discussion_replies]
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.max_age = max_age
+        # user_id -> (monotonic time cached, snapshot)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._fanout_tasks: Dict[str, asyncio.Task] = {}
+
+    async def ensure_indexes(self):
+        """Create indexes backing fan-out scans"""
+        for collection in self.post_collections:
+            await collection.create_index([("author_id", 1), ("_id", 1)])
+        await self.fanout_jobs_collection.create_index("user_id", unique=True)
+
+    async def get_snapshot(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get an author's identity fields, reading the profile only on a cache miss"""
+        cached = self._cache.get(user_id)
+        if cached is not None and time.monotonic() - cached[0] < self.max_age:
+            self._cache.move_to_end(user_id)
+            return cached[1]
+
+        profile = await self.user_profiles_collection.find_one(
+            {"id": user_id},
+            {field: 1 for field in IDENTITY_FIELDS}
+        )
+        if not profile:
+            return None
+
+        snapshot = self._remember(user_id, profile)
+        return snapshot
+
+    def embed(self, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """Map a snapshot to the author fields stored on posts"""
+        return {f"author_{field}": snapshot.get(field) for field in IDENTITY_FIELDS}
+
+    def invalidate(self, user_id: str):
+        """Drop a cached snapshot"""
+        self._cache.pop(user_id, None)
+
+    async def schedule_fanout(self, user_id: str, profile: Dict[str, Any]):
+        """Refresh the cache and start rewriting the author's posts in the background
+
+        A newer profile change restarts any fan-out already running for the same user.
+        """
+        snapshot = self._remember(user_id, profile)
+
+        await self.fanout_jobs_collection.update_one(
+            {"user_id": user_id},
+            {
+                "$set": {
+                    "snapshot": snapshot,
+                    "checkpoints": {},
+                    "status": "running",
+                    "started_at": datetime.utcnow(),
+                    "updated_at": datetime.utcnow()
+                },
+                "$setOnInsert": {"created_at": datetime.utcnow()}
+            },
+            upsert=True
+        )
+
+        self._start_fanout(user_id)
+
+    async def resume_pending_jobs(self):
+        """Restart fan-out jobs interrupted by a shutdown from their checkpoints"""
+        jobs = await self.fanout_jobs_collection.find(
+            {"status": "running"}, {"user_id": 1}
+        ).to_list(None)
+        for job in jobs:
+            self._start_fanout(job["user_id"])
+
+    def _remember(self, user_id: str, profile: Dict[str, Any]) -> Dict[str, Any]:
+        snapshot = {field: profile.get(field) for field in IDENTITY_FIELDS}
+        self._cache[user_id] = (time.monotonic(), snapshot)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return snapshot
+
+    def _start_fanout(self, user_id: str):
+        running = self._fanout_tasks.get(user_id)
+        if running and not running.done():
+            running.cancel()
+        self._fanout_tasks[user_id] = asyncio.create_task(self._run_fanout(user_id))
+
+    async def _run_fanout(self, user_id: str):
+        """Rewrite embedded author fields batch by batch, checkpointing after each batch"""
+        try:
+            job = await self.fanout_jobs_collection.find_one({"user_id": user_id})
+            if not job or job.get("status") != "running":
+                return
+
+            author_fields = self.embed(job["snapshot"])
+            checkpoints = job.get("checkpoints", {})
+
+            for collection in self.post_collections:
+                last_id = checkpoints.get(collection.name)
+                while True:
+                    batch_query = {"author_id": user_id}
+                    if last_id is not None:
+                        batch_query["_id"] = {"$gt": last_id}
+
+                    batch = await collection.find(batch_query, {"_id": 1})\
+                        .sort("_id", 1)\
+                        .limit(self.batch_size)\
+                        .to_list(None)
+                    if not batch:
+                        break
+
+                    ids = [doc["_id"] for doc in batch]
+                    await collection.update_many({"_id": {"$in": ids}}, {"$set": author_fields})
+
+                    last_id = ids[-1]
+                    await self.fanout_jobs_collection.update_one(
+                        {"user_id": user_id},
+                        {"$set": {f"checkpoints.{collection.name}": last_id, "updated_at": datetime.utcnow()}}
+                    )
+                    # Yield to request handlers between batches
+                    await asyncio.sleep(0)
+
+            await self._settle(user_id, job, author_fields)
+
+            await self.fanout_jobs_collection.update_one(
+                {"user_id": user_id},
+                {"$set": {"status": "completed", "updated_at": datetime.utcnow()}}
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Job stays "running" and resumes from its checkpoint on the next startup
+            logger.error(f"Author fan-out failed for {user_id}: {e}")
+        finally:
+            if self._fanout_tasks.get(user_id) is asyncio.current_task():
+                del self._fanout_tasks[user_id]
+
+    async def _settle(self, user_id: str, job: Dict[str, Any], author_fields: Dict[str, Any]):
+        """Rewrite posts other workers wrote from a cached snapshot after the batches passed them"""
+        started_at = job.get("started_at")
+        if started_at is None:
+            return
+        delay = (started_at + timedelta(seconds=self.max_age) - datetime.utcnow()).total_seconds()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        for collection in self.post_collections:
+            await collection.update_many(
+                {"author_id": user_id, "created_at": {"$gte": started_at}},
+                {"$set": author_fields}
+            )
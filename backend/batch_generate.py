@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Offline batch generation of AI questions across the curriculum
+
+The manifest is a JSON file describing the cells to fill:
+
+    {
+        "topics": [{"topic_id": "basics", "lessons": ["basics_lesson_1", "basics_lesson_2"]}],
+        "difficulties": [1, 2, 3],
+        "question_types": ["multiple-choice", "true-false"],
+        "questions_per_cell": 5
+    }
+
+Every topic x lesson x difficulty x question type cell is generated once. Completed
+cells are appended to a checkpoint file, so a rerun after a crash resumes where it
+stopped. Set --llm-base-url to run against a local (fake) LLM server.
+"""
+
+from typing import Dict, List, Any, Optional, Set
+from datetime import datetime
+from pathlib import Path
+import asyncio
+import json
+import os
+import time
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+
+from models import Question, QuestionType
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+app = typer.Typer(help="Generate AI questions for a whole curriculum manifest")
+
+
+def expand_manifest(manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Expand a manifest into its generation cells"""
+    cells = []
+    for topic in manifest["topics"]:
+        for lesson_id in topic.get("lessons", ["general"]):
+            for difficulty in manifest.get("difficulties", [1]):
+                for question_type in manifest.get("question_types", [QuestionType.MULTIPLE_CHOICE.value]):
+                    cells.append({
+                        "key": f"{topic['topic_id']}|{lesson_id}|{difficulty}|{question_type}",
+                        "topic_id": topic["topic_id"],
+                        "lesson_id": lesson_id,
+                        "difficulty": int(difficulty),
+                        "question_type": QuestionType(question_type),
+                        "count": topic.get("questions_per_cell", manifest.get("questions_per_cell", 5))
+                    })
+    return cells
+
+
+def load_checkpoint(checkpoint: Path) -> Set[str]:
+    """Keys of cells completed by earlier runs"""
+    if not checkpoint.exists():
+        return set()
+    completed = set()
+    with checkpoint.open() as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                completed.add(json.loads(line)["cell"])
+    return completed
+
+
+class BatchRunner:
+    """Fans manifest cells out over a bounded pool of workers"""
+
+    def __init__(self, ai_service, questions_collection, deduplicator, checkpoint: Path, concurrency: int):
+        self.ai_service = ai_service
+        self.questions_collection = questions_collection
+        self.deduplicator = deduplicator
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.stats = {"cells_done": 0, "cells_failed": 0, "questions_generated": 0, "questions_inserted": 0}
+
+    async def run(self, cells: List[Dict[str, Any]]):
+        queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        for cell in cells:
+            queue.put_nowait(cell)
+
+        with self.checkpoint.open("a") as checkpoint_file:
+            workers = [
+                asyncio.create_task(self._worker(queue, checkpoint_file))
+                for _ in range(min(self.concurrency, len(cells)) or 1)
+            ]
+            await queue.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _worker(self, queue, checkpoint_file):
+        while True:
+            cell = await queue.get()
+            try:
+                inserted = await self._generate_cell(cell)
+                # Only successful cells are checkpointed; failed ones are retried on the next run
+                checkpoint_file.write(json.dumps({
+                    "cell": cell["key"],
+                    "questions": inserted,
+                    "completed_at": datetime.utcnow().isoformat()
+                }) + "\n")
+                checkpoint_file.flush()
+                self.stats["cells_done"] += 1
+            except Exception as e:
+                self.stats["cells_failed"] += 1
+                typer.echo(f"Cell {cell['key']} failed: {e}", err=True)
+            finally:
+                queue.task_done()
+
+    async def _generate_cell(self, cell: Dict[str, Any]) -> int:
+        questions = await self.ai_service.generate_questions(
+            topic_id=cell["topic_id"],
+            lesson_id=cell["lesson_id"],
+            difficulty=cell["difficulty"],
+            question_type=cell["question_type"],
+            count=cell["count"],
+            use_cache=False
+        )
+        if not questions:
+            raise RuntimeError("LLM returned no usable questions")
+        self.stats["questions_generated"] += len(questions)
+
+        unique = await self.deduplicator.filter_duplicates(questions)
+        if not unique:
+            return 0
+
+        documents = [
+            {**Question(**q).dict(), "minhash": q["minhash"], "lsh_bands": q["lsh_bands"]}
+            for q in unique
+        ]
+        try:
+            result = await self.questions_collection.insert_many(documents, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            inserted = e.details.get("nInserted", 0)
+        self.stats["questions_inserted"] += inserted
+        return inserted
+
+
+@app.command()
+def generate(
+    manifest: Path = typer.Argument(..., exists=True, help="Curriculum manifest JSON file"),
+    checkpoint: Path = typer.Option(Path("batch_checkpoint.jsonl"), help="Checkpoint file of completed cells"),
+    concurrency: int = typer.Option(4, min=1, help="Maximum cells generated at once"),
+    llm_base_url: Optional[str] = typer.Option(None, help="HTTP completion endpoint, e.g. a local fake LLM"),
+    input_cost_per_mtok: float = typer.Option(3.0, help="USD per million prompt tokens"),
+    output_cost_per_mtok: float = typer.Option(15.0, help="USD per million completion tokens"),
+):
+    """Generate questions for every cell in MANIFEST that is not yet checkpointed"""
+    if llm_base_url:
+        os.environ['LLM_BASE_URL'] = llm_base_url
+    os.environ.setdefault('LLM_MAX_CONCURRENCY', str(concurrency))
+
+    # Imported after the environment is set so the gateway picks up the transport settings
+    from ai_service import AIService
+    from question_dedup import QuestionDeduplicator
+
+    cells = expand_manifest(json.loads(manifest.read_text()))
+    completed = load_checkpoint(checkpoint)
+    pending = [cell for cell in cells if cell["key"] not in completed]
+    typer.echo(f"{len(cells)} cells in manifest, {len(completed)} already done, {len(pending)} to generate")
+    if not pending:
+        return
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        questions_collection = client[os.environ['DB_NAME']].questions
+        ai_service = AIService()
+        deduplicator = QuestionDeduplicator(questions_collection)
+        await deduplicator.ensure_indexes()
+
+        runner = BatchRunner(ai_service, questions_collection, deduplicator, checkpoint, concurrency)
+        started = time.monotonic()
+        try:
+            await runner.run(pending)
+        finally:
+            client.close()
+        return runner.stats, ai_service.gateway.get_stats(), time.monotonic() - started
+
+    stats, gateway_stats, elapsed = asyncio.run(main())
+
+    # Roughly four characters per token for English prompts and JSON output
+    prompt_tokens = gateway_stats["prompt_chars"] / 4
+    completion_tokens = gateway_stats["completion_chars"] / 4
+    cost = (prompt_tokens * input_cost_per_mtok + completion_tokens * output_cost_per_mtok) / 1_000_000
+    attempted = stats["cells_done"] + stats["cells_failed"]
+
+    typer.echo("=" * 60)
+    typer.echo(f"Cells completed:     {stats['cells_done']} / {attempted}")
+    typer.echo(f"Failure rate:        {stats['cells_failed'] / attempted * 100 if attempted else 0:.1f}%")
+    typer.echo(f"Questions generated: {stats['questions_generated']} ({stats['questions_inserted']} inserted after dedup)")
+    typer.echo(f"Elapsed:             {elapsed:.1f}s")
+    typer.echo(f"Throughput:          {attempted / elapsed if elapsed else 0:.2f} cells/s, "
+               f"{stats['questions_generated'] / elapsed if elapsed else 0:.2f} questions/s")
+    typer.echo(f"Estimated cost:      ${cost:.4f} (~{prompt_tokens:.0f} prompt / {completion_tokens:.0f} completion tokens)")
+    typer.echo(f"LLM retries:         {gateway_stats['retries']}, circuit: {gateway_stats['circuit_state']}")
+
+    if stats["cells_failed"]:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,110 @@
+"""Benchmark reading a large discussion thread through CommunityService.get_reply_thread
+
+Seeds one discussion with a random reply tree in a scratch database (``<DB_NAME>_bench``,
+dropped afterwards), then times paging through the whole thread and assembling the
+tree in Python.
+
+    python bench_reply_thread.py [replies] [page_size]
+"""
+from typing import Dict, List, Any
+from datetime import datetime, timedelta
+import random
+import time
+
+from community_service import CommunityService, REPLY_PATH_SEGMENT_WIDTH, REPLY_PATH_SEPARATOR
+
+ROOT_SHARE = 0.2
+MAX_DEPTH = 12
+
+
+def seed_replies(discussion_id: str, count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """Reply documents for a random thread: each reply starts a new subtree or answers an earlier reply"""
+    replies: List[Dict[str, Any]] = []
+    start = datetime.utcnow() - timedelta(days=30)
+    for seq in range(1, count + 1):
+        parent = None
+        if replies and rng.random() > ROOT_SHARE:
+            parent = replies[rng.randrange(len(replies))]
+            if parent["depth"] >= MAX_DEPTH:
+                parent = None
+        segment = format(seq, f"0{REPLY_PATH_SEGMENT_WIDTH}x")
+        replies.append({
+            "id": f"{discussion_id}-{seq}",
+            "discussion_id": discussion_id,
+            "content": f"Reply {seq}",
+            "author_id": "bench-author",
+            "parent_reply_id": parent["id"] if parent else None,
+            "path": f"{parent['path']}{REPLY_PATH_SEPARATOR}{segment}" if parent else segment,
+            "depth": parent["depth"] + 1 if parent else 0,
+            "upvotes": 0,
+            "created_at": start + timedelta(seconds=seq)
+        })
+    return replies
+
+
+async def run(db, count: int, page_size: int) -> Dict[str, Any]:
+    service = CommunityService(db, author_snapshots=None)
+    await service.ensure_indexes()
+    discussion_id = "bench-thread"
+    replies = seed_replies(discussion_id, count, random.Random(42))
+    await db.discussions.insert_one({"id": discussion_id, "title": "Benchmark thread", "reply_seq": count})
+
+    started = time.perf_counter()
+    for start in range(0, count, 5000):
+        await db.discussion_replies.insert_many([dict(r) for r in replies[start:start + 5000]])
+    seeded = time.perf_counter() - started
+
+    started = time.perf_counter()
+    pages, read, cursor = 0, 0, None
+    while True:
+        page = await service.get_reply_thread(discussion_id, cursor=cursor, limit=page_size)
+        pages += 1
+        read += page["count"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    paged = time.perf_counter() - started
+
+    started = time.perf_counter()
+    whole = await service.get_reply_thread(discussion_id, limit=count)
+    single = time.perf_counter() - started
+
+    nodes = sorted((dict(r) for r in replies), key=lambda r: r["path"])
+    started = time.perf_counter()
+    CommunityService._build_reply_tree(nodes)
+    tree = time.perf_counter() - started
+
+    assert read == count and whole["count"] == count
+    return {
+        "replies": count,
+        "max_depth": max(r["depth"] for r in replies),
+        "seed_seconds": round(seeded, 3),
+        "pages": pages,
+        "paged_read_seconds": round(paged, 3),
+        "single_read_seconds": round(single, 3),
+        "tree_build_seconds": round(tree, 4)
+    }
+
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    import sys
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def main():
+        count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+        page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        name = f"{os.environ['DB_NAME']}_bench"
+        try:
+            print(await run(client[name], count, page_size))
+        finally:
+            await client.drop_database(name)
+            client.close()
+
+    asyncio.run(main())
@@ -1,16 +1,77 @@
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
+import math
+from pymongo import ReturnDocument, UpdateOne
 from models import (
     Discussion, DiscussionReply, Challenge, ChallengeParticipant, 
     StudyGroup, DiscussionType, ChallengeType
 )
-import uuid
+
+# Width of one materialized-path segment (hex digits of the per-discussion reply sequence)
+REPLY_PATH_SEGMENT_WIDTH = 8
+REPLY_PATH_SEPARATOR = "."
+
+# Hot ranking: log-scaled net votes plus a creation-time offset. Every HOT_DECAY_SECONDS of
+# age is worth one order of magnitude of votes, and since the offset depends only on
+# created_at the ordering never changes with the time of reading.
+HOT_EPOCH = datetime(2025, 1, 1)
+HOT_DECAY_SECONDS = 45000
+HOT_REPLY_WEIGHT = 0.5
+
+HOT_SORT_FIELDS = {"hot": "hot_score", "hot_score": "hot_score"}
+
+
+def compute_hot_score(upvotes: int, downvotes: int, reply_count: int, created_at: datetime) -> float:
+    """Compute a discussion's hot score (mirrors _hot_score_expression)"""
+    score = upvotes - downvotes + HOT_REPLY_WEIGHT * reply_count
+    sign = 1 if score > 0 else -1 if score < 0 else 0
+    order = math.log10(max(abs(score), 1))
+    return sign * order + (created_at - HOT_EPOCH).total_seconds() / HOT_DECAY_SECONDS
+
+
+def _hot_score_expression() -> Dict[str, Any]:
+    """Aggregation expression computing hot_score from the document's own fields"""
+    def field(name):
+        return {"$ifNull": [f"${name}", 0]}
+    return {
+        "$let": {
+            "vars": {
+                "score": {
+                    "$add": [
+                        {"$subtract": [field("upvotes"), field("downvotes")]},
+                        {"$multiply": [HOT_REPLY_WEIGHT, field("reply_count")]}
+                    ]
+                }
+            },
+            "in": {
+                "$add": [
+                    {"$multiply": [
+                        {"$cond": [{"$gt": ["$$score", 0]}, 1, {"$cond": [{"$lt": ["$$score", 0]}, -1, 0]}]},
+                        {"$log10": {"$max": [{"$abs": "$$score"}, 1]}}
+                    ]},
+                    {"$divide": [
+                        {"$subtract": ["$created_at", HOT_EPOCH]},
+                        HOT_DECAY_SECONDS * 1000
+                    ]}
+                ]
+            }
+        }
+    }
+
+
+def _increment_and_rescore(field: str) -> List[Dict[str, Any]]:
+    """Pipeline update that increments a counter and recomputes hot_score in the same write"""
+    return [
+        {"$set": {field: {"$add": [{"$ifNull": [f"${field}", 0]}, 1]}}},
+        {"$set": {"hot_score": _hot_score_expression()}}
+    ]
 
 class CommunityService:
     """Service for managing community features like discussions, challenges, and study groups"""
     
-    def __init__(self, db):
+    def __init__(self, db, author_snapshots):
         self.db = db
+        self.author_snapshots = author_snapshots
         self.discussions_collection = db.discussions
         self.discussion_replies_collection = db.discussion_replies
         self.challenges_collection = db.challenges
@@ -18,13 +79,80 @@ class CommunityService:
         self.study_groups_collection = db.study_groups
         self.user_profiles_collection = db.user_profiles
     
+    async def ensure_indexes(self):
+        """Create indexes backing community queries"""
+        await self.discussion_replies_collection.create_index(
+            [("discussion_id", 1), ("path", 1)]
+        )
+        # Hot feeds are plain range reads for every filter combination get_discussions accepts
+        await self.discussions_collection.create_index([("hot_score", -1)])
+        await self.discussions_collection.create_index([("discussion_type", 1), ("hot_score", -1)])
+        await self.discussions_collection.create_index([("topic_id", 1), ("hot_score", -1)])
+        await self.discussions_collection.create_index(
+            [("discussion_type", 1), ("topic_id", 1), ("hot_score", -1)]
+        )
+        # Score discussions created before hot ranking existed
+        await self.discussions_collection.update_many(
+            {"hot_score": {"$exists": False}},
+            [{"$set": {"hot_score": _hot_score_expression()}}]
+        )
+        await self.backfill_reply_paths()
+    
+    async def backfill_reply_paths(self) -> Dict[str, int]:
+        """Give replies created before materialized paths a path and depth, in creation order
+        
+        Each legacy reply takes the next sequence number of its discussion and nests
+        under its parent when the parent has a path, so paging never meets a reply
+        without a cursor position.
+        """
+        stats = {"discussions": 0, "replies": 0}
+        legacy_filter = {"path": {"$in": [None, ""]}}
+        discussion_ids = await self.discussion_replies_collection.distinct("discussion_id", legacy_filter)
+        for discussion_id in discussion_ids:
+            replies = await self.discussion_replies_collection.find(
+                {"discussion_id": discussion_id},
+                {"_id": 1, "id": 1, "parent_reply_id": 1, "path": 1, "depth": 1}
+            ).sort([("created_at", 1), ("_id", 1)]).to_list(None)
+            legacy = [reply for reply in replies if not reply.get("path")]
+            if not legacy:
+                continue
+            
+            discussion = await self.discussions_collection.find_one_and_update(
+                {"id": discussion_id},
+                {"$inc": {"reply_seq": len(legacy)}},
+                projection={"reply_seq": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            seq = (discussion["reply_seq"] if discussion else len(legacy)) - len(legacy)
+            replies_by_id = {reply["id"]: reply for reply in replies}
+            operations = []
+            for reply in legacy:
+                seq += 1
+                segment = format(seq, f"0{REPLY_PATH_SEGMENT_WIDTH}x")
+                parent = replies_by_id.get(reply.get("parent_reply_id"))
+                if parent and parent.get("path"):
+                    reply["path"] = f"{parent['path']}{REPLY_PATH_SEPARATOR}{segment}"
+                    reply["depth"] = parent.get("depth", 0) + 1
+                else:
+                    reply["path"] = segment
+                    reply["depth"] = 0
+                # Conditional, so a worker backfilling at the same time cannot overwrite it
+                operations.append(UpdateOne(
+                    {"_id": reply["_id"], **legacy_filter},
+                    {"$set": {"path": reply["path"], "depth": reply["depth"]}}
+                ))
+            result = await self.discussion_replies_collection.bulk_write(operations, ordered=False)
+            stats["discussions"] += 1
+            stats["replies"] += result.modified_count
+        return stats
+    
     async def create_discussion(self, title: str, content: str, author_id: str,
                               discussion_type: DiscussionType, topic_id: Optional[str] = None,
                               lesson_id: Optional[str] = None, tags: List[str] = None) -> Dict[str, Any]:
         """Create a new community discussion"""
         
         # Get author info
-        author = await self.user_profiles_collection.find_one({"id": author_id})
+        author = await self.author_snapshots.get_snapshot(author_id)
         if not author:
             raise ValueError("Author not found")
         
@@ -32,12 +160,13 @@ class CommunityService:
             title=title,
             content=content,
             author_id=author_id,
-            author_username=author["username"],
+            **self.author_snapshots.embed(author),
             topic_id=topic_id,
             lesson_id=lesson_id,
             discussion_type=discussion_type,
             tags=tags or []
         )
+        discussion.hot_score = compute_hot_score(0, 0, 0, discussion.created_at)
         
         result = await self.discussions_collection.insert_one(discussion.dict())
         discussion_dict = discussion.dict()
@@ -57,7 +186,8 @@ class CommunityService:
         if topic_id:
             filter_query["topic_id"] = topic_id
         
-        sort_direction = -1 if sort_by in ["created_at", "upvotes", "reply_count"] else 1
+        sort_by = HOT_SORT_FIELDS.get(sort_by, sort_by)
+        sort_direction = -1 if sort_by in ["created_at", "upvotes", "reply_count", "hot_score"] else 1
         
         discussions = await self.discussions_collection.find(filter_query)\
             .sort(sort_by, sort_direction)\
@@ -72,29 +202,52 @@ class CommunityService:
         """Add a reply to a discussion"""
         
         # Get author info
-        author = await self.user_profiles_collection.find_one({"id": author_id})
+        author = await self.author_snapshots.get_snapshot(author_id)
         if not author:
             raise ValueError("Author not found")
         
-        # Verify discussion exists
-        discussion = await self.discussions_collection.find_one({"id": discussion_id})
+        # Resolve the parent's position in the thread
+        parent_path = None
+        depth = 0
+        if parent_reply_id:
+            parent = await self.discussion_replies_collection.find_one(
+                {"id": parent_reply_id, "discussion_id": discussion_id},
+                {"path": 1, "depth": 1}
+            )
+            if not parent:
+                raise ValueError("Parent reply not found")
+            parent_path = parent.get("path")
+            depth = parent.get("depth", 0) + 1
+        
+        # Reserve the next reply sequence number (also verifies the discussion exists)
+        discussion = await self.discussions_collection.find_one_and_update(
+            {"id": discussion_id},
+            {"$inc": {"reply_seq": 1}},
+            projection={"reply_seq": 1},
+            return_document=ReturnDocument.AFTER
+        )
         if not discussion:
             raise ValueError("Discussion not found")
         
+        segment = format(discussion["reply_seq"], f"0{REPLY_PATH_SEGMENT_WIDTH}x")
+        path = f"{parent_path}{REPLY_PATH_SEPARATOR}{segment}" if parent_path else segment
+        
         reply = DiscussionReply(
             discussion_id=discussion_id,
             content=content,
             author_id=author_id,
-            author_username=author["username"],
-            parent_reply_id=parent_reply_id
+            **self.author_snapshots.embed(author),
+            parent_reply_id=parent_reply_id,
+            path=path,
+            depth=depth
         )
         
         result = await self.discussion_replies_collection.insert_one(reply.dict())
         
-        # Update discussion reply count
+        # Update discussion reply count and hot score
         await self.discussions_collection.update_one(
             {"id": discussion_id},
-            {"$inc": {"reply_count": 1}}
+            _increment_and_rescore("reply_count")
         )
         
         reply_dict = reply.dict()
@@ -102,6 +255,60 @@ class CommunityService:
         
         return reply_dict
     
+    async def get_reply_thread(self, discussion_id: str, cursor: Optional[str] = None,
+                             limit: int = 200) -> Dict[str, Any]:
+        """Get a discussion's replies as a nested tree, paginated by top-level subtree
+        
+        Replies are read in a single range scan over the (discussion_id, path) index.
+        A page ends at a subtree boundary unless one subtree alone exceeds the limit,
+        in which case the next page continues inside it.
+        """
+        
+        filter_query = {"discussion_id": discussion_id}
+        if cursor:
+            filter_query["path"] = {"$gt": cursor}
+        
+        replies = await self.discussion_replies_collection.find(filter_query, {"_id": 0})\
+            .sort("path", 1)\
+            .limit(limit + 1)\
+            .to_list(None)
+        
+        next_cursor = None
+        if len(replies) > limit:
+            # The extra reply tells us whether the last subtree was cut off
+            if replies[limit].get("depth", 0) > 0:
+                last_root = max(
+                    (i for i in range(limit) if replies[i].get("depth", 0) == 0),
+                    default=0
+                )
+                if last_root > 0:
+                    limit = last_root
+            replies = replies[:limit]
+            # A reply without a path has no position to resume from; stop rather than restart
+            next_cursor = replies[-1].get("path") or None
+        
+        return {
+            "replies": self._build_reply_tree(replies),
+            "count": len(replies),
+            "next_cursor": next_cursor
+        }
+    
+    @staticmethod
+    def _build_reply_tree(replies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Nest replies already sorted in path order under their parents in O(n)"""
+        nodes = {}
+        roots = []
+        for reply in replies:
+            reply["replies"] = []
+            nodes[reply["id"]] = reply
+            # Parents always sort before children; a missing parent lives on an earlier page
+            parent = nodes.get(reply.get("parent_reply_id"))
+            if parent:
+                parent["replies"].append(reply)
+            else:
+                roots.append(reply)
+        return roots
+    
     async def vote_discussion(self, discussion_id: str, user_id: str, vote_type: str) -> Dict[str, Any]:
         """Vote on a discussion (upvote/downvote)"""
         
@@ -113,7 +320,7 @@ class CommunityService:
         
         result = await self.discussions_collection.update_one(
             {"id": discussion_id},
-            {"$inc": {update_field: 1}}
+            _increment_and_rescore(update_field)
         )
         
         if result.matched_count == 0:
@@ -0,0 +1,204 @@
+from typing import Dict, List, Any, Iterable, Tuple
+from collections import deque
+import asyncio
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def pack_bits(mask: np.ndarray, words: int) -> np.ndarray:
+    """Pack a boolean vector into little-endian uint64 words"""
+    padded = np.zeros(words * 64, dtype=bool)
+    padded[:len(mask)] = mask
+    return np.packbits(padded, bitorder="little").view("<u8")
+
+
+def set_bits(bits: np.ndarray, rows: np.ndarray, ordinals: np.ndarray):
+    """Set bit ``ordinals[i]`` in row ``rows[i]`` of a packed (rows, words) matrix"""
+    np.bitwise_or.at(
+        bits,
+        (rows, ordinals // 64),
+        np.left_shift(np.uint64(1), (ordinals % 64).astype(np.uint64))
+    )
+
+
+class CurriculumSnapshot:
+    """Read-only, array-indexed view of all topics and lessons
+
+    Lessons get dense ordinals in (topic order, lesson order) so per-user state can be
+    expressed as NumPy vectors over the whole curriculum.
+
+    The prerequisite graph is compiled once per snapshot: lesson prerequisites and
+    topic prerequisites (every lesson of a prerequisite topic) are checked for cycles,
+    topologically ordered, and stored per lesson as a bitmask over lesson ordinals.
+    Unlocking is then a bitwise AND-NOT of each mask against the user's completed
+    bitmask.
+    """
+
+    def __init__(self, topics: List[Dict[str, Any]], lessons: List[Dict[str, Any]]):
+        self.topics = sorted(topics, key=lambda t: (t.get("order", 0), t["id"]))
+        self.topic_index = {topic["id"]: i for i, topic in enumerate(self.topics)}
+
+        topic_order = {topic["id"]: i for i, topic in enumerate(self.topics)}
+        self.lessons = sorted(
+            lessons,
+            key=lambda l: (topic_order.get(l.get("topic_id"), len(topic_order)), l.get("order", 0), l["id"])
+        )
+        self.lesson_ids = [lesson["id"] for lesson in self.lessons]
+        self.lesson_index = {lesson_id: i for i, lesson_id in enumerate(self.lesson_ids)}
+
+        n = len(self.lessons)
+        self.lesson_topic = np.array(
+            [self.topic_index.get(l.get("topic_id"), -1) for l in self.lessons], dtype=np.int64
+        )
+        self.lesson_order = np.array([l.get("order", 0) for l in self.lessons], dtype=np.float64)
+        self.lesson_difficulty = np.array([l.get("difficulty", 1) for l in self.lessons], dtype=np.float64)
+        self.lesson_xp = np.array([l.get("xp_reward", 0) for l in self.lessons], dtype=np.float64)
+
+        # Prerequisite edges as parallel (lesson, prerequisite) ordinal arrays
+        edges = [
+            (i, self.lesson_index[prereq])
+            for i, lesson in enumerate(self.lessons)
+            for prereq in lesson.get("prerequisites", [])
+            if prereq in self.lesson_index
+        ]
+        self.prereq_lesson = np.array([e[0] for e in edges], dtype=np.int64)
+        self.prereq_required = np.array([e[1] for e in edges], dtype=np.int64)
+        self.size = n
+        self.words = max((n + 63) // 64, 1)
+
+        # Lessons of each topic as a bitmask; a topic requires the union of its
+        # prerequisite topics' masks, and each lesson requires its own prerequisites
+        # plus its topic's
+        n_topics = len(self.topics)
+        in_topic = np.flatnonzero(self.lesson_topic >= 0)
+        topic_bits = np.zeros((n_topics, self.words), dtype="<u8")
+        set_bits(topic_bits, self.lesson_topic[in_topic], in_topic)
+        topic_edges = [
+            (t, self.topic_index[prereq])
+            for t, topic in enumerate(self.topics)
+            for prereq in topic.get("prerequisites", [])
+            if prereq in self.topic_index
+        ]
+        self.topological_order = self._topological_order(edges, topic_edges)
+
+        self.topic_prereq_bits = np.zeros((n_topics, self.words), dtype="<u8")
+        for topic, prereq in topic_edges:
+            self.topic_prereq_bits[topic] |= topic_bits[prereq]
+        self.prereq_bits = np.zeros((n, self.words), dtype="<u8")
+        set_bits(self.prereq_bits, self.prereq_lesson, self.prereq_required)
+        self.prereq_bits[in_topic] |= self.topic_prereq_bits[self.lesson_topic[in_topic]]
+
+        # Topic membership for O(1) topic completion checks
+        self.lesson_topic_ids = {lesson["id"]: lesson.get("topic_id") for lesson in self.lessons}
+        # Lesson lookup by normalized title, first lesson in curriculum order wins
+        self.lesson_title_ids: Dict[str, str] = {}
+        for lesson in self.lessons:
+            if lesson.get("title"):
+                self.lesson_title_ids.setdefault(lesson["title"].strip().lower(), lesson["id"])
+        topic_lessons: Dict[str, set] = {}
+        for lesson in self.lessons:
+            topic_lessons.setdefault(lesson.get("topic_id"), set()).add(lesson["id"])
+        self.topic_lessons = {topic_id: frozenset(ids) for topic_id, ids in topic_lessons.items()}
+        self.topic_lesson_count = {topic_id: len(ids) for topic_id, ids in topic_lessons.items()}
+
+    def _topological_order(self, edges: List[Tuple[int, int]], topic_edges: List[Tuple[int, int]]) -> np.ndarray:
+        """Lesson ordinals with every prerequisite before its dependents; raises ValueError on a cycle
+
+        Topic prerequisites are modelled with one node per topic that depends on all of
+        the topic's lessons, so mixed lesson/topic cycles are found too.
+        """
+        n, n_topics = self.size, len(self.topics)
+        dependents: List[List[int]] = [[] for _ in range(n + n_topics)]
+        indegree = np.zeros(n + n_topics, dtype=np.int64)
+
+        def add_edge(node: int, requires: int):
+            dependents[requires].append(node)
+            indegree[node] += 1
+
+        for lesson, prereq in edges:
+            add_edge(lesson, prereq)
+        for lesson in np.flatnonzero(self.lesson_topic >= 0):
+            add_edge(n + int(self.lesson_topic[lesson]), int(lesson))
+        for topic, prereq in topic_edges:
+            for lesson in np.flatnonzero(self.lesson_topic == topic):
+                add_edge(int(lesson), n + prereq)
+
+        ready = deque(np.flatnonzero(indegree == 0).tolist())
+        order = []
+        while ready:
+            node = ready.popleft()
+            order.append(node)
+            for dependent in dependents[node]:
+                indegree[dependent] -= 1
+                if indegree[dependent] == 0:
+                    ready.append(dependent)
+
+        if len(order) < n + n_topics:
+            stuck = [self.lesson_ids[i] if i < n else self.topics[i - n]["id"] for i in np.flatnonzero(indegree > 0)]
+            raise ValueError(f"Prerequisite cycle among: {', '.join(stuck[:20])}")
+        return np.array([node for node in order if node < n], dtype=np.int64)
+
+    def completed_bits(self, lesson_ids: Iterable[str]) -> np.ndarray:
+        """Packed bitmask over lesson ordinals for the given lesson IDs"""
+        return pack_bits(self.completed_mask(lesson_ids), self.words)
+
+    def unlocked_lessons(self, completed_bits: np.ndarray) -> np.ndarray:
+        """Lessons whose prerequisites (including prerequisite topics) are all completed"""
+        return ~np.any(self.prereq_bits & ~completed_bits, axis=1)
+
+    def unlocked_topics(self, completed_bits: np.ndarray) -> np.ndarray:
+        """Topics whose prerequisite topics are all completed"""
+        return ~np.any(self.topic_prereq_bits & ~completed_bits, axis=1)
+
+    def locked_ids(self, lessons_completed: Iterable[str]):
+        """IDs of the lessons and of the topics still locked for a user's completed lessons"""
+        completed = self.completed_bits(lessons_completed)
+        lessons = np.flatnonzero(~self.unlocked_lessons(completed))
+        topics = np.flatnonzero(~self.unlocked_topics(completed))
+        return {self.lesson_ids[i] for i in lessons}, {self.topics[t]["id"] for t in topics}
+
+    def completed_mask(self, lesson_ids: Iterable[str]) -> np.ndarray:
+        """Boolean vector over lesson ordinals for the given lesson IDs"""
+        mask = np.zeros(self.size, dtype=bool)
+        ordinals = [self.lesson_index[l] for l in lesson_ids if l in self.lesson_index]
+        mask[ordinals] = True
+        return mask
+
+    def unlocked_mask(self, completed: np.ndarray) -> np.ndarray:
+        """Lessons whose prerequisites are all in ``completed`` (a boolean vector)"""
+        return self.unlocked_lessons(pack_bits(completed, self.words))
+
+
+class CurriculumService:
+    """Holds the current curriculum snapshot and reloads it periodically"""
+
+    def __init__(self, db, refresh_interval: int = 300):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.snapshot = CurriculumSnapshot([], [])
+        self._task = None
+
+    async def refresh(self) -> CurriculumSnapshot:
+        topics = await self.db.topics.find({}, {"_id": 0}).to_list(None)
+        lessons = await self.db.lessons.find({}, {"_id": 0, "content": 0}).to_list(None)
+        self.snapshot = CurriculumSnapshot(topics, lessons)
+        return self.snapshot
+
+    async def start(self):
+        await self.refresh()
+        if self.refresh_interval > 0:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Curriculum refresh failed: {e}")
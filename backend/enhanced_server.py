@@ -1,18 +1,40 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 import os
+import json
+import asyncio
 import logging
 from pathlib import Path
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 
 # Import all models
 from models import *
 from ai_service import AIService
+from ai_cache import ResponseCache
+from question_pool import QuestionPool, lesson_copy
+from question_dedup import QuestionDeduplicator
+from curriculum import CurriculumService
+from recommendation_engine import LocalRecommender
+from recommendation_store import RecommendationStore
+from review_scheduler import ReviewScheduler
+from response_log import ResponseLog
+from learner_summary import LearnerSummaryBuilder
+from progress_analytics import ProgressAnalytics
+from progress_service import ProgressService
+from analytics_rollup import AnalyticsRollup
+from event_bus import EventBus, InMemoryEventBus
+from outbox import OutboxDispatcher, new_entry
 from gamification_service import GamificationService
+from hearts import HeartsService
+from learning_paths import LearningPathService
+from levels import LevelTable
 from community_service import CommunityService
+from author_service import AuthorSnapshotService
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -23,9 +45,62 @@ client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
 # Initialize services
-ai_service = AIService()
-gamification_service = GamificationService(db)
-community_service = CommunityService(db)
+ai_service = AIService(cache=ResponseCache(
+    db.ai_response_cache,
+    max_entries=int(os.environ.get('AI_CACHE_MAX_ENTRIES', '2048')),
+    ttl=int(os.environ.get('AI_CACHE_TTL_SECONDS', str(7 * 24 * 3600))),
+    stale_ttl=int(os.environ.get('AI_CACHE_STALE_SECONDS', str(24 * 3600))),
+    negative_ttl=int(os.environ.get('AI_CACHE_NEGATIVE_TTL_SECONDS', '60')),
+    max_stored_entries=int(os.environ.get('AI_CACHE_MAX_STORED_ENTRIES', '100000')),
+    local_ttl=float(os.environ.get('AI_CACHE_LOCAL_SECONDS', '60'))
+))
+question_pool = QuestionPool(
+    db, ai_service,
+    low_water=int(os.environ.get('QUESTION_POOL_LOW_WATER', '20')),
+    refill_batch=int(os.environ.get('QUESTION_POOL_REFILL_BATCH', '10')),
+    workers=int(os.environ.get('QUESTION_POOL_WORKERS', '2'))
+)
+question_deduplicator = QuestionDeduplicator(db.questions)
+curriculum = CurriculumService(db, refresh_interval=int(os.environ.get('CURRICULUM_REFRESH_SECONDS', '300')))
+local_recommender = LocalRecommender(db, curriculum)
+recommendation_store = RecommendationStore(
+    db, ttl=int(os.environ.get('RECOMMENDATIONS_TTL_SECONDS', str(24 * 3600)))
+)
+learner_summaries = LearnerSummaryBuilder(
+    db, curriculum, token_budget=int(os.environ.get('LEARNER_SUMMARY_TOKEN_BUDGET', '400'))
+)
+progress_service = ProgressService(db, curriculum)
+progress_analytics = ProgressAnalytics(db, curriculum)
+learning_paths = LearningPathService(db, curriculum)
+analytics_rollup = AnalyticsRollup(
+    db, curriculum, interval=int(os.environ.get('ANALYTICS_ROLLUP_SECONDS', '300'))
+)
+review_scheduler = ReviewScheduler(
+    db, interval_modifier=float(os.environ.get('REVIEW_INTERVAL_MODIFIER', '1.0'))
+)
+response_log = ResponseLog(
+    os.environ.get('RESPONSE_LOG_DIR', str(ROOT_DIR / 'data' / 'responses')),
+    flush_interval=int(os.environ.get('RESPONSE_LOG_FLUSH_SECONDS', '60'))
+)
+if os.environ.get('EVENT_BUS') == 'memory':
+    event_bus = InMemoryEventBus()
+else:
+    event_bus = EventBus(db, poll_interval=float(os.environ.get('EVENT_BUS_POLL_SECONDS', '1.0')))
+gamification_service = GamificationService(
+    db, event_bus, levels=LevelTable.from_config(os.environ.get('LEVEL_XP_THRESHOLDS')),
+    progress_service=progress_service, learner_summaries=learner_summaries
+)
+event_bus.register("profile_totals", gamification_service.apply_activity_totals)
+event_bus.register("streaks", gamification_service.apply_streaks)
+hearts_service = HeartsService(db, refill_seconds=int(os.environ.get('HEART_REFILL_SECONDS', str(30 * 60))))
+author_snapshots = AuthorSnapshotService(
+    db, max_age=float(os.environ.get('AUTHOR_SNAPSHOT_MAX_AGE_SECONDS', '30'))
+)
+community_service = CommunityService(db, author_snapshots)
+
+progress_outbox = OutboxDispatcher(
+    db, "user_progress", interval=float(os.environ.get('OUTBOX_POLL_SECONDS', '5'))
+)
 
 # Create the main app
 app = FastAPI(title="Finlingo Enhanced API", version="2.0.0")
@@ -33,6 +108,22 @@ app = FastAPI(title="Finlingo Enhanced API", version="2.0.0")
 # Create API router
 api_router = APIRouter(prefix="/api")
 
+# Strong references to fire-and-forget tasks so they are not garbage collected mid-run
+background_tasks = set()
+
+def run_in_background(coro):
+    """Schedule a coroutine without awaiting it, logging any failure"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    
+    def finished(t):
+        background_tasks.discard(t)
+        if not t.cancelled() and t.exception():
+            logger.error(f"Background task failed: {t.exception()}")
+    
+    task.add_done_callback(finished)
+    return task
+
 # Health check endpoint
 @api_router.get("/health")
 async def health_check():
@@ -62,7 +153,9 @@ async def get_user_profile(user_id: str):
     user = await db.user_profiles.find_one({"id": user_id})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return UserProfile(**user)
+    # Hearts regenerated since the last spend are computed, not stored
+    hearts = hearts_service.current(user)
+    return UserProfile(**{**user, "hearts": hearts["hearts"], "last_heart_refill": hearts["last_heart_refill"]})
 
 @api_router.put("/users/{user_id}", response_model=UserProfile)
 async def update_user_profile(user_id: str, update_data: UserProfileUpdate):
@@ -79,20 +172,60 @@ async def update_user_profile(user_id: str, update_data: UserProfileUpdate):
         raise HTTPException(status_code=404, detail="User not found")
     
     updated_user = await db.user_profiles.find_one({"id": user_id})
-    return UserProfile(**updated_user)
+    
+    # Refresh author info embedded in the user's posts
+    if "display_name" in update_dict or "avatar_url" in update_dict:
+        await author_snapshots.schedule_fanout(user_id, updated_user)
+    
+    hearts = hearts_service.current(updated_user)
+    return UserProfile(**{**updated_user, "hearts": hearts["hearts"], "last_heart_refill": hearts["last_heart_refill"]})
+
+@api_router.get("/users/{user_id}/hearts")
+async def get_user_hearts(user_id: str):
+    """Get the user's current hearts and when the next one regenerates"""
+    hearts = await hearts_service.get(user_id)
+    if hearts is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return hearts
+
+@api_router.post("/users/{user_id}/hearts/spend")
+async def spend_user_heart(user_id: str):
+    """Spend one heart, e.g. on a wrong answer"""
+    hearts = await hearts_service.spend(user_id)
+    if hearts is not None:
+        return hearts
+    if await hearts_service.get(user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    raise HTTPException(status_code=400, detail="No hearts left")
 
 # ==================== ENHANCED EDUCATIONAL CONTENT ENDPOINTS ====================
 
+async def get_locked_ids(user_id: Optional[str]):
+    """Locked lesson and topic IDs for a user from the compiled prerequisite graph, or None without a user"""
+    if not user_id:
+        return None
+    profile = await db.user_profiles.find_one({"id": user_id}, {"_id": 0, "lessons_completed": 1})
+    return curriculum.snapshot.locked_ids((profile or {}).get("lessons_completed", []))
+
 @api_router.get("/topics", response_model=List[Topic])
-async def get_all_topics():
-    """Get all available topics"""
-    topics = await db.topics.find().to_list(1000)
+async def get_all_topics(user_id: Optional[str] = None):
+    """Get all available topics, with ``is_locked`` computed for ``user_id`` when given"""
+    topics, locked = await asyncio.gather(db.topics.find().to_list(1000), get_locked_ids(user_id))
+    if locked is not None:
+        for topic in topics:
+            topic["is_locked"] = topic["id"] in locked[1]
     return [Topic(**topic) for topic in topics]
 
 @api_router.get("/topics/{topic_id}/lessons", response_model=List[Lesson])
-async def get_topic_lessons(topic_id: str):
-    """Get all lessons for a topic"""
-    lessons = await db.lessons.find({"topic_id": topic_id}).sort("order", 1).to_list(1000)
+async def get_topic_lessons(topic_id: str, user_id: Optional[str] = None):
+    """Get all lessons for a topic, with ``is_locked`` computed for ``user_id`` when given"""
+    lessons, locked = await asyncio.gather(
+        db.lessons.find({"topic_id": topic_id}).sort("order", 1).to_list(1000),
+        get_locked_ids(user_id)
+    )
+    if locked is not None:
+        for lesson in lessons:
+            lesson["is_locked"] = lesson["id"] in locked[0]
     return [Lesson(**lesson) for lesson in lessons]
 
 @api_router.get("/lessons/{lesson_id}/questions", response_model=List[Question])
@@ -118,108 +251,314 @@ async def complete_lesson(lesson_id: str, completion_data: LessonCompletionReque
     base_xp = lesson.get("xp_reward", 100)
     xp_earned = int(base_xp * (score_percentage / 100))
     
-    # Update user progress
-    user_progress = UserProgress(
-        user_id=completion_data.user_id if hasattr(completion_data, 'user_id') else "default_user",
+    # One write: the progress upsert carries the outbox entry for every other side effect
+    user_id = completion_data.user_id
+    entry = new_entry("lesson_completed", {
+        "user_id": user_id,
+        "lesson_id": lesson_id,
+        "topic_id": completion_data.topic_id,
+        "score": score_percentage,
+        "xp_earned": xp_earned,
+        "time_spent": completion_data.total_time,
+        "question_responses": [response.dict() for response in completion_data.question_responses]
+    })
+    await progress_service.record_attempt(
+        user_id=user_id,
         lesson_id=lesson_id,
         topic_id=completion_data.topic_id,
-        status="completed",
-        progress_percentage=100.0,
         score=int(score_percentage),
         time_spent=completion_data.total_time,
-        attempts=1
+        outbox_entry=entry
     )
+    progress_outbox.notify()
     
-    await db.user_progress.insert_one(user_progress.dict())
+    # Keep per-question answers for difficulty calibration and analytics
+    response_log.append(user_id, lesson_id, completion_data.topic_id, completion_data.question_responses)
+    
+    # Topic completion and achievements are applied by the outbox after this returns;
+    # clients poll get_lesson_completion with the completion ID for them
+    return {
+        "score": score_percentage,
+        "xp_earned": xp_earned,
+        "gems_earned": xp_earned // 10,
+        "completion_id": entry["id"],
+        "topic_completed": None,
+        "new_achievements": []
+    }
+
+async def apply_lesson_completion(entry: Dict[str, Any]):
+    """Outbox handler for a completed lesson; every step is safe to repeat for the same entry"""
+    completion = entry["payload"]
+    user_id, lesson_id = completion["user_id"], completion["lesson_id"]
     
-    # Update user profile
-    user_id = completion_data.user_id if hasattr(completion_data, 'user_id') else "default_user"
     await db.user_profiles.update_one(
         {"id": user_id},
         {
             "$addToSet": {"lessons_completed": lesson_id},
-            "$inc": {"total_xp": xp_earned, "total_gems": xp_earned // 10}
+            # Stored recommendations are stale once the lesson is done
+            "$inc": {"recommendations_version": 1}
         }
     )
     
-    # Update streak
-    await gamification_service.update_streak(user_id)
+    # A lesson's first completion counts towards its topic
+    completed_topic = None
+    if entry.get("first_completion"):
+        completed_topic = await progress_service.record_first_completion(user_id, lesson_id, completion_id=entry["id"])
+    
+    # Advance the user's active learning paths that include the lesson
+    await learning_paths.record_lesson_completed(user_id, lesson_id)
+    
+    # Schedule spaced-repetition reviews of the answered questions
+    await review_scheduler.record_responses(
+        user_id, lesson_id, completion["topic_id"],
+        [QuestionResponse(**response) for response in completion["question_responses"]],
+        reviewed_at=entry["created_at"]
+    )
     
-    # Record activity
+    # Record activity; XP, gems and the streak follow from it via the event bus
     await gamification_service.record_user_activity(
         user_id=user_id,
         activity_type="lesson_completed",
         content_id=lesson_id,
-        xp_earned=xp_earned,
-        gems_earned=xp_earned // 10,
-        metadata={"score": score_percentage, "time_spent": completion_data.total_time}
+        xp_earned=completion["xp_earned"],
+        gems_earned=completion["xp_earned"] // 10,
+        metadata={"score": completion["score"], "time_spent": completion["time_spent"],
+                  "completed_at": entry["created_at"]},
+        activity_id=entry["id"]
     )
     
-    # Check for new achievements
-    activity_data = {"lesson_score": score_percentage}
-    new_achievements = await gamification_service.check_and_award_achievements(user_id, activity_data)
+    new_achievements = await gamification_service.check_and_award_achievements(
+        user_id, {"lesson_score": completion["score"]}
+    )
+    
+    # Outcome reported by get_lesson_completion; a replay adds to it rather than clearing it
+    outcome = {"$addToSet": {"metadata.new_achievements": {"$each": [a["id"] for a in new_achievements]}}}
+    if completed_topic:
+        outcome["$set"] = {"metadata.topic_completed": completed_topic}
+    await db.user_activities.update_one({"id": entry["id"]}, outcome)
+    
+    # Cached prompt summary no longer reflects this user's progress
+    learner_summaries.invalidate(user_id)
+
+progress_outbox.register("lesson_completed", apply_lesson_completion)
+
+@api_router.get("/users/{user_id}/completions/{completion_id}")
+async def get_lesson_completion(user_id: str, completion_id: str):
+    """Get the topic completion and achievements of a lesson completion
+    
+    ``status`` is "pending" until the outbox has applied the completion, then
+    "applied"; "failed" means it was parked after repeated errors.
+    """
+    if await db.user_progress.find_one({"user_id": user_id, "outbox.id": completion_id}, {"_id": 1}):
+        status = "pending"
+    elif await db.outbox_dead_letters.find_one({"id": completion_id, "payload.user_id": user_id}, {"_id": 1}):
+        status = "failed"
+    else:
+        status = "applied"
     
+    activity = await db.user_activities.find_one(
+        {"id": completion_id, "user_id": user_id, "activity_type": "lesson_completed"},
+        {"_id": 0, "metadata": 1}
+    )
+    if status == "applied" and not activity:
+        raise HTTPException(status_code=404, detail="Completion not found")
+    
+    metadata = (activity or {}).get("metadata", {})
+    achievement_ids = metadata.get("new_achievements", [])
+    achievements = await db.achievements.find({"id": {"$in": achievement_ids}}, {"_id": 0}).to_list(None) \
+        if achievement_ids else []
     return {
-        "score": score_percentage,
-        "xp_earned": xp_earned,
-        "gems_earned": xp_earned // 10,
-        "new_achievements": new_achievements
+        "completion_id": completion_id,
+        "status": status,
+        "topic_completed": metadata.get("topic_completed"),
+        "new_achievements": achievements
     }
 
 # ==================== AI-POWERED FEATURES ENDPOINTS ====================
 
+async def save_generated_questions(questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Store AI-generated questions, skipping near-duplicates of the lesson's existing questions
+    
+    Returns the questions as stored, in the given order: a rejected near-duplicate is
+    replaced by the question it duplicates, so every returned ID can be answered.
+    """
+    candidates = [dict(q) for q in questions]
+    unique = await question_deduplicator.filter_duplicates(candidates)
+    if unique:
+        # Content-derived IDs make repeated (e.g. cached) questions a no-op
+        await db.questions.bulk_write([
+            UpdateOne(
+                {"id": q["id"]},
+                {"$setOnInsert": {**Question(**q).dict(), "minhash": q["minhash"], "lsh_bands": q["lsh_bands"]}},
+                upsert=True
+            )
+            for q in unique
+        ], ordered=False)
+    
+    duplicate_ids = [q["duplicate_of"] for q in candidates if "duplicate_of" in q]
+    existing = {}
+    if duplicate_ids:
+        existing = {
+            q["id"]: q for q in await db.questions.find(
+                {"id": {"$in": duplicate_ids}}, {"_id": 0, "minhash": 0, "lsh_bands": 0}
+            ).to_list(None)
+        }
+    
+    stored, seen = [], set()
+    for q in candidates:
+        question = existing.get(q["duplicate_of"]) if "duplicate_of" in q else q
+        if question is None or question["id"] in seen:
+            continue
+        seen.add(question["id"])
+        stored.append({k: v for k, v in question.items() if k not in ("minhash", "lsh_bands")})
+    return stored
+
 @api_router.post("/ai/generate-questions")
 async def generate_ai_questions(request: AIQuestionRequest):
     """Generate AI-powered questions"""
     try:
-        questions = await ai_service.generate_questions(
-            topic_id=request.topic_id,
-            lesson_id=request.lesson_id or "general",
-            difficulty=request.difficulty,
-            question_type=request.question_type,
-            count=5,
-            context=request.context
-        )
+        lesson_id = request.lesson_id or "general"
         
-        # Save generated questions to database
-        for question_data in questions:
-            question = Question(**question_data)
-            await db.questions.insert_one(question.dict())
+        if request.context:
+            # Custom context can't be pre-generated, so it still goes to the LLM
+            questions = await ai_service.generate_questions(
+                topic_id=request.topic_id,
+                lesson_id=lesson_id,
+                difficulty=request.difficulty,
+                question_type=request.question_type,
+                count=5,
+                context=request.context
+            )
+        else:
+            pooled = await question_pool.draw(
+                topic_id=request.topic_id,
+                difficulty=request.difficulty,
+                question_type=request.question_type,
+                count=5,
+                user_id=request.user_id
+            )
+            if pooled:
+                questions = [lesson_copy(q, lesson_id) for q in pooled]
+            else:
+                # Cold pool: generate inline once while the workers fill it
+                questions = await ai_service.generate_questions(
+                    topic_id=request.topic_id,
+                    lesson_id=lesson_id,
+                    difficulty=request.difficulty,
+                    question_type=request.question_type,
+                    count=5
+                )
+        
+        # Save generated questions to database; near-duplicates come back as the stored question
+        questions = await save_generated_questions(questions)
         
         return {"questions": questions}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating questions: {str(e)}")
 
+@api_router.get("/ai/stats")
+async def get_ai_stats():
+    """Get LLM gateway and response cache statistics"""
+    return ai_service.get_stats()
+
+@api_router.get("/ai/generate-questions/stream")
+async def stream_ai_questions(
+    topic_id: str,
+    lesson_id: Optional[str] = None,
+    difficulty: int = 1,
+    question_type: QuestionType = QuestionType.MULTIPLE_CHOICE,
+    context: Optional[str] = None,
+    count: int = 5
+):
+    """Stream AI-generated questions as server-sent events, one event per question
+    
+    Questions are sent as the LLM finishes each one only when the gateway streams over
+    HTTP (LLM_BASE_URL or LLM_STREAM_BASE_URL). The default provider SDK returns whole
+    completions, so without either setting every question arrives at once at the end.
+    """
+    
+    async def event_stream():
+        sent = set()
+        try:
+            async for question in ai_service.stream_questions(
+                topic_id=topic_id,
+                lesson_id=lesson_id or "general",
+                difficulty=difficulty,
+                question_type=question_type,
+                count=min(max(count, 1), 20),
+                context=context
+            ):
+                # Each question is stored before it is sent, so a near-duplicate of an
+                # earlier one in the stream is caught and sent as the stored question
+                for stored in await save_generated_questions([question]):
+                    if stored["id"] in sent:
+                        continue
+                    sent.add(stored["id"])
+                    yield f"event: question\ndata: {json.dumps(stored, default=str)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': f'Error generating questions: {str(e)}'})}\n\n"
+        
+        yield f"event: done\ndata: {json.dumps({'count': len(sent)})}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/ai/question-pool/metrics")
+async def get_question_pool_metrics():
+    """Get question pool depth and refill lag"""
+    return question_pool.get_metrics()
+
 @api_router.get("/ai/recommendations/{user_id}")
 async def get_personalized_recommendations(user_id: str):
-    """Get AI-powered personalized learning recommendations"""
+    """Get personalized learning recommendations
+    
+    Serves the stored set while it is fresh. Otherwise returns the local
+    curriculum-based ranking immediately, and the LLM re-ranks and enriches it
+    in the background.
+    """
     try:
-        # Get user progress and history
         user_profile = await db.user_profiles.find_one({"id": user_id})
         if not user_profile:
             raise HTTPException(status_code=404, detail="User not found")
         
-        learning_history = await db.user_activities.find(
-            {"user_id": user_id}
-        ).sort("created_at", -1).limit(20).to_list(None)
+        version = user_profile.get("recommendations_version", 0)
+        recommendations = await recommendation_store.get(user_id, version)
+        if recommendations:
+            return {"recommendations": recommendations, "version": version}
         
-        recommendations = await ai_service.generate_personalized_recommendations(
-            user_id=user_id,
-            user_progress=user_profile,
-            learning_history=learning_history
-        )
+        recommendations = await local_recommender.recommend(user_id, user_profile)
+        if recommendations:
+            recommendations = await recommendation_store.save(user_id, version, recommendations, source="local")
+        run_in_background(enrich_recommendations(user_id, user_profile, recommendations))
         
-        # Save recommendations
-        for rec_data in recommendations:
-            rec = AIRecommendation(**rec_data)
-            await db.ai_recommendations.insert_one(rec.dict())
-        
-        return {"recommendations": recommendations}
+        return {"recommendations": recommendations, "version": version}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
 
+async def enrich_recommendations(user_id: str, user_profile: Dict[str, Any], candidates: List[Dict[str, Any]]):
+    """Have the LLM re-rank local recommendations and store the result"""
+    # Compact, budget-capped summary instead of the raw profile and activity documents
+    summary = dict(await learner_summaries.get_summary(user_id, user_profile))
+    learning_history = summary.pop("recent_activity")
+    
+    recommendations = await ai_service.generate_personalized_recommendations(
+        user_id=user_id,
+        user_progress=summary,
+        learning_history=learning_history,
+        candidates=candidates
+    )
+    
+    # Replace the local set for the same profile version; a failed LLM call keeps it
+    if recommendations:
+        await recommendation_store.save(user_id, user_profile.get("recommendations_version", 0), recommendations)
+
 @api_router.post("/ai/learning-path/{user_id}")
 async def create_learning_path(user_id: str, goals: List[str], available_time: int = 30):
     """Create a personalized learning path"""
@@ -232,19 +571,29 @@ async def create_learning_path(user_id: str, goals: List[str], available_time: i
             user_id=user_id,
             goals=goals,
             current_level=user_profile.get("level", 1),
-            available_time=available_time
+            available_time=available_time,
+            lessons=learning_paths.candidate_lessons(user_profile.get("lessons_completed", []))
         )
         
-        # Save learning path
+        # Save learning path, with progress tracking over the lessons it recommends
         if learning_path:
-            path = LearningPath(**learning_path)
-            await db.learning_paths.insert_one(path.dict())
+            path = learning_paths.prepare(
+                LearningPath(**learning_path).dict(), user_profile.get("lessons_completed", [])
+            )
+            await db.learning_paths.insert_one(dict(path))
+            learning_path = path
         
         return {"learning_path": learning_path}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating learning path: {str(e)}")
 
+@api_router.get("/users/{user_id}/learning-paths", response_model=List[LearningPath])
+async def get_active_learning_paths(user_id: str):
+    """Get the user's active learning paths with their progress"""
+    paths = await learning_paths.get_active(user_id)
+    return [LearningPath(**path) for path in paths]
+
 # ==================== GAMIFICATION ENDPOINTS ====================
 
 @api_router.get("/achievements")
@@ -253,6 +602,11 @@ async def get_all_achievements():
     achievements = await db.achievements.find({"is_active": True}).to_list(None)
     return achievements
 
+@api_router.get("/users/{user_id}/reviews/due")
+async def get_due_reviews(user_id: str, limit: int = 20):
+    """Get the user's most overdue review questions"""
+    return await review_scheduler.get_due(user_id, limit=min(max(limit, 1), 100))
+
 @api_router.get("/users/{user_id}/achievements")
 async def get_user_achievements(user_id: str):
     """Get user's earned achievements"""
@@ -343,6 +697,16 @@ async def add_discussion_reply(
     )
     return reply
 
+@api_router.get("/discussions/{discussion_id}/replies")
+async def get_discussion_replies(discussion_id: str, cursor: Optional[str] = None, limit: int = 200):
+    """Get the reply thread for a discussion as a nested tree"""
+    thread = await community_service.get_reply_thread(
+        discussion_id=discussion_id,
+        cursor=cursor,
+        limit=min(max(limit, 1), 1000)
+    )
+    return thread
+
 @api_router.post("/discussions/{discussion_id}/vote")
 async def vote_on_discussion(discussion_id: str, user_id: str, vote_type: str):
     """Vote on a discussion"""
@@ -437,37 +801,54 @@ async def join_study_group(group_id: str, user_id: str, invitation_code: Optiona
 
 @api_router.get("/users/{user_id}/progress")
 async def get_user_progress(user_id: str):
-    """Get detailed user progress analytics"""
+    """Get a user's progress summary
     
-    # Get overall progress
-    user_profile = await db.user_profiles.find_one({"id": user_id})
-    if not user_profile:
+    Per-lesson rows and the full activity feed are served by the paginated
+    /progress/lessons and /progress/activities endpoints.
+    """
+    summary = await progress_analytics.get_summary(user_id)
+    if not summary:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    # Get lesson progress
-    lesson_progress = await db.user_progress.find({"user_id": user_id}).to_list(None)
-    
-    # Get recent activities
-    recent_activities = await db.user_activities.find(
-        {"user_id": user_id}
-    ).sort("created_at", -1).limit(10).to_list(None)
-    
-    # Calculate statistics
-    total_lessons_completed = len(user_profile.get("lessons_completed", []))
-    total_topics_completed = len(user_profile.get("topics_completed", []))
-    
-    return {
-        "profile": user_profile,
-        "lesson_progress": lesson_progress,
-        "recent_activities": recent_activities,
-        "statistics": {
-            "total_lessons_completed": total_lessons_completed,
-            "total_topics_completed": total_topics_completed,
-            "total_xp": user_profile.get("total_xp", 0),
-            "current_streak": user_profile.get("current_streak", 0),
-            "longest_streak": user_profile.get("longest_streak", 0)
-        }
-    }
+    return summary
+
+@api_router.get("/users/{user_id}/progress/lessons")
+async def get_user_lesson_progress(user_id: str, cursor: Optional[str] = None,
+                                   limit: int = 50, topic_id: Optional[str] = None):
+    """Get a user's per-lesson progress, most recent first"""
+    try:
+        return await progress_analytics.get_lesson_progress(
+            user_id, cursor=cursor, limit=min(max(limit, 1), 200), topic_id=topic_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/users/{user_id}/progress/activities")
+async def get_user_activity_feed(user_id: str, cursor: Optional[str] = None, limit: int = 50):
+    """Get a user's activity feed, newest first"""
+    try:
+        return await progress_analytics.get_activities(user_id, cursor=cursor, limit=min(max(limit, 1), 200))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/admin/analytics/daily")
+async def get_daily_analytics(start: date, end: date, topic_id: Optional[str] = None,
+                              activity_type: Optional[str] = None):
+    """Get daily activity counts, XP, distinct users and score/time quantiles from the rollup cubes"""
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days > 366:
+        raise HTTPException(status_code=400, detail="Date range is limited to one year")
+    return await analytics_rollup.query(start, end, topic_id=topic_id, activity_type=activity_type)
+
+@api_router.get("/admin/events/stats")
+async def get_event_bus_stats():
+    """Get event bus consumer offsets and outbox dispatch counts"""
+    return {**event_bus.get_stats(), "outbox": progress_outbox.get_stats()}
+
+@api_router.post("/admin/analytics/rollup")
+async def run_analytics_rollup():
+    """Fold activities recorded since the last rollup into the cubes now"""
+    return await analytics_rollup.run()
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -488,6 +869,36 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_services():
+    await curriculum.start()
+    await community_service.ensure_indexes()
+    await author_snapshots.ensure_indexes()
+    await author_snapshots.resume_pending_jobs()
+    await ai_service.cache.ensure_indexes()
+    await question_pool.ensure_indexes()
+    await question_deduplicator.ensure_indexes()
+    await recommendation_store.ensure_indexes()
+    await review_scheduler.ensure_indexes()
+    await progress_service.ensure_indexes()
+    await progress_analytics.ensure_indexes()
+    await learning_paths.ensure_indexes()
+    await analytics_rollup.ensure_indexes()
+    await event_bus.ensure_indexes()
+    await gamification_service.ensure_indexes()
+    await progress_outbox.ensure_indexes()
+    await question_pool.start()
+    await response_log.start()
+    await analytics_rollup.start()
+    await event_bus.start()
+    await progress_outbox.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await question_pool.stop()
+    await response_log.stop()
+    await analytics_rollup.stop()
+    await event_bus.stop()
+    await progress_outbox.stop()
+    await curriculum.stop()
     client.close()
\ No newline at end of file
@@ -0,0 +1,219 @@
+from typing import Dict, List, Any, Optional, Callable, Awaitable
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+
+class Consumer:
+    """A derived view fed by the bus, with its own offset and batch size"""
+
+    def __init__(self, name: str, handler: Handler, batch_size: int):
+        self.name = name
+        self.handler = handler
+        self.batch_size = batch_size
+        self.offset: Optional[Any] = None
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {"events": 0, "batches": 0, "failures": 0}
+
+
+class EventBus:
+    """Feeds derived views from an append-only collection of primary records
+
+    Request handlers only insert the primary record (e.g. a ``user_activities``
+    document); each registered consumer reads new records after its own offset in
+    micro-batches and updates its view. Offsets are (created_at, id) keysets stored in
+    ``event_offsets`` after every batch, so consumers resume where they stopped and
+    delivery is at-least-once. A consumer without a stored offset starts at the
+    current tail: records already written were applied before it existed.
+
+    Where Mongo change streams are available (replica sets) an insert wakes the
+    consumers immediately; otherwise they poll every ``poll_interval`` seconds.
+    Records younger than ``settle_seconds`` are left for the next batch so writes
+    that commit slightly out of timestamp order are not skipped.
+    """
+
+    def __init__(self, db, collection_name: str = "user_activities", poll_interval: float = 1.0,
+                 settle_seconds: float = 2.0):
+        self.collection = db[collection_name]
+        self.offsets_collection = db.event_offsets
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.consumers: Dict[str, Consumer] = {}
+        self.change_streams = False
+        self._watcher: Optional[asyncio.Task] = None
+
+    def register(self, name: str, handler: Handler, batch_size: int = 500):
+        """Register a consumer; must be called before ``start``"""
+        self.consumers[name] = Consumer(name, handler, batch_size)
+
+    def publish(self, record: Dict[str, Any]):
+        """Tell consumers a record was written on this process's write path"""
+        self._notify()
+
+    async def ensure_indexes(self):
+        """Create the index backing offset scans"""
+        await self.collection.create_index([("created_at", 1), ("id", 1)])
+
+    async def start(self):
+        for consumer in self.consumers.values():
+            consumer.offset = await self._load_offset(consumer.name)
+            consumer.task = asyncio.create_task(self._run(consumer))
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        tasks = [c.task for c in self.consumers.values() if c.task] + ([self._watcher] if self._watcher else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def drain(self, name: Optional[str] = None) -> int:
+        """Run consumers until they are caught up; returns the number of records applied"""
+        applied = 0
+        for consumer in self.consumers.values():
+            if name and consumer.name != name:
+                continue
+            while True:
+                count = await self._consume_batch(consumer, settled=False)
+                applied += count
+                if count < consumer.batch_size:
+                    break
+        return applied
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "change_streams": self.change_streams,
+            "consumers": {
+                name: {**consumer.stats, "offset": consumer.offset}
+                for name, consumer in self.consumers.items()
+            }
+        }
+
+    def _notify(self):
+        for consumer in self.consumers.values():
+            consumer.wakeup.set()
+
+    async def _load_offset(self, name: str) -> Optional[Any]:
+        state = await self.offsets_collection.find_one({"_id": name})
+        if not state:
+            tail = await self.collection.find({}, {"_id": 0, "created_at": 1, "id": 1})\
+                .sort([("created_at", -1), ("id", -1)])\
+                .limit(1)\
+                .to_list(None)
+            if not tail:
+                return None
+            # Another process may be seeding the same consumer; the first stored offset wins
+            state = await self.offsets_collection.find_one_and_update(
+                {"_id": name},
+                {"$setOnInsert": {"created_at": tail[0]["created_at"], "id": tail[0]["id"],
+                                  "updated_at": datetime.utcnow()}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        return (state["created_at"], state["id"])
+
+    async def _watch(self):
+        try:
+            async with self.collection.watch([{"$match": {"operationType": "insert"}}]) as stream:
+                self.change_streams = True
+                async for _ in stream:
+                    self._notify()
+        except OperationFailure as e:
+            # Standalone servers have no change streams; consumers keep polling
+            logger.info(f"Change streams unavailable, event consumers will poll: {e}")
+        finally:
+            self.change_streams = False
+
+    async def _run(self, consumer: Consumer):
+        while True:
+            try:
+                count = await self._consume_batch(consumer)
+            except Exception as e:
+                consumer.stats["failures"] += 1
+                logger.error(f"Event consumer {consumer.name} failed: {e}")
+                count = 0
+            if count >= consumer.batch_size:
+                continue
+
+            consumer.wakeup.clear()
+            try:
+                await asyncio.wait_for(consumer.wakeup.wait(), timeout=self.poll_interval)
+                # Give a just-written record time to settle before reading it
+                await asyncio.sleep(self.settle_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _consume_batch(self, consumer: Consumer, settled: bool = True) -> int:
+        query: Dict[str, Any] = {}
+        if consumer.offset is not None:
+            created_at, record_id = consumer.offset
+            query["$or"] = [
+                {"created_at": {"$gt": created_at}},
+                {"created_at": created_at, "id": {"$gt": record_id}}
+            ]
+        if settled:
+            query["created_at"] = {"$lte": datetime.utcnow() - timedelta(seconds=self.settle_seconds)}
+
+        batch = await self.collection.find(query, {"_id": 0})\
+            .sort([("created_at", 1), ("id", 1)])\
+            .limit(consumer.batch_size)\
+            .to_list(None)
+        if not batch:
+            return 0
+
+        await consumer.handler(batch)
+
+        consumer.offset = (batch[-1]["created_at"], batch[-1]["id"])
+        await self.offsets_collection.update_one(
+            {"_id": consumer.name},
+            {"$set": {"created_at": consumer.offset[0], "id": consumer.offset[1], "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        consumer.stats["events"] += len(batch)
+        consumer.stats["batches"] += 1
+        return len(batch)
+
+
+class InMemoryEventBus(EventBus):
+    """Process-local event bus for tests and single-process setups
+
+    Published records are kept in a list and offsets are list positions; nothing is
+    read from or written to Mongo.
+    """
+
+    def __init__(self, poll_interval: float = 1.0):
+        self.poll_interval = poll_interval
+        self.settle_seconds = 0.0
+        self.consumers: Dict[str, Consumer] = {}
+        self.change_streams = False
+        self._watcher = None
+        self.records: List[Dict[str, Any]] = []
+
+    def publish(self, record: Dict[str, Any]):
+        self.records.append(record)
+        self._notify()
+
+    async def ensure_indexes(self):
+        pass
+
+    async def start(self):
+        for consumer in self.consumers.values():
+            consumer.offset = consumer.offset or 0
+            consumer.task = asyncio.create_task(self._run(consumer))
+
+    async def _consume_batch(self, consumer: Consumer, settled: bool = True) -> int:
+        start = consumer.offset or 0
+        batch = self.records[start:start + consumer.batch_size]
+        if not batch:
+            return 0
+        await consumer.handler(batch)
+        consumer.offset = start + len(batch)
+        consumer.stats["events"] += len(batch)
+        consumer.stats["batches"] += 1
+        return len(batch)
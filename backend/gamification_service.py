@@ -4,12 +4,34 @@ from models import (
     Achievement, UserAchievement, AchievementType, LeaderboardEntry, 
     LeaderboardType, Streak, UserProfile, UserActivity
 )
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from levels import LevelTable
+import asyncio
 import uuid
 
+# Profiles updated at once while folding a batch of activities
+TOTALS_CONCURRENCY = 32
+
+def activity_key(activity: Dict[str, Any]) -> str:
+    """Sortable (created_at, id) key of an activity, used as a per-user replay watermark"""
+    return f"{activity['created_at'].strftime('%Y-%m-%dT%H:%M:%S.%f')}|{activity['id']}"
+
 class GamificationService:
-    """Service for managing gamification features like achievements, leaderboards, and streaks"""
+    """Service for managing gamification features like achievements, leaderboards, and streaks
     
-    def __init__(self, db):
+    Profile totals and streaks are derived views: request handlers only record the
+    activity, and ``apply_activity_totals`` / ``apply_streaks`` fold activities into
+    the views in micro-batches as an event bus delivers them. Topic achievements
+    read completed topics through ``progress_service``. Cached ``learner_summaries``
+    are invalidated whenever totals, streaks or achievements change.
+    """
+    
+    def __init__(self, db, event_bus=None, levels: Optional[LevelTable] = None, progress_service=None,
+                 learner_summaries=None):
+        self.event_bus = event_bus
+        self.progress_service = progress_service
+        self.learner_summaries = learner_summaries
+        self.levels = levels or LevelTable.from_config()
         self.db = db
         self.achievements_collection = db.achievements
         self.user_achievements_collection = db.user_achievements
@@ -18,6 +40,42 @@ class GamificationService:
         self.user_profiles_collection = db.user_profiles
         self.user_activities_collection = db.user_activities
     
+    async def ensure_indexes(self):
+        """Unique activity IDs make re-recording an activity under the same ID a no-op
+        
+        A unique (user_id, achievement_id) index keeps concurrent consumers from awarding
+        an achievement twice; duplicates awarded before it existed are removed first.
+        """
+        await self.user_activities_collection.create_index("id", unique=True)
+        try:
+            await self.user_achievements_collection.create_index(
+                [("user_id", 1), ("achievement_id", 1)], unique=True
+            )
+        except OperationFailure as e:
+            if e.code != 11000:
+                raise
+            await self.remove_duplicate_achievements()
+            await self.user_achievements_collection.create_index(
+                [("user_id", 1), ("achievement_id", 1)], unique=True
+            )
+    
+    async def remove_duplicate_achievements(self) -> int:
+        """Keep the earliest award of each (user, achievement); returns the number removed"""
+        duplicates = self.user_achievements_collection.aggregate([
+            {"$sort": {"earned_at": 1}},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "achievement_id": "$achievement_id"},
+                "ids": {"$push": "$_id"},
+                "count": {"$sum": 1}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True)
+        removed = 0
+        async for group in duplicates:
+            result = await self.user_achievements_collection.delete_many({"_id": {"$in": group["ids"][1:]}})
+            removed += result.deleted_count
+        return removed
+    
     async def initialize_default_achievements(self):
         """Initialize default achievement set"""
         default_achievements = [
@@ -164,14 +222,31 @@ class GamificationService:
     
     async def check_and_award_achievements(self, user_id: str, activity_data: Dict[str, Any]):
         """Check if user has earned any new achievements"""
-        user_profile = await self.user_profiles_collection.find_one({"id": user_id})
-        if not user_profile:
+        # Only the sizes of the profile's history arrays are needed, so they stay on the server
+        profiles = await self.user_profiles_collection.aggregate([
+            {"$match": {"id": user_id}},
+            {"$limit": 1},
+            {"$project": {
+                "_id": 0,
+                "current_streak": 1,
+                "total_xp": 1,
+                "lessons_completed_count": {"$size": {"$ifNull": ["$lessons_completed", []]}}
+            }}
+        ]).to_list(None)
+        if not profiles:
             return []
+        user_profile = profiles[0]
         
         all_achievements = await self.achievements_collection.find({"is_active": True}).to_list(None)
         user_achievements = await self.user_achievements_collection.find({"user_id": user_id}).to_list(None)
         earned_achievement_ids = {ua["achievement_id"] for ua in user_achievements}
         
+        # Completed topics come from the per-topic counters, and only when a topic achievement is still open
+        if self.progress_service and any(
+            a["type"] == AchievementType.TOPICS and a["id"] not in earned_achievement_ids for a in all_achievements
+        ):
+            user_profile["topics_completed"] = await self.progress_service.get_completed_topics(user_id)
+        
         new_achievements = []
         
         for achievement in all_achievements:
@@ -185,24 +260,40 @@ class GamificationService:
                     achievement_id=achievement["id"],
                     progress=1.0
                 )
-                await self.user_achievements_collection.insert_one(user_achievement.dict())
+                try:
+                    await self.user_achievements_collection.insert_one(user_achievement.dict())
+                except DuplicateKeyError:
+                    # A concurrent check awarded it first, along with the rewards
+                    continue
                 
                 # Update user profile with rewards
                 await self.user_profiles_collection.update_one(
                     {"id": user_id},
                     {
-                        "$inc": {
-                            "total_xp": achievement.get("reward_xp", 0),
-                            "total_gems": achievement.get("reward_gems", 0)
-                        },
+                        "$inc": {"recommendations_version": 1},
                         "$push": {"achievements": achievement["id"]}
                     }
                 )
+                # Reward XP and gems reach the profile, and its level, through the activity totals
+                await self.record_user_activity(
+                    user_id=user_id,
+                    activity_type="achievement_earned",
+                    content_id=achievement["id"],
+                    xp_earned=achievement.get("reward_xp", 0),
+                    gems_earned=achievement.get("reward_gems", 0),
+                    activity_id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"{user_id}/achievement/{achievement['id']}"))
+                )
                 
                 new_achievements.append(achievement)
         
+        if new_achievements:
+            self._invalidate_summary(user_id)
         return new_achievements
     
+    def _invalidate_summary(self, user_id: str):
+        if self.learner_summaries:
+            self.learner_summaries.invalidate(user_id)
+    
     async def _check_achievement_requirement(self, user_profile: Dict, achievement: Dict, activity_data: Dict) -> bool:
         """Check if user meets achievement requirements"""
         requirement = achievement["requirement"]
@@ -211,7 +302,7 @@ class GamificationService:
             return user_profile.get("current_streak", 0) >= requirement.get("streak_days", 0)
         
         elif achievement["type"] == AchievementType.LESSONS:
-            return len(user_profile.get("lessons_completed", [])) >= requirement.get("lessons_completed", 0)
+            return user_profile.get("lessons_completed_count", 0) >= requirement.get("lessons_completed", 0)
         
         elif achievement["type"] == AchievementType.XP:
             return user_profile.get("total_xp", 0) >= requirement.get("total_xp", 0)
@@ -237,9 +328,10 @@ class GamificationService:
         
         return False
     
-    async def update_streak(self, user_id: str) -> Dict[str, Any]:
-        """Update user's learning streak"""
-        today = datetime.utcnow().date()
+    async def update_streak(self, user_id: str, activity_time: Optional[datetime] = None) -> Dict[str, Any]:
+        """Update user's learning streak for an activity at ``activity_time`` (default now)"""
+        activity_time = activity_time or datetime.utcnow()
+        today = activity_time.date()
         
         # Get current streak record
         streak_record = await self.streaks_collection.find_one({"user_id": user_id})
@@ -250,15 +342,15 @@ class GamificationService:
                 user_id=user_id,
                 current_streak=1,
                 longest_streak=1,
-                last_activity_date=datetime.utcnow()
+                last_activity_date=activity_time
             )
             await self.streaks_collection.insert_one(streak.dict())
             streak_record = streak.dict()
         else:
             last_activity = streak_record["last_activity_date"].date()
             
-            if last_activity == today:
-                # Already counted today
+            if last_activity >= today:
+                # Already counted today (or a replayed, older activity)
                 return streak_record
             elif last_activity == today - timedelta(days=1):
                 # Consecutive day - extend streak
@@ -271,7 +363,7 @@ class GamificationService:
                         "$set": {
                             "current_streak": new_streak,
                             "longest_streak": longest_streak,
-                            "last_activity_date": datetime.utcnow()
+                            "last_activity_date": activity_time
                         }
                     }
                 )
@@ -284,7 +376,7 @@ class GamificationService:
                     {
                         "$set": {
                             "current_streak": 1,
-                            "last_activity_date": datetime.utcnow()
+                            "last_activity_date": activity_time
                         }
                     }
                 )
@@ -394,10 +486,17 @@ class GamificationService:
     
     async def record_user_activity(self, user_id: str, activity_type: str, 
                                  content_id: str = None, xp_earned: int = 0, 
-                                 gems_earned: int = 0, metadata: Dict[str, Any] = None):
-        """Record user activity for analytics and gamification"""
+                                 gems_earned: int = 0, metadata: Dict[str, Any] = None,
+                                 activity_id: Optional[str] = None):
+        """Record user activity for analytics and gamification
+        
+        Passing a stable ``activity_id`` makes a retried call record the activity only once.
+        ``created_at`` is always the insert time, which is what event bus and rollup
+        offsets follow; when the activity happened earlier, callers put that in ``metadata``.
+        """
         
         activity = UserActivity(
+            id=activity_id or str(uuid.uuid4()),
             user_id=user_id,
             activity_type=activity_type,
             content_id=content_id,
@@ -406,21 +505,108 @@ class GamificationService:
             metadata=metadata or {}
         )
         
-        await self.user_activities_collection.insert_one(activity.dict())
+        activity_data = activity.dict()
+        try:
+            await self.user_activities_collection.insert_one(activity_data)
+        except DuplicateKeyError:
+            return
         
-        # Update user profile totals
-        await self.user_profiles_collection.update_one(
-            {"id": user_id},
-            {
-                "$inc": {
-                    "total_xp": xp_earned,
-                    "total_gems": gems_earned
-                },
-                "$set": {
-                    "last_activity": datetime.utcnow()
-                }
-            }
-        )
+        # Profile totals and streaks are updated by the event bus consumers
+        if self.event_bus:
+            self.event_bus.publish(activity_data)
+    
+    async def apply_activity_totals(self, activities: List[Dict[str, Any]]):
+        """Event bus consumer: fold a batch of activities into profile XP, gems, level and last activity
+        
+        Each profile stores the key of the last activity applied to it, and only
+        activities after that key are counted, so a batch redelivered after a crash
+        (even one mixing applied and new activities) is not counted twice.
+        """
+        per_user: Dict[str, List[Dict[str, Any]]] = {}
+        for activity in activities:
+            per_user.setdefault(activity["user_id"], []).append(activity)
+        
+        profiles = await self.user_profiles_collection.find(
+            {"id": {"$in": list(per_user)}}, {"_id": 0, "id": 1, "activity_offset": 1}
+        ).to_list(None)
+        offsets = {profile["id"]: profile.get("activity_offset") for profile in profiles}
+        
+        semaphore = asyncio.Semaphore(TOTALS_CONCURRENCY)
+        
+        async def apply(user_id: str, user_activities: List[Dict[str, Any]]):
+            async with semaphore:
+                await self._apply_totals(user_id, user_activities, offsets[user_id])
+        
+        await asyncio.gather(*(
+            apply(user_id, user_activities)
+            for user_id, user_activities in per_user.items() if user_id in offsets
+        ))
+        
+        # XP achievements depend on the totals just applied
+        for user_id in per_user:
+            await self.check_and_award_achievements(user_id, {})
+    
+    async def _apply_totals(self, user_id: str, activities: List[Dict[str, Any]], offset: Optional[str]):
+        while True:
+            new = [a for a in activities if offset is None or activity_key(a) > offset]
+            if not new:
+                return
+            xp = sum(a.get("xp_earned", 0) for a in new)
+            gems = sum(a.get("gems_earned", 0) for a in new)
+            # Matching on the offset that was read makes a concurrent update to the profile a retry
+            profile = await self.user_profiles_collection.find_one_and_update(
+                {"id": user_id, "activity_offset": offset},
+                [
+                    {"$set": {
+                        "total_xp": {"$add": [{"$ifNull": ["$total_xp", 0]}, xp]},
+                        "total_gems": {"$add": [{"$ifNull": ["$total_gems", 0]}, gems]},
+                        "last_activity": {"$max": ["$last_activity", max(a["created_at"] for a in new)]},
+                        "activity_offset": {"$literal": activity_key(new[-1])}
+                    }},
+                    # The level is derived from the new total in the same update
+                    {"$set": {"level": self.levels.level_expression("$total_xp")}}
+                ],
+                projection={"_id": 0, "total_xp": 1}
+            )
+            if profile:
+                break
+            current = await self.user_profiles_collection.find_one({"id": user_id}, {"_id": 0, "activity_offset": 1})
+            if not current:
+                return
+            offset = current.get("activity_offset")
+        self._invalidate_summary(user_id)
+        if xp <= 0:
+            return
+        
+        # Both levels follow from the total before the update, so detecting a level-up
+        # needs no read; a batch that crosses several levels records each of them
+        previous_total = profile.get("total_xp") or 0
+        level = self.levels.level_for(previous_total + xp)
+        previous_level = self.levels.level_for(previous_total)
+        for reached in range(previous_level + 1, level + 1):
+            await self.record_user_activity(
+                user_id=user_id,
+                activity_type="level_up",
+                metadata={"level": reached, "previous_level": reached - 1},
+                activity_id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"{user_id}/level/{reached}"))
+            )
+    
+    async def apply_streaks(self, activities: List[Dict[str, Any]]):
+        """Event bus consumer: extend streaks for each distinct day a user completed a lesson"""
+        days: Dict[str, Dict[Any, datetime]] = {}
+        for activity in activities:
+            if activity["activity_type"] != "lesson_completed":
+                continue
+            # Activities arrive oldest first; keep the first one of each day. A completion
+            # applied late still counts for the day the lesson was completed.
+            moment = activity.get("metadata", {}).get("completed_at") or activity["created_at"]
+            days.setdefault(activity["user_id"], {}).setdefault(moment.date(), moment)
+        
+        for user_id, moments in days.items():
+            for moment in moments.values():
+                await self.update_streak(user_id, moment)
+            self._invalidate_summary(user_id)
+            await self.check_and_award_achievements(user_id, {})
     
     async def get_user_achievements(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all achievements earned by user"""
@@ -0,0 +1,92 @@
+from typing import Dict, Any, Optional
+from datetime import datetime, timedelta
+
+HEART_FIELDS = {"_id": 0, "hearts": 1, "max_hearts": 1, "last_heart_refill": 1}
+
+
+def refill_hearts(profile: Dict[str, Any], refill_seconds: int, now: datetime) -> Dict[str, Any]:
+    """Hearts as of ``now``: one heart regenerates per ``refill_seconds`` since ``last_heart_refill``
+
+    Pure computation on a profile dict, used on reads so they never write.
+    """
+    hearts = profile.get("hearts", 0)
+    max_hearts = profile.get("max_hearts", 0)
+    last_refill = profile.get("last_heart_refill") or now
+
+    if hearts >= max_hearts:
+        return {"hearts": hearts, "max_hearts": max_hearts, "last_heart_refill": last_refill, "next_heart_at": None}
+
+    refills = int(max((now - last_refill).total_seconds(), 0) // refill_seconds)
+    hearts = min(max_hearts, hearts + refills)
+    if hearts >= max_hearts:
+        return {"hearts": hearts, "max_hearts": max_hearts, "last_heart_refill": last_refill, "next_heart_at": None}
+    last_refill = last_refill + timedelta(seconds=refills * refill_seconds)
+    return {
+        "hearts": hearts,
+        "max_hearts": max_hearts,
+        "last_heart_refill": last_refill,
+        "next_heart_at": last_refill + timedelta(seconds=refill_seconds)
+    }
+
+
+class HeartsService:
+    """Hearts that regenerate lazily, without timers or refill scans
+
+    The stored ``hearts`` count is only accurate as of ``last_heart_refill``; the
+    current count is derived from the elapsed time whenever a profile is read.
+    Spending a heart applies the pending refill and the decrement in one conditional
+    pipeline update, so concurrent spends can never take the count below zero.
+    """
+
+    def __init__(self, db, refill_seconds: int = 30 * 60):
+        self.user_profiles_collection = db.user_profiles
+        self.refill_seconds = refill_seconds
+
+    def current(self, profile: Dict[str, Any], now: Optional[datetime] = None) -> Dict[str, Any]:
+        return refill_hearts(profile, self.refill_seconds, now or datetime.utcnow())
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Current hearts and the time the next one regenerates; None if no such user"""
+        profile = await self.user_profiles_collection.find_one({"id": user_id}, HEART_FIELDS)
+        return self.current(profile) if profile else None
+
+    async def spend(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Spend one heart; returns the hearts left, or None if the user has none (or does not exist)"""
+        now = datetime.utcnow()
+        refill_ms = self.refill_seconds * 1000
+        refills = {"$floor": {"$divide": [
+            {"$max": [{"$subtract": [now, {"$ifNull": ["$last_heart_refill", now]}]}, 0]}, refill_ms
+        ]}}
+        refilled = {"$min": ["$max_hearts", {"$add": ["$hearts", refills]}]}
+
+        # Written with operators mongomock also evaluates, so the tests run this update:
+        # date + duration as date - (-duration), and $project in place of $unset
+        previous = await self.user_profiles_collection.find_one_and_update(
+            {"id": user_id, "$expr": {"$gt": [refilled, 0]}},
+            [
+                # Expressions in one stage all read the document as it was before the update
+                {"$set": {"_refills": refills, "_hearts": refilled}},
+                {"$set": {
+                    "hearts": {"$subtract": ["$_hearts", 1]},
+                    # Spending from full starts the refill clock now; otherwise whole
+                    # refill periods are consumed and the partial one carries over
+                    "last_heart_refill": {"$cond": [
+                        {"$gte": ["$_hearts", "$max_hearts"]},
+                        now,
+                        {"$subtract": [{"$ifNull": ["$last_heart_refill", now]}, {"$multiply": ["$_refills", -refill_ms]}]}
+                    ]}
+                }},
+                {"$project": {"_refills": 0, "_hearts": 0}}
+            ],
+            projection=HEART_FIELDS
+        )
+        if not previous:
+            return None
+        # The stored result follows from the profile before the update, without another read
+        refilled_profile = self.current(previous, now)
+        return self.current({
+            "hearts": refilled_profile["hearts"] - 1,
+            "max_hearts": refilled_profile["max_hearts"],
+            "last_heart_refill": (now if refilled_profile["hearts"] >= refilled_profile["max_hearts"]
+                                  else refilled_profile["last_heart_refill"])
+        }, now)
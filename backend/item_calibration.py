@@ -0,0 +1,312 @@
+from typing import Dict, List, Any
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from response_log import ResponseLog
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Ability axis is discretized into bins; per-bin (answers, correct) counts are the
+# sufficient statistics each item is fitted from, so refits never re-read old responses
+ABILITY_BINS = 24
+ABILITY_RANGE = 4.0
+BIN_CENTERS = np.linspace(-ABILITY_RANGE, ABILITY_RANGE, ABILITY_BINS + 1)[:-1] + ABILITY_RANGE / ABILITY_BINS
+
+# Ridge prior pulling fits towards discrimination 1, difficulty 0 when data is thin
+PRIOR_WEIGHT = 1.0
+NEWTON_ITERATIONS = 25
+
+MIN_RESPONSES = 30
+TOO_HARD_ACCURACY = 0.05
+TOO_EASY_ACCURACY = 0.98
+MIN_DISCRIMINATION = 0.3
+
+CHECKPOINT_ID = "irt"
+
+# Batch keys kept on each ability and item document; only the file being read can be replayed
+APPLIED_BATCHES_KEPT = 20
+
+
+def ability_from_counts(answers: np.ndarray, correct: np.ndarray) -> np.ndarray:
+    """Smoothed logit of each learner's accuracy"""
+    p = (correct + 1.0) / (answers + 2.0)
+    return np.clip(np.log(p / (1.0 - p)), -ABILITY_RANGE, ABILITY_RANGE)
+
+
+def ability_bins(theta: np.ndarray) -> np.ndarray:
+    scaled = (theta + ABILITY_RANGE) / (2 * ABILITY_RANGE) * ABILITY_BINS
+    return np.clip(scaled.astype(np.int64), 0, ABILITY_BINS - 1)
+
+
+def fit_2pl(bin_answers: np.ndarray, bin_correct: np.ndarray):
+    """Fit 2PL items from binned counts (items x bins); returns (discrimination, difficulty)
+
+    Solves every item's penalized logistic regression logit P = a * theta + c at once
+    with Newton steps on the per-item 2x2 system; difficulty is -c / a.
+    """
+    n_items = bin_answers.shape[0]
+    a = np.ones(n_items)
+    c = np.zeros(n_items)
+    x = BIN_CENTERS
+
+    for _ in range(NEWTON_ITERATIONS):
+        p = 1.0 / (1.0 + np.exp(-(a[:, None] * x + c[:, None])))
+        residual = bin_correct - bin_answers * p
+        weight = bin_answers * p * (1.0 - p)
+
+        grad_a = (residual * x).sum(axis=1) - PRIOR_WEIGHT * (a - 1.0)
+        grad_c = residual.sum(axis=1) - PRIOR_WEIGHT * c
+        h_aa = (weight * x * x).sum(axis=1) + PRIOR_WEIGHT
+        h_ac = (weight * x).sum(axis=1)
+        h_cc = weight.sum(axis=1) + PRIOR_WEIGHT
+
+        det = h_aa * h_cc - h_ac * h_ac
+        step_a = (h_cc * grad_a - h_ac * grad_c) / det
+        step_c = (h_aa * grad_c - h_ac * grad_a) / det
+        a = np.clip(a + step_a, -4.0, 4.0)
+        c = np.clip(c + step_c, -16.0, 16.0)
+
+    # A near-zero slope makes -c / a meaningless; such items are flagged separately
+    safe_a = np.where(np.abs(a) < 1e-3, 1e-3, a)
+    difficulty = np.clip(-c / safe_a, -ABILITY_RANGE, ABILITY_RANGE)
+    return a, difficulty
+
+
+def flag_items(answers: np.ndarray, correct: np.ndarray, discrimination: np.ndarray) -> List[List[str]]:
+    """Outlier flags per item; items with too few responses are never flagged"""
+    accuracy = correct / np.maximum(answers, 1)
+    enough = answers >= MIN_RESPONSES
+    checks = {
+        "too_hard": enough & (accuracy < TOO_HARD_ACCURACY),
+        "too_easy": enough & (accuracy > TOO_EASY_ACCURACY),
+        "low_discrimination": enough & (discrimination < MIN_DISCRIMINATION),
+    }
+    return [[name for name, mask in checks.items() if mask[i]] for i in range(len(answers))]
+
+
+def difficulty_scale(difficulty: np.ndarray) -> np.ndarray:
+    """Map IRT difficulty (logits) onto the 1-5 ``Question.difficulty`` scale"""
+    return np.clip(np.round(3 + difficulty), 1, 5).astype(int)
+
+
+class ItemCalibrator:
+    """Incremental 2PL calibration of question difficulty from the response log
+
+    Each run reads only log files (or row groups of compacted files) it has not
+    processed before, in record batches; processed file names are checkpointed per
+    day partition, so rows flushed late into an earlier day are still picked up.
+    Days before yesterday whose files have all been processed are closed and no
+    longer listed. Learner ability is a smoothed accuracy logit kept as running counts
+    in ``irt_abilities``; each response is added to its question's ability-binned
+    counts in ``item_calibration``, which marks the item stale. Stale items are
+    refitted and written back to ``questions``.
+
+    A file is checkpointed as soon as its batches are applied, and every count update
+    is tagged with its batch key and skipped by documents that already carry it, so
+    a run that dies mid-file replays that file without counting it twice.
+    """
+
+    def __init__(self, db, response_log: ResponseLog, batch_size: int = 200000, write_batch: int = 1000):
+        self.db = db
+        self.response_log = response_log
+        self.questions_collection = db.questions
+        self.abilities_collection = db.irt_abilities
+        self.items_collection = db.item_calibration
+        self.state_collection = db.item_calibration_state
+        self.batch_size = batch_size
+        self.write_batch = write_batch
+
+    async def ensure_indexes(self):
+        """Create indexes backing ability and item-statistic lookups"""
+        await self.abilities_collection.create_index("user_id", unique=True)
+        await self.items_collection.create_index("question_id", unique=True)
+        await self.items_collection.create_index("stale", partialFilterExpression={"stale": True})
+
+    async def run(self) -> Dict[str, Any]:
+        """Fold new responses into the item statistics and refit the questions they touch"""
+        states = {
+            doc["day"]: doc
+            async for doc in self.state_collection.find({"checkpoint": CHECKPOINT_ID})
+        }
+        closing_day = (datetime.utcnow().date() - timedelta(days=1)).isoformat()
+        responses = 0
+
+        for day in self.response_log.days():
+            state = states.get(day, {})
+            if state.get("closed"):
+                continue
+            done = set(state.get("files", []))
+            for path in self.response_log.day_files(day):
+                if path.name in done:
+                    continue
+                sources = self.response_log.source_parts(path)
+                # A compacted file holds parts that may already have been read, one row group each
+                row_groups = None if sources is None else [i for i, part in enumerate(sources) if part not in done]
+                if row_groups != []:
+                    for batch_number, batch in enumerate(self.response_log.read_file(
+                        path, columns=["user_id", "question_id", "is_correct"],
+                        row_groups=row_groups, batch_size=self.batch_size
+                    )):
+                        if batch.num_rows == 0:
+                            continue
+                        responses += batch.num_rows
+                        await self._accumulate(batch, f"{day}/{path.name}:{batch_number}")
+                await self._checkpoint(day, {"$addToSet": {"files": {"$each": [path.name] + (sources or [])}}})
+            if day < closing_day:
+                await self._checkpoint(day, {"$set": {"closed": True}})
+
+        refit, flagged = 0, 0
+        question_ids = await self.items_collection.distinct("question_id", {"stale": True})
+        for start in range(0, len(question_ids), self.write_batch):
+            chunk = question_ids[start:start + self.write_batch]
+            flagged += await self._refit(chunk)
+            refit += len(chunk)
+        return {"responses": responses, "questions_refit": refit, "flagged": flagged}
+
+    async def _checkpoint(self, day: str, update: Dict[str, Any]):
+        update.setdefault("$set", {}).update({"checkpoint": CHECKPOINT_ID, "day": day, "updated_at": datetime.utcnow()})
+        await self.state_collection.update_one({"_id": f"{CHECKPOINT_ID}:{day}"}, update, upsert=True)
+
+    @staticmethod
+    async def _bulk_write_once(collection, operations: List[UpdateOne]):
+        """Bulk write whose updates filter out documents already carrying the batch key
+
+        An upsert of such a document hits the unique index and is ignored.
+        """
+        try:
+            await collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+    async def _accumulate(self, batch, batch_key: str):
+        user_ids, user_rows = np.unique(
+            batch.column("user_id").to_numpy(zero_copy_only=False), return_inverse=True
+        )
+        question_ids, question_rows = np.unique(
+            batch.column("question_id").to_numpy(zero_copy_only=False), return_inverse=True
+        )
+        is_correct = batch.column("is_correct").to_numpy(zero_copy_only=False).astype(np.float64)
+        not_applied = {"applied_batches": {"$ne": batch_key}}
+        mark_applied = {"applied_batches": {"$each": [batch_key], "$slice": -APPLIED_BATCHES_KEPT}}
+
+        # Update running learner counts, then read back their totals
+        user_answers = np.bincount(user_rows, minlength=len(user_ids))
+        user_correct = np.bincount(user_rows, weights=is_correct, minlength=len(user_ids))
+        await self._bulk_write_once(self.abilities_collection, [
+            UpdateOne(
+                {"user_id": user_id, **not_applied},
+                {
+                    "$inc": {"answers": int(user_answers[i]), "correct": int(user_correct[i])},
+                    "$push": mark_applied
+                },
+                upsert=True
+            )
+            for i, user_id in enumerate(user_ids)
+        ])
+
+        totals = {}
+        for start in range(0, len(user_ids), self.write_batch):
+            async for doc in self.abilities_collection.find(
+                {"user_id": {"$in": user_ids[start:start + self.write_batch].tolist()}},
+                {"_id": 0, "user_id": 1, "answers": 1, "correct": 1}
+            ):
+                totals[doc["user_id"]] = (doc["answers"], doc["correct"])
+        total_answers = np.array([totals[u][0] for u in user_ids], dtype=np.float64)
+        total_correct = np.array([totals[u][1] for u in user_ids], dtype=np.float64)
+        # Leave the answer itself out of the learner's ability, otherwise every item
+        # looks more discriminating than it is
+        theta = ability_from_counts(total_answers[user_rows] - 1, total_correct[user_rows] - is_correct)
+
+        # Per-question, per-ability-bin counts for this batch
+        cell = question_rows * ABILITY_BINS + ability_bins(theta)
+        size = len(question_ids) * ABILITY_BINS
+        answers = np.bincount(cell, minlength=size).reshape(len(question_ids), ABILITY_BINS)
+        correct = np.bincount(cell, weights=is_correct, minlength=size).reshape(len(question_ids), ABILITY_BINS)
+
+        # Bin arrays must exist before their elements can be incremented
+        await self.items_collection.bulk_write([
+            UpdateOne(
+                {"question_id": question_id},
+                {"$setOnInsert": {"bin_answers": [0] * ABILITY_BINS, "bin_correct": [0] * ABILITY_BINS}},
+                upsert=True
+            )
+            for question_id in question_ids.tolist()
+        ], ordered=False)
+        operations = []
+        for i, question_id in enumerate(question_ids.tolist()):
+            bins = np.flatnonzero(answers[i])
+            increments = {f"bin_answers.{b}": int(answers[i, b]) for b in bins}
+            increments.update({f"bin_correct.{b}": int(correct[i, b]) for b in bins})
+            operations.append(UpdateOne(
+                {"question_id": question_id, **not_applied},
+                {"$inc": increments, "$set": {"stale": True}, "$push": mark_applied}
+            ))
+        await self._bulk_write_once(self.items_collection, operations)
+
+    async def _refit(self, question_ids: List[str]) -> int:
+        """Refit stale items from their stored bin counts; returns the number flagged"""
+        stored = {
+            doc["question_id"]: doc
+            async for doc in self.items_collection.find(
+                {"question_id": {"$in": question_ids}},
+                {"_id": 0, "question_id": 1, "bin_answers": 1, "bin_correct": 1}
+            )
+        }
+        question_ids = [q for q in question_ids if q in stored]
+        if not question_ids:
+            return 0
+        bin_answers = np.array([stored[q]["bin_answers"] for q in question_ids], dtype=np.float64)
+        bin_correct = np.array([stored[q]["bin_correct"] for q in question_ids], dtype=np.float64)
+
+        discrimination, difficulty = fit_2pl(bin_answers, bin_correct)
+        answers = bin_answers.sum(axis=1)
+        correct = bin_correct.sum(axis=1)
+        flags = flag_items(answers, correct, discrimination)
+        scaled = difficulty_scale(difficulty)
+        now = datetime.utcnow()
+
+        item_updates, question_updates = [], []
+        for i, question_id in enumerate(question_ids):
+            calibration = {
+                "response_count": int(answers[i]),
+                "calibrated_difficulty": round(float(difficulty[i]), 3),
+                "discrimination": round(float(discrimination[i]), 3),
+                "calibration_flags": flags[i],
+                "calibrated_at": now
+            }
+            item_updates.append(UpdateOne({"question_id": question_id}, {"$set": {**calibration, "stale": False}}))
+            # Hand-set difficulty is only overridden once there is enough evidence
+            if answers[i] >= MIN_RESPONSES:
+                calibration["difficulty"] = int(scaled[i])
+            question_updates.append(UpdateOne({"id": question_id}, {"$set": calibration}))
+
+        await self.items_collection.bulk_write(item_updates, ordered=False)
+        await self.questions_collection.bulk_write(question_updates, ordered=False)
+        return sum(1 for f in flags if f)
+
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    ROOT_DIR = Path(__file__).parent
+    load_dotenv(ROOT_DIR / '.env')
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        calibrator = ItemCalibrator(
+            client[os.environ['DB_NAME']],
+            ResponseLog(os.environ.get('RESPONSE_LOG_DIR', str(ROOT_DIR / 'data' / 'responses')))
+        )
+        await calibrator.ensure_indexes()
+        print(await calibrator.run())
+        client.close()
+
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+from typing import List, Any
+import json
+
+
+class JSONArrayStreamParser:
+    """Incrementally parses a streamed JSON array, emitting each element once it is complete
+
+    Text before the opening bracket (prose, code fences) is ignored. An element that
+    fails to parse is counted in ``errors`` and skipped, so elements already emitted
+    survive output that breaks later on.
+    """
+
+    def __init__(self):
+        self.errors = 0
+        self.finished = False
+        self._started = False
+        self._element: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Consume the next chunk and return the elements it completed"""
+        completed = []
+        for char in chunk:
+            if self.finished:
+                break
+
+            if not self._started:
+                if char == "[":
+                    self._started = True
+                continue
+
+            if self._in_string:
+                self._element.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if self._depth == 0 and char in ",]":
+                # Top-level separator: whatever was buffered is one element
+                self._emit(completed)
+                if char == "]":
+                    self.finished = True
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth < 0:
+                    # Unbalanced closer: drop the element and resynchronise
+                    self._depth = 0
+                    self._element = []
+                    self.errors += 1
+                    continue
+
+            if self._element or not char.isspace():
+                self._element.append(char)
+
+            if self._depth == 0 and char in "}]":
+                self._emit(completed)
+
+        return completed
+
+    def close(self) -> List[Any]:
+        """Flush at end of stream; a truncated trailing element is counted as an error"""
+        completed = []
+        if not self.finished and self._element:
+            if self._depth == 0 and not self._in_string:
+                self._emit(completed)
+            else:
+                self._element = []
+                self.errors += 1
+        self.finished = True
+        return completed
+
+    def _emit(self, completed: List[Any]):
+        text = "".join(self._element).strip()
+        self._element = []
+        if not text:
+            return
+        try:
+            completed.append(json.loads(text))
+        except ValueError:
+            self.errors += 1
+
+
+def parse_json_array(text: str) -> List[Any]:
+    """Parse a JSON array, salvaging the valid elements of malformed output"""
+    parser = JSONArrayStreamParser()
+    elements = parser.feed(text) + parser.close()
+    if not parser.started:
+        raise ValueError("No JSON array found in response")
+    if not elements and parser.errors:
+        raise ValueError(f"All {parser.errors} array elements were malformed")
+    return elements
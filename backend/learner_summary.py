@@ -0,0 +1,148 @@
+from typing import Dict, List, Any, Optional
+from datetime import datetime
+from collections import OrderedDict
+import json
+import math
+import re
+import time
+
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate: words split into ~4-character pieces, digits and symbols counted apart"""
+    return sum(math.ceil(len(piece) / 4) if piece[0].isalpha() else max(1, len(piece) // 3)
+               for piece in _TOKEN_PIECES.findall(text))
+
+
+def profile_fingerprint(user_profile: Dict[str, Any]) -> tuple:
+    """Profile values the summary reports; a summary cached for other values is stale"""
+    return (
+        user_profile.get("level"),
+        user_profile.get("total_xp"),
+        user_profile.get("current_streak"),
+        len(user_profile.get("lessons_completed", [])),
+        len(user_profile.get("topics_completed", [])),
+        len(user_profile.get("achievements", []))
+    )
+
+
+class LearnerSummaryBuilder:
+    """Builds compact, JSON-safe learner summaries for AI prompts
+
+    The summary has a fixed shape (per-topic mastery, weakest lessons, recent
+    activity, streak stats) and is trimmed to ``token_budget``, so prompt size does
+    not grow with the user's tenure. Summaries are cached per user until
+    ``invalidate`` is called, ``max_age`` seconds pass, or the profile passed in
+    no longer matches the one the summary was built from (so updates applied by
+    another worker are picked up too).
+    """
+
+    def __init__(self, db, curriculum, token_budget: int = 400, max_age: int = 3600, cache_size: int = 10000):
+        self.db = db
+        self.curriculum = curriculum
+        self.user_progress_collection = db.user_progress
+        self.user_activities_collection = db.user_activities
+        self.token_budget = token_budget
+        self.max_age = max_age
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def invalidate(self, user_id: str):
+        self._cache.pop(user_id, None)
+
+    async def get_summary(self, user_id: str, user_profile: Dict[str, Any]) -> Dict[str, Any]:
+        fingerprint = profile_fingerprint(user_profile)
+        cached = self._cache.get(user_id)
+        if cached and time.monotonic() - cached[0] < self.max_age and cached[1] == fingerprint:
+            self._cache.move_to_end(user_id)
+            return cached[2]
+
+        summary = await self._build(user_id, user_profile)
+        self._cache[user_id] = (time.monotonic(), fingerprint, summary)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return summary
+
+    async def _build(self, user_id: str, user_profile: Dict[str, Any]) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        snapshot = self.curriculum.snapshot
+
+        facets = await self.user_progress_collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$facet": {
+                "topics": [
+                    {"$group": {
+                        "_id": "$topic_id",
+                        "lessons_done": {"$sum": 1},
+                        "avg_score": {"$avg": "$best_score"},
+                        "time_spent": {"$sum": "$time_spent"}
+                    }}
+                ],
+                "weak_lessons": [
+                    {"$match": {"best_score": {"$lt": 70}}},
+                    {"$sort": {"best_score": 1}},
+                    {"$limit": 5},
+                    {"$project": {"_id": "$lesson_id", "best_score": 1}}
+                ]
+            }}
+        ]).to_list(None)
+        facets = facets[0] if facets else {"topics": [], "weak_lessons": []}
+
+        recent = await self.user_activities_collection.find(
+            {"user_id": user_id},
+            {"_id": 0, "activity_type": 1, "content_id": 1, "metadata.score": 1, "created_at": 1}
+        ).sort("created_at", -1).limit(10).to_list(None)
+
+        topic_totals = snapshot.topic_lesson_count
+        topics = sorted((
+            {
+                "topic": row["_id"],
+                "mastery": round(row["lessons_done"] / topic_totals[row["_id"]], 2) if topic_totals.get(row["_id"]) else None,
+                "lessons_done": row["lessons_done"],
+                "avg_score": round(row["avg_score"]) if row.get("avg_score") is not None else None,
+                "minutes": round((row.get("time_spent") or 0) / 60)
+            }
+            for row in facets["topics"]
+        ), key=lambda t: -(t["lessons_done"]))
+
+        last_activity = user_profile.get("last_activity")
+        summary = {
+            "level": user_profile.get("level", 1),
+            "total_xp": user_profile.get("total_xp", 0),
+            "lessons_completed": len(user_profile.get("lessons_completed", [])),
+            "topics_completed": list(user_profile.get("topics_completed", [])),
+            "achievements": len(user_profile.get("achievements", [])),
+            "streak": {
+                "current": user_profile.get("current_streak", 0),
+                "longest": user_profile.get("longest_streak", 0),
+                "days_since_active": (now - last_activity).days if isinstance(last_activity, datetime) else None
+            },
+            "topics": topics,
+            "weak_lessons": [
+                {"lesson": row["_id"], "best_score": row["best_score"]} for row in facets["weak_lessons"]
+            ],
+            "recent_activity": [
+                {
+                    "type": a.get("activity_type"),
+                    "content": a.get("content_id"),
+                    "score": a.get("metadata", {}).get("score"),
+                    "days_ago": (now - a["created_at"]).days if a.get("created_at") else None
+                }
+                for a in recent
+            ]
+        }
+        return self._fit_budget(summary)
+
+    def _fit_budget(self, summary: Dict[str, Any]) -> Dict[str, Any]:
+        """Drop the least important list entries until the summary fits the token budget"""
+        # Trim order: oldest activity first, then weakest-signal topics, then the latest
+        # completed topics (their mastery is also in ``topics``), then weak lessons
+        trimmable: List[str] = ["recent_activity", "topics", "topics_completed", "weak_lessons"]
+        while estimate_tokens(json.dumps(summary)) > self.token_budget:
+            field: Optional[str] = next((f for f in trimmable if summary[f]), None)
+            if field is None:
+                break
+            summary[field].pop()
+        return summary
@@ -0,0 +1,183 @@
+from typing import Dict, List, Any, Optional
+from datetime import datetime
+from pymongo import UpdateOne
+import logging
+
+# Keys under which generated paths name a lesson in ``recommended_lessons``
+LESSON_ID_KEYS = ("lesson_id", "id", "content_id")
+LESSON_TITLE_KEYS = ("title", "name", "lesson")
+
+# Lessons offered to the model when it generates a path
+PATH_CANDIDATE_LESSONS = 40
+
+
+def path_lesson_ids(recommended_lessons: List[Any], known_lessons,
+                    lesson_titles: Optional[Dict[str, str]] = None) -> List[str]:
+    """Curriculum lesson IDs a path recommends, in path order and without repeats
+
+    Items are matched on their lesson ID, or else on their title when ``lesson_titles``
+    (normalized title -> lesson ID) is given.
+    """
+    lesson_ids: List[str] = []
+    for item in recommended_lessons or []:
+        if isinstance(item, dict):
+            candidates = [item.get(key) for key in LESSON_ID_KEYS]
+            titles = [item.get(key) for key in LESSON_TITLE_KEYS]
+        else:
+            candidates = titles = [item]
+        lesson_id = next((c for c in candidates if isinstance(c, str) and c in known_lessons), None)
+        if lesson_id is None and lesson_titles:
+            lesson_id = next(
+                (lesson_titles[t.strip().lower()] for t in titles
+                 if isinstance(t, str) and t.strip().lower() in lesson_titles),
+                None
+            )
+        if lesson_id and lesson_id not in lesson_ids:
+            lesson_ids.append(lesson_id)
+    return lesson_ids
+
+
+def progress_percentage(lessons_done: int, lessons_total: int) -> float:
+    return round(lessons_done / lessons_total * 100, 1) if lessons_total else 0.0
+
+
+class LearningPathService:
+    """Tracks learning path progress from lesson completions without reading the paths
+
+    Each path stores the curriculum lesson IDs it recommends in ``lesson_ids``; a
+    partial multikey index on (user_id, lesson_ids) over active paths is the reverse
+    index from a completed lesson to the user's paths that contain it. A completion
+    is then one ``update_many`` that bumps ``lessons_done`` and recomputes
+    ``progress`` in a pipeline, whatever the number of active paths.
+    """
+
+    def __init__(self, db, curriculum, batch_size: int = 500):
+        self.learning_paths_collection = db.learning_paths
+        self.user_profiles_collection = db.user_profiles
+        self.curriculum = curriculum
+        self.batch_size = batch_size
+
+    async def ensure_indexes(self):
+        """Create the lesson -> active paths reverse index"""
+        await self.learning_paths_collection.create_index(
+            [("user_id", 1), ("lesson_ids", 1)],
+            partialFilterExpression={"is_active": True}
+        )
+
+    def candidate_lessons(self, lessons_completed: List[str], limit: int = PATH_CANDIDATE_LESSONS) -> List[Dict[str, Any]]:
+        """Lessons a generated path may use: the user's next uncompleted lessons in prerequisite order"""
+        snapshot = self.curriculum.snapshot
+        order = snapshot.topological_order
+        order = order[~snapshot.completed_mask(lessons_completed or [])[order]][:limit]
+        return [
+            {
+                "lesson_id": snapshot.lessons[i]["id"],
+                "title": snapshot.lessons[i].get("title", ""),
+                "topic_id": snapshot.lessons[i].get("topic_id"),
+                "difficulty": snapshot.lessons[i].get("difficulty", 1)
+            }
+            for i in order.tolist()
+        ]
+
+    def prepare(self, path: Dict[str, Any], lessons_completed: List[str]) -> Dict[str, Any]:
+        """Fill a new path's tracking fields, counting lessons the user has already completed"""
+        snapshot = self.curriculum.snapshot
+        lesson_ids = path_lesson_ids(path.get("recommended_lessons"), snapshot.lesson_topic_ids,
+                                     snapshot.lesson_title_ids)
+        completed = set(lessons_completed or [])
+        done = [lesson_id for lesson_id in lesson_ids if lesson_id in completed]
+        path.update({
+            "lesson_ids": lesson_ids,
+            "completed_lesson_ids": done,
+            "lessons_done": len(done),
+            "lessons_total": len(lesson_ids),
+            "progress": progress_percentage(len(done), len(lesson_ids)),
+            "completed_at": datetime.utcnow() if lesson_ids and len(done) == len(lesson_ids) else None
+        })
+        return path
+
+    async def record_lesson_completed(self, user_id: str, lesson_id: str) -> int:
+        """Advance every active path of the user that contains the lesson; returns the number updated
+
+        Paths that already counted the lesson do not match, so repeated completions
+        (and replays of the same completion) are not counted twice.
+        """
+        now = datetime.utcnow()
+        result = await self.learning_paths_collection.update_many(
+            {"user_id": user_id, "lesson_ids": lesson_id, "is_active": True,
+             "completed_lesson_ids": {"$ne": lesson_id}},
+            [
+                {"$set": {
+                    "lessons_done": {"$add": [{"$ifNull": ["$lessons_done", 0]}, 1]},
+                    "completed_lesson_ids": {"$concatArrays": [
+                        {"$ifNull": ["$completed_lesson_ids", []]}, {"$literal": [lesson_id]}
+                    ]},
+                    "updated_at": now
+                }},
+                {"$set": {
+                    # Percentage to one decimal, rounding half up
+                    "progress": {"$divide": [{"$floor": {"$add": [
+                        {"$multiply": [{"$divide": ["$lessons_done", {"$max": ["$lessons_total", 1]}]}, 1000]}, 0.5
+                    ]}}, 10]},
+                    "completed_at": {"$cond": [
+                        {"$gte": ["$lessons_done", "$lessons_total"]},
+                        {"$ifNull": ["$completed_at", now]},
+                        None
+                    ]}
+                }}
+            ]
+        )
+        return result.modified_count
+
+    async def get_active(self, user_id: str) -> List[Dict[str, Any]]:
+        return await self.learning_paths_collection.find(
+            {"user_id": user_id, "is_active": True}, {"_id": 0}
+        ).sort("created_at", -1).to_list(None)
+
+    async def backfill(self) -> Dict[str, int]:
+        """Fill tracking fields on paths created before progress tracking, from each user's completions"""
+        stats = {"paths": 0}
+        operations = []
+        cursor = self.learning_paths_collection.find(
+            {"lesson_ids": {"$exists": False}}, {"_id": 1, "user_id": 1, "recommended_lessons": 1}
+        )
+        async for path in cursor:
+            profile = await self.user_profiles_collection.find_one(
+                {"id": path["user_id"]}, {"_id": 0, "lessons_completed": 1}
+            ) or {}
+            fields = self.prepare({"recommended_lessons": path.get("recommended_lessons")},
+                                  profile.get("lessons_completed", []))
+            fields.pop("recommended_lessons")
+            operations.append(UpdateOne({"_id": path["_id"]}, {"$set": fields}))
+            if len(operations) >= self.batch_size:
+                await self.learning_paths_collection.bulk_write(operations, ordered=False)
+                stats["paths"] += len(operations)
+                operations = []
+        if operations:
+            await self.learning_paths_collection.bulk_write(operations, ordered=False)
+            stats["paths"] += len(operations)
+        return stats
+
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from curriculum import CurriculumService
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        curriculum = CurriculumService(db, refresh_interval=0)
+        await curriculum.refresh()
+        service = LearningPathService(db, curriculum)
+        await service.ensure_indexes()
+        print(await service.backfill())
+        client.close()
+
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+from typing import Dict, List, Any, Optional, Sequence
+from bisect import bisect_right
+from pymongo import UpdateOne
+import logging
+import numpy as np
+
+# Total XP at which each level starts; level 1 starts at 0. Five levels match the
+# 1-5 difficulty scale the recommender and AI prompts compare levels against.
+DEFAULT_LEVEL_THRESHOLDS = "0,500,1500,4000,10000"
+
+
+class LevelTable:
+    """Level curve compiled into a sorted array of XP thresholds
+
+    A user's level is the number of thresholds at or below their total XP, found
+    with ``bisect`` in Python and with the equivalent ``$filter``/``$size`` count in
+    pipeline updates, so the level can be written in the same update as the XP.
+    """
+
+    def __init__(self, thresholds: Sequence[int]):
+        thresholds = [int(t) for t in thresholds]
+        if not thresholds or thresholds[0] != 0:
+            raise ValueError("Level thresholds must start at 0")
+        if any(b <= a for a, b in zip(thresholds, thresholds[1:])):
+            raise ValueError("Level thresholds must be strictly increasing")
+        self.thresholds: List[int] = thresholds
+        self.threshold_array = np.array(thresholds, dtype=np.int64)
+
+    @classmethod
+    def from_config(cls, value: Optional[str] = None) -> "LevelTable":
+        """Parse a comma-separated threshold list such as ``LEVEL_XP_THRESHOLDS``"""
+        return cls([part.strip() for part in (value or DEFAULT_LEVEL_THRESHOLDS).split(",") if part.strip()])
+
+    @property
+    def max_level(self) -> int:
+        return len(self.thresholds)
+
+    def level_for(self, total_xp: int) -> int:
+        return max(bisect_right(self.thresholds, total_xp), 1)
+
+    def levels_for(self, total_xp: np.ndarray) -> np.ndarray:
+        """Vectorized ``level_for``"""
+        return np.maximum(np.searchsorted(self.threshold_array, total_xp, side="right"), 1)
+
+    def level_expression(self, total_xp: Any) -> Dict[str, Any]:
+        """Aggregation expression computing the level of ``total_xp`` on the server"""
+        return {"$max": [1, {"$size": {"$filter": {
+            "input": {"$literal": self.thresholds},
+            "cond": {"$lte": ["$$this", total_xp]}
+        }}}]}
+
+    async def backfill(self, db, batch_size: int = 5000) -> Dict[str, int]:
+        """Recompute every profile's level from its total XP, one vectorized pass per batch"""
+        profiles = db.user_profiles
+        stats = {"profiles": 0, "updated": 0}
+        last_id = None
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            batch = await profiles.find(query, {"_id": 1, "total_xp": 1, "level": 1})\
+                .sort("_id", 1).limit(batch_size).to_list(None)
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+            stats["profiles"] += len(batch)
+
+            total_xp = np.array([doc.get("total_xp") or 0 for doc in batch], dtype=np.int64)
+            stored = np.array([doc.get("level") or 0 for doc in batch], dtype=np.int64)
+            levels = self.levels_for(total_xp)
+            changed = np.flatnonzero(levels != stored)
+            if changed.size:
+                await profiles.bulk_write([
+                    UpdateOne({"_id": batch[i]["_id"]}, {"$set": {"level": int(levels[i])}})
+                    for i in changed
+                ], ordered=False)
+                stats["updated"] += int(changed.size)
+        return stats
+
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        table = LevelTable.from_config(os.environ.get('LEVEL_XP_THRESHOLDS'))
+        print(await table.backfill(client[os.environ['DB_NAME']]))
+        client.close()
+
+    asyncio.run(main())
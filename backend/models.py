@@ -65,6 +65,8 @@ class UserProfile(TimestampMixin):
     preferences: Dict[str, Any] = {}
     achievements: List[str] = []
     is_premium: bool = False
+    recommendations_version: int = 0  # bumped whenever stored recommendations go stale
+    activity_offset: Optional[str] = None  # key of the last activity folded into the totals
 
 class UserProfileCreate(BaseModel):
     username: str
@@ -135,6 +137,10 @@ class Question(TimestampMixin):
     tags: List[str] = []
     is_ai_generated: bool = False
     scenario_context: Optional[str] = None  # For scenario-based questions
+    # Fitted from learner responses by item_calibration.py
+    calibrated_difficulty: Optional[float] = None  # 2PL difficulty in logits
+    discrimination: Optional[float] = None
+    calibration_flags: List[str] = []  # too_hard, too_easy, low_discrimination
     
 class Lesson(TimestampMixin):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -175,18 +181,27 @@ class LearningPath(TimestampMixin):
     difficulty_adjustment: float = 1.0
     estimated_completion: int  # days
     is_active: bool = True
-    progress: float = 0.0
+    progress: float = 0.0  # percentage of lesson_ids completed
+    lesson_ids: List[str] = []  # curriculum lessons among recommended_lessons
+    completed_lesson_ids: List[str] = []
+    lessons_done: int = 0
+    lessons_total: int = 0
+    completed_at: Optional[datetime] = None
 
 class AIRecommendation(TimestampMixin):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     type: str  # lesson, topic, practice, review
     content_id: str
+    title: str = ""
     reason: str
     confidence_score: float
     priority: int = 1
     is_viewed: bool = False
     is_accepted: bool = False
+    source: str = "ai"  # ai, local
+    version: int = 0
+    expires_at: Optional[datetime] = None
 
 class AIGeneratedQuestion(TimestampMixin):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -206,6 +221,8 @@ class Discussion(TimestampMixin):
     content: str
     author_id: str
     author_username: str
+    author_display_name: Optional[str] = None
+    author_avatar_url: Optional[str] = None
     topic_id: Optional[str] = None
     lesson_id: Optional[str] = None
     discussion_type: DiscussionType
@@ -213,6 +230,7 @@ class Discussion(TimestampMixin):
     upvotes: int = 0
     downvotes: int = 0
     reply_count: int = 0
+    hot_score: float = 0.0  # Maintained on every vote/reply, see community_service.compute_hot_score
     is_pinned: bool = False
     is_resolved: bool = False
 
@@ -222,7 +240,11 @@ class DiscussionReply(TimestampMixin):
     content: str
     author_id: str
     author_username: str
+    author_display_name: Optional[str] = None
+    author_avatar_url: Optional[str] = None
     parent_reply_id: Optional[str] = None  # For nested replies
+    path: str = ""  # Materialized path of fixed-width sequence segments, sorts in tree order
+    depth: int = 0
     upvotes: int = 0
     downvotes: int = 0
     is_solution: bool = False
@@ -274,10 +296,11 @@ class UserProgress(TimestampMixin):
     topic_id: str
     status: str = "not_started"  # not_started, in_progress, completed, mastered
     progress_percentage: float = 0.0
-    score: Optional[int] = None
-    time_spent: int = 0  # seconds
+    score: Optional[int] = None  # latest attempt
+    best_score: Optional[int] = None
+    time_spent: int = 0  # seconds, summed over attempts
     attempts: int = 0
-    mastery_level: float = 0.0
+    mastery_level: float = 0.0  # moving average of attempt scores, 0-1
     last_accessed: datetime = Field(default_factory=datetime.utcnow)
 
 class UserActivity(TimestampMixin):
@@ -297,6 +320,7 @@ class QuestionResponse(BaseModel):
     time_taken: int  # seconds
 
 class LessonCompletionRequest(BaseModel):
+    user_id: str = "default_user"
     lesson_id: str
     topic_id: str
     question_responses: List[QuestionResponse]
@@ -304,6 +328,7 @@ class LessonCompletionRequest(BaseModel):
 
 class AIQuestionRequest(BaseModel):
     topic_id: str
+    user_id: Optional[str] = None  # Skips pooled questions this user has already seen
     lesson_id: Optional[str] = None
     difficulty: int = 1
     question_type: QuestionType = QuestionType.MULTIPLE_CHOICE
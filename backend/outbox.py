@@ -0,0 +1,151 @@
+from typing import Dict, Any, Callable, Awaitable
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+import asyncio
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# Retry delays grow as BASE * 2^attempts, capped; after MAX_ATTEMPTS the entry is parked
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 3600
+MAX_ATTEMPTS = 10
+
+
+def new_entry(entry_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Outbox entry to embed in the primary document's ``outbox`` array"""
+    now = datetime.utcnow()
+    return {
+        "id": str(uuid.uuid4()),
+        "type": entry_type,
+        "payload": payload,
+        "attempts": 0,
+        "created_at": now,
+        "next_attempt_at": now
+    }
+
+
+class OutboxDispatcher:
+    """Applies side effects recorded in the ``outbox`` array of primary documents
+
+    The request path writes the primary record and its outbox entry in one
+    single-document update, so either both exist or neither does. This dispatcher
+    finds due entries in batches, claims each one by pushing its ``next_attempt_at``
+    out by ``lease_seconds`` in a conditional update (so concurrent dispatchers never
+    run the same entry at once), runs the handler registered for its type and
+    removes the entry once the handler succeeded. A crash between the two leaves
+    the entry in place, so delivery is at-least-once and handlers must be idempotent
+    (the entry ``id`` is a stable key for that). Failed entries are retried with
+    exponential backoff and parked in ``outbox_dead_letters`` after ``MAX_ATTEMPTS``.
+    """
+
+    def __init__(self, db, collection_name: str, batch_size: int = 100, interval: float = 5.0,
+                 lease_seconds: float = 60.0):
+        self.collection = db[collection_name]
+        self.dead_letters_collection = db.outbox_dead_letters
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.handlers: Dict[str, Handler] = {}
+        self.stats = {"applied": 0, "failed": 0, "dead_lettered": 0, "lost_claims": 0}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def register(self, entry_type: str, handler: Handler):
+        self.handlers[entry_type] = handler
+
+    def notify(self):
+        """Wake the dispatcher after this process wrote an entry"""
+        self._wakeup.set()
+
+    async def ensure_indexes(self):
+        """Create the index the due-entry scan runs on; documents without an outbox are not matched"""
+        await self.collection.create_index("outbox.next_attempt_at")
+
+    async def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _loop(self):
+        while True:
+            try:
+                if await self.run_once() >= self.batch_size:
+                    continue
+            except Exception as e:
+                logger.error(f"Outbox dispatch failed: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self) -> int:
+        """Apply one batch of due entries; returns the number of documents read"""
+        now = datetime.utcnow()
+        docs = await self.collection.find(
+            {"outbox.next_attempt_at": {"$lte": now}},
+            {"_id": 1, "outbox": 1}
+        ).limit(self.batch_size).to_list(None)
+
+        operations = []
+        for doc in docs:
+            for entry in doc["outbox"]:
+                if entry["next_attempt_at"] > now:
+                    continue
+                if not await self._claim(doc["_id"], entry, now):
+                    self.stats["lost_claims"] += 1
+                    continue
+                operations.append(await self._apply(doc["_id"], entry, now))
+
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+        return len(docs)
+
+    async def _claim(self, doc_id: Any, entry: Dict[str, Any], now: datetime) -> bool:
+        """Lease a due entry to this dispatcher; False if another one claimed it first
+
+        A dispatcher that dies mid-handler leaves the entry to be retried once the lease expires.
+        """
+        claimed = await self.collection.find_one_and_update(
+            {"_id": doc_id, "outbox": {"$elemMatch": {"id": entry["id"], "next_attempt_at": {"$lte": now}}}},
+            {"$set": {"outbox.$.next_attempt_at": now + timedelta(seconds=self.lease_seconds)}},
+            projection={"_id": 1}
+        )
+        return claimed is not None
+
+    async def _apply(self, doc_id: Any, entry: Dict[str, Any], now: datetime) -> UpdateOne:
+        try:
+            handler = self.handlers.get(entry["type"])
+            if handler is None:
+                raise ValueError(f"No outbox handler for {entry['type']}")
+            await handler(entry)
+        except Exception as e:
+            self.stats["failed"] += 1
+            attempts = entry.get("attempts", 0) + 1
+            logger.error(f"Outbox entry {entry['id']} failed (attempt {attempts}): {e}")
+            if attempts < MAX_ATTEMPTS:
+                delay = min(RETRY_BASE_SECONDS * 2 ** attempts, RETRY_MAX_SECONDS)
+                return UpdateOne(
+                    {"_id": doc_id, "outbox.id": entry["id"]},
+                    {"$set": {
+                        "outbox.$.attempts": attempts,
+                        "outbox.$.last_error": str(e),
+                        "outbox.$.next_attempt_at": now + timedelta(seconds=delay)
+                    }}
+                )
+            await self.dead_letters_collection.insert_one({
+                **entry, "source_id": doc_id, "attempts": attempts, "last_error": str(e), "parked_at": now
+            })
+            self.stats["dead_lettered"] += 1
+        else:
+            self.stats["applied"] += 1
+        return UpdateOne({"_id": doc_id}, {"$pull": {"outbox": {"id": entry["id"]}}})
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
@@ -0,0 +1,160 @@
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime
+import asyncio
+
+# Profile fields that grow with the user's history; the summary returns their sizes instead
+PROFILE_LIST_FIELDS = ("lessons_completed", "topics_completed", "achievements")
+RECENT_ACTIVITY_LIMIT = 10
+
+# Serialized summary size it must stay within however many lessons a user has done
+SUMMARY_BUDGET_BYTES = 16 * 1024
+
+
+def encode_cursor(moment: datetime, doc_id: str) -> str:
+    return f"{moment.isoformat()}|{doc_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        moment, doc_id = cursor.split("|", 1)
+        return datetime.fromisoformat(moment), doc_id
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+class ProgressAnalytics:
+    """Size-bounded progress summaries and keyset-paginated progress details
+
+    The summary payload does not grow with the number of lessons a user has done:
+    list fields are reported as counts and lesson rows are aggregated per topic.
+    Per-lesson rows and the activity feed are served page by page.
+    """
+
+    def __init__(self, db, curriculum):
+        self.db = db
+        self.curriculum = curriculum
+        self.user_profiles_collection = db.user_profiles
+        self.user_progress_collection = db.user_progress
+        self.user_activities_collection = db.user_activities
+
+    async def ensure_indexes(self):
+        """Create indexes backing the summary aggregation and detail pages"""
+        await self.user_progress_collection.create_index([("user_id", 1), ("last_accessed", -1), ("id", -1)])
+        await self.user_activities_collection.create_index([("user_id", 1), ("created_at", -1), ("id", -1)])
+
+    async def get_summary(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Profile, per-topic progress and recent activity, read concurrently; None if no such user"""
+        profile, facets, recent_activities = await asyncio.gather(
+            self._profile(user_id),
+            self._progress_facets(user_id),
+            self.user_activities_collection.find(
+                {"user_id": user_id}, {"_id": 0}
+            ).sort("created_at", -1).limit(RECENT_ACTIVITY_LIMIT).to_list(None)
+        )
+        if not profile:
+            return None
+
+        topic_totals = self.curriculum.snapshot.topic_lesson_count
+
+        topics = [
+            {
+                "topic_id": row["_id"],
+                "lessons_done": row["lessons_done"],
+                "lessons_total": topic_totals.get(row["_id"]),
+                "completion": round(row["lessons_done"] / topic_totals[row["_id"]], 3)
+                if topic_totals.get(row["_id"]) else None,
+                "average_score": round(row["average_score"], 1) if row.get("average_score") is not None else None,
+                "time_spent": row["time_spent"],
+                "last_accessed": row["last_accessed"]
+            }
+            for row in facets["topics"]
+        ]
+        totals = facets["totals"][0] if facets["totals"] else {}
+
+        return {
+            "profile": profile,
+            "topics": topics,
+            "recent_activities": recent_activities,
+            "statistics": {
+                "total_lessons_completed": profile["lessons_completed_count"],
+                "total_topics_completed": profile["topics_completed_count"],
+                "total_xp": profile.get("total_xp", 0),
+                "current_streak": profile.get("current_streak", 0),
+                "longest_streak": profile.get("longest_streak", 0),
+                "lessons_attempted": totals.get("lessons_attempted", 0),
+                "average_score": round(totals["average_score"], 1) if totals.get("average_score") is not None else None,
+                "time_spent": totals.get("time_spent", 0)
+            }
+        }
+
+    async def _profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        # Project list fields down to their sizes on the server so they never cross the wire
+        exclusions = {"_id": 0, **{field: 0 for field in PROFILE_LIST_FIELDS}}
+        rows = await self.user_profiles_collection.aggregate([
+            {"$match": {"id": user_id}},
+            {"$limit": 1},
+            {"$addFields": {
+                f"{field}_count": {"$size": {"$ifNull": [f"${field}", []]}} for field in PROFILE_LIST_FIELDS
+            }},
+            {"$project": exclusions}
+        ]).to_list(None)
+        return rows[0] if rows else None
+
+    async def _progress_facets(self, user_id: str) -> Dict[str, Any]:
+        rows = await self.user_progress_collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$facet": {
+                "topics": [
+                    {"$group": {
+                        "_id": "$topic_id",
+                        "lessons_done": {"$sum": 1},
+                        "average_score": {"$avg": "$best_score"},
+                        "time_spent": {"$sum": "$time_spent"},
+                        "last_accessed": {"$max": "$last_accessed"}
+                    }},
+                    {"$sort": {"last_accessed": -1}}
+                ],
+                "totals": [
+                    {"$group": {
+                        "_id": None,
+                        "lessons_attempted": {"$sum": 1},
+                        "average_score": {"$avg": "$best_score"},
+                        "time_spent": {"$sum": "$time_spent"}
+                    }}
+                ]
+            }}
+        ]).to_list(None)
+        return rows[0] if rows else {"topics": [], "totals": []}
+
+    async def get_lesson_progress(self, user_id: str, cursor: Optional[str] = None, limit: int = 50,
+                                  topic_id: Optional[str] = None) -> Dict[str, Any]:
+        """Per-lesson progress rows, most recently accessed first"""
+        return await self._page(self.user_progress_collection, "last_accessed", user_id, cursor, limit,
+                                {"topic_id": topic_id} if topic_id else {})
+
+    async def get_activities(self, user_id: str, cursor: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """Activity feed, newest first"""
+        return await self._page(self.user_activities_collection, "created_at", user_id, cursor, limit, {})
+
+    async def _page(self, collection, time_field: str, user_id: str, cursor: Optional[str],
+                    limit: int, extra: Dict[str, Any]) -> Dict[str, Any]:
+        filter_query = {"user_id": user_id, **extra}
+        if cursor:
+            moment, doc_id = decode_cursor(cursor)
+            filter_query["$or"] = [
+                {time_field: {"$lt": moment}},
+                {time_field: moment, "id": {"$lt": doc_id}}
+            ]
+
+        # Pending outbox entries are internal to the progress document
+        items = await collection.find(filter_query, {"_id": 0, "outbox": 0})\
+            .sort([(time_field, -1), ("id", -1)])\
+            .limit(limit + 1)\
+            .to_list(None)
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(items[-1][time_field], items[-1]["id"])
+
+        return {"items": items, "count": len(items), "next_cursor": next_cursor}
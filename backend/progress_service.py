@@ -0,0 +1,327 @@
+from typing import Dict, List, Any, Optional
+from datetime import datetime
+from pymongo import ReturnDocument, UpdateOne, DeleteMany
+from pymongo.errors import OperationFailure, DuplicateKeyError
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest score in the mastery moving average
+MASTERY_ALPHA = 0.4
+# Mastery level from which a lesson counts as mastered rather than completed
+MASTERED_THRESHOLD = 0.9
+# Completion IDs kept per topic counter to recognise replayed outbox entries
+APPLIED_COMPLETIONS_KEPT = 20
+
+
+def fold_attempts(docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine one lesson's progress documents, oldest first, into a single document's fields"""
+    docs = sorted(docs, key=lambda d: d.get("last_accessed") or d.get("created_at") or datetime.min)
+    mastery = None
+    for doc in docs:
+        score = (doc.get("score") or 0) / 100
+        mastery = score if mastery is None else MASTERY_ALPHA * score + (1 - MASTERY_ALPHA) * mastery
+
+    scores = [doc["score"] for doc in docs if doc.get("score") is not None]
+    latest = docs[-1]
+    return {
+        "topic_id": latest.get("topic_id"),
+        "status": "mastered" if mastery >= MASTERED_THRESHOLD else latest.get("status", "completed"),
+        "progress_percentage": max(doc.get("progress_percentage", 0.0) for doc in docs),
+        "score": latest.get("score"),
+        "best_score": max(scores) if scores else None,
+        "attempts": sum(max(doc.get("attempts", 1), 1) for doc in docs),
+        "time_spent": sum(doc.get("time_spent", 0) for doc in docs),
+        "mastery_level": round(mastery, 4),
+        "last_accessed": latest.get("last_accessed"),
+        "created_at": min(doc.get("created_at") or datetime.utcnow() for doc in docs),
+        "updated_at": datetime.utcnow()
+    }
+
+
+class ProgressService:
+    """One ``user_progress`` document per (user, lesson), updated in place on every attempt
+
+    Per-topic counters in ``topic_progress`` count each user's distinct completed
+    lessons, so a topic is detected as complete by comparing one counter with the
+    curriculum's lesson count for that topic.
+    """
+
+    def __init__(self, db, curriculum, batch_size: int = 500):
+        self.db = db
+        self.curriculum = curriculum
+        self.user_progress_collection = db.user_progress
+        self.topic_progress_collection = db.topic_progress
+        self.user_profiles_collection = db.user_profiles
+        self.batch_size = batch_size
+
+    async def ensure_indexes(self):
+        """Create the unique (user_id, lesson_id) index
+
+        Fails while legacy duplicate rows exist; those are folded by ``migrate_duplicates``.
+        """
+        try:
+            await self.user_progress_collection.create_index([("user_id", 1), ("lesson_id", 1)], unique=True)
+        except OperationFailure as e:
+            logger.error(f"Unique progress index not created, run `python progress_service.py` to fold duplicates: {e}")
+        await self.topic_progress_collection.create_index([("user_id", 1), ("topic_id", 1)], unique=True)
+
+    async def record_attempt(self, user_id: str, lesson_id: str, topic_id: str, score: int, time_spent: int,
+                             outbox_entry: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Record a finished attempt in one atomic upsert and return the updated document
+
+        Increments ``attempts``, keeps best and last score, accumulates ``time_spent``
+        and moves ``mastery_level`` towards the new score with an EWMA. An
+        ``outbox_entry`` is appended to the document's outbox in the same write, with
+        ``first_completion`` set when this is the lesson's first attempt.
+        """
+        now = datetime.utcnow()
+        new_score = score / 100
+        previous_mastery = {"$ifNull": ["$mastery_level", new_score]}
+        outbox = {}
+        if outbox_entry is not None:
+            outbox["outbox"] = {"$concatArrays": [
+                {"$ifNull": ["$outbox", []]},
+                [{"$mergeObjects": [
+                    {"$literal": outbox_entry},
+                    {"first_completion": {"$eq": [{"$ifNull": ["$attempts", 0]}, 0]}}
+                ]}]
+            ]}
+
+        return await self.user_progress_collection.find_one_and_update(
+            {"user_id": user_id, "lesson_id": lesson_id},
+            [
+                # Expressions in one stage all read the document as it was before the update
+                {"$set": {
+                    "id": {"$ifNull": ["$id", str(uuid.uuid4())]},
+                    "topic_id": {"$literal": topic_id},
+                    "progress_percentage": 100.0,
+                    "score": score,
+                    "best_score": {"$max": ["$best_score", score]},
+                    "attempts": {"$add": [{"$ifNull": ["$attempts", 0]}, 1]},
+                    "time_spent": {"$add": [{"$ifNull": ["$time_spent", 0]}, time_spent]},
+                    "mastery_level": {"$add": [
+                        MASTERY_ALPHA * new_score,
+                        {"$multiply": [1 - MASTERY_ALPHA, previous_mastery]}
+                    ]},
+                    "last_accessed": now,
+                    "created_at": {"$ifNull": ["$created_at", now]},
+                    "updated_at": now,
+                    **outbox
+                }},
+                {"$set": {
+                    "status": {"$cond": [
+                        {"$gte": ["$mastery_level", MASTERED_THRESHOLD]}, "mastered", "completed"
+                    ]}
+                }}
+            ],
+            projection={"_id": 0, "outbox": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def record_first_completion(self, user_id: str, lesson_id: str,
+                                      completion_id: Optional[str] = None) -> Optional[str]:
+        """Count a lesson's first completion towards its topic
+
+        Returns the topic ID if this completion finished the topic. Call only when
+        ``record_attempt`` reports ``attempts == 1``. With a ``completion_id`` a
+        repeated call for the same completion is not counted again.
+        """
+        snapshot = self.curriculum.snapshot
+        if lesson_id in snapshot.lesson_topic_ids:
+            topic_id = snapshot.lesson_topic_ids[lesson_id]
+            lessons_total = snapshot.topic_lesson_count.get(topic_id, 0)
+        else:
+            # Lesson added since the snapshot was taken: its topic's count is stale too
+            lesson = await self.db.lessons.find_one({"id": lesson_id}, {"_id": 0, "topic_id": 1})
+            topic_id = lesson.get("topic_id") if lesson else None
+            lessons_total = await self.db.lessons.count_documents({"topic_id": topic_id}) if topic_id else 0
+        if not lessons_total:
+            return None
+
+        now = datetime.utcnow()
+        counter_filter: Dict[str, Any] = {"user_id": user_id, "topic_id": topic_id}
+        update: Dict[str, Any] = {
+            "$inc": {"lessons_done": 1},
+            "$set": {"lessons_total": lessons_total, "updated_at": now},
+            "$setOnInsert": {"completed_at": None, "created_at": now}
+        }
+        if completion_id:
+            # Remember recent completions; a replay matches no document and its upsert
+            # then hits the unique (user_id, topic_id) index
+            counter_filter["applied_completions"] = {"$ne": completion_id}
+            update["$push"] = {"applied_completions": {"$each": [completion_id], "$slice": -APPLIED_COMPLETIONS_KEPT}}
+        try:
+            previous = await self.topic_progress_collection.find_one_and_update(
+                counter_filter, update, upsert=True
+            )
+        except DuplicateKeyError:
+            # Either a replay, or a first completion of another lesson in the topic
+            # created the counter first; the retry counts only the latter
+            previous = await self.topic_progress_collection.find_one_and_update(counter_filter, update)
+            if previous is None:
+                return None
+        # The counter as it was before this completion; None if this completion created it
+        previous = previous or {}
+        if previous.get("completed_at") or previous.get("lessons_done", 0) + 1 < lessons_total:
+            return None
+        return await self._mark_topic_completed(user_id, topic_id, now)
+
+    async def _mark_topic_completed(self, user_id: str, topic_id: str, now: datetime) -> Optional[str]:
+        # Conditional claim so concurrent completions mark the topic only once
+        claimed = await self.topic_progress_collection.update_one(
+            {"user_id": user_id, "topic_id": topic_id, "completed_at": None},
+            {"$set": {"completed_at": now}}
+        )
+        if not claimed.modified_count:
+            return None
+        await self.user_profiles_collection.update_one(
+            {"id": user_id},
+            {"$addToSet": {"topics_completed": topic_id}}
+        )
+        return topic_id
+
+    async def get_completed_topics(self, user_id: str) -> List[str]:
+        """IDs of the topics the user has completed, from the per-topic counters"""
+        return await self.topic_progress_collection.distinct(
+            "topic_id", {"user_id": user_id, "completed_at": {"$ne": None}}
+        )
+
+    async def rebuild_topic_counters(self) -> Dict[str, int]:
+        """Recount every user's per-topic lessons from ``user_progress`` against the current curriculum"""
+        snapshot = self.curriculum.snapshot
+        rows = self.user_progress_collection.aggregate([
+            {"$match": {"lesson_id": {"$in": list(snapshot.lesson_topic_ids)}}},
+            {"$group": {"_id": {"user_id": "$user_id", "lesson_id": "$lesson_id"}}},
+            {"$group": {"_id": "$_id.user_id", "lesson_ids": {"$push": "$_id.lesson_id"}}}
+        ], allowDiskUse=True)
+
+        stats = {"counters": 0, "topics_completed": 0}
+        now = datetime.utcnow()
+        operations = []
+        completed = []
+        async for row in rows:
+            per_topic: Dict[str, int] = {}
+            for lesson_id in row["lesson_ids"]:
+                topic_id = snapshot.lesson_topic_ids[lesson_id]
+                per_topic[topic_id] = per_topic.get(topic_id, 0) + 1
+            for topic_id, lessons_done in per_topic.items():
+                lessons_total = snapshot.topic_lesson_count[topic_id]
+                operations.append(UpdateOne(
+                    {"user_id": row["_id"], "topic_id": topic_id},
+                    {
+                        "$set": {"lessons_done": lessons_done, "lessons_total": lessons_total, "updated_at": now},
+                        "$setOnInsert": {"completed_at": None, "created_at": now}
+                    },
+                    upsert=True
+                ))
+                if lessons_done >= lessons_total:
+                    completed.append((row["_id"], topic_id))
+            if len(operations) >= self.batch_size:
+                await self.topic_progress_collection.bulk_write(operations, ordered=False)
+                stats["counters"] += len(operations)
+                operations = []
+        if operations:
+            await self.topic_progress_collection.bulk_write(operations, ordered=False)
+            stats["counters"] += len(operations)
+
+        for user_id, topic_id in completed:
+            if await self._mark_topic_completed(user_id, topic_id, now):
+                stats["topics_completed"] += 1
+        return stats
+
+    async def migrate_duplicates(self) -> Dict[str, int]:
+        """Fold legacy per-attempt rows into one document per (user, lesson)
+
+        Duplicate groups are streamed from an aggregation cursor and rewritten in
+        batches: the oldest document of each group keeps the folded fields and the
+        rest are deleted. Rows that were never duplicated get ``best_score`` backfilled
+        and ``mastery_level`` recomputed from their score, as ``fold_attempts`` would.
+        """
+        groups = self.user_progress_collection.aggregate([
+            {"$group": {
+                "_id": {"user_id": "$user_id", "lesson_id": "$lesson_id"},
+                "ids": {"$push": "$_id"},
+                "count": {"$sum": 1}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True)
+
+        stats = {"groups_folded": 0, "documents_removed": 0}
+        batch: List[List[Any]] = []
+        async for group in groups:
+            batch.append(group["ids"])
+            if len(batch) >= self.batch_size:
+                await self._fold_batch(batch, stats)
+                batch = []
+        if batch:
+            await self._fold_batch(batch, stats)
+
+        backfill = await self.user_progress_collection.update_many(
+            {"best_score": None, "score": {"$ne": None}},
+            [{"$set": {"best_score": "$score"}}]
+        )
+        stats["best_scores_backfilled"] = backfill.modified_count
+
+        # Legacy rows were written with the model default of 0.0; a single attempt's
+        # mastery is its score. Rows already folded or updated in place are non-zero.
+        mastery = await self.user_progress_collection.update_many(
+            {"$or": [{"mastery_level": None}, {"mastery_level": 0}], "score": {"$gt": 0}},
+            [
+                {"$set": {"mastery_level": {"$divide": ["$score", 100]}}},
+                {"$set": {"status": {"$cond": [
+                    {"$gte": ["$mastery_level", MASTERED_THRESHOLD]}, "mastered", {"$ifNull": ["$status", "completed"]}
+                ]}}}
+            ]
+        )
+        stats["mastery_recomputed"] = mastery.modified_count
+        return stats
+
+    async def _fold_batch(self, groups: List[List[Any]], stats: Dict[str, int]):
+        docs = await self.user_progress_collection.find(
+            {"_id": {"$in": [doc_id for ids in groups for doc_id in ids]}}
+        ).to_list(None)
+        by_id = {doc["_id"]: doc for doc in docs}
+
+        operations = []
+        for ids in groups:
+            group_docs = [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+            if not group_docs:
+                continue
+            keep = min(group_docs, key=lambda d: d.get("created_at") or datetime.min)
+            remove = [doc["_id"] for doc in group_docs if doc["_id"] != keep["_id"]]
+            operations.append(UpdateOne({"_id": keep["_id"]}, {"$set": fold_attempts(group_docs)}))
+            if remove:
+                operations.append(DeleteMany({"_id": {"$in": remove}}))
+            stats["groups_folded"] += 1
+            stats["documents_removed"] += len(remove)
+
+        if operations:
+            await self.user_progress_collection.bulk_write(operations, ordered=False)
+
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from curriculum import CurriculumService
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        curriculum = CurriculumService(db, refresh_interval=0)
+        await curriculum.refresh()
+        service = ProgressService(db, curriculum)
+        print(await service.migrate_duplicates())
+        await service.ensure_indexes()
+        print(await service.rebuild_topic_counters())
+        client.close()
+
+    asyncio.run(main())
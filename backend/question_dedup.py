@@ -0,0 +1,271 @@
+from typing import Dict, List, Any, Tuple
+from pymongo import UpdateOne
+import numpy as np
+import hashlib
+import logging
+import re
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# MinHash over character shingles, banded for LSH. 32 bands x 4 rows makes pairs
+# above roughly Jaccard 0.45 likely candidates; candidates are then confirmed
+# against DUPLICATE_THRESHOLD using the full signature.
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 32
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 4
+DUPLICATE_THRESHOLD = 0.7
+
+# Universal hashing (a * x + b) mod p with p prime above 2**32; a, b < 2**32 keep
+# a * x + b inside uint64 for 32-bit shingle hashes.
+_HASH_PRIME = np.uint64(4294967311)
+_rng = np.random.default_rng(20240501)
+_PERM_A = _rng.integers(1, 2 ** 32, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 2 ** 32, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+_NON_WORD = re.compile(r"[^a-z0-9%$ ]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question_text(text: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace"""
+    text = _NON_WORD.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    normalized = normalize_question_text(text)
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def minhash_signatures(texts: List[str], chunk_shingles: int = 200000) -> np.ndarray:
+    """Compute MinHash signatures for many texts at once, shape (len(texts), NUM_PERMUTATIONS)
+
+    All shingles are hashed under every permutation in one broadcast and reduced per
+    text with ``np.minimum.reduceat``; texts are processed in chunks so the
+    (permutations x shingles) matrix stays bounded.
+    """
+    signatures = np.empty((len(texts), NUM_PERMUTATIONS), dtype=np.uint64)
+    start = 0
+    while start < len(texts):
+        hashes, offsets, total = [], [], 0
+        end = start
+        while end < len(texts) and (total < chunk_shingles or end == start):
+            h = _shingle_hashes(texts[end])
+            offsets.append(total)
+            hashes.append(h)
+            total += len(h)
+            end += 1
+
+        shingles = np.concatenate(hashes)
+        permuted = (_PERM_A[:, None] * shingles[None, :] + _PERM_B[:, None]) % _HASH_PRIME
+        signatures[start:end] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        start = end
+    return signatures
+
+
+def lsh_band_keys(signatures: np.ndarray) -> List[List[str]]:
+    """Hash each signature band into a bucket key (band index is part of the key)"""
+    bands = signatures.reshape(len(signatures), LSH_BANDS, LSH_ROWS)
+    return [
+        [f"{b}:{hashlib.blake2b(row[b].tobytes(), digest_size=8).hexdigest()}" for b in range(LSH_BANDS)]
+        for row in bands
+    ]
+
+
+def estimate_similarity(signature: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """Estimated Jaccard similarity between one signature and a matrix of candidates"""
+    return (candidates == signature[None, :]).mean(axis=1)
+
+
+class QuestionDeduplicator:
+    """Rejects near-duplicate questions per (topic_id, lesson_id) before they are stored
+
+    Questions carry their MinHash signature and LSH band keys, so a lookup is one
+    indexed query for documents sharing any band with the incoming question.
+    """
+
+    def __init__(self, collection, threshold: float = DUPLICATE_THRESHOLD):
+        self.collection = collection
+        self.threshold = threshold
+
+    async def ensure_indexes(self):
+        # Question IDs are content-derived, so concurrent writers of the same question
+        # collide on this index instead of storing it twice
+        await self.collection.create_index("id", unique=True)
+        await self.collection.create_index([("topic_id", 1), ("lesson_id", 1), ("lsh_bands", 1)])
+        # Lets dedupe_collection stream the collection in scope order without a sort
+        await self.collection.create_index([("topic_id", 1), ("lesson_id", 1), ("created_at", 1)])
+
+    def annotate(self, questions: List[Dict[str, Any]]) -> np.ndarray:
+        """Attach ``minhash`` and ``lsh_bands`` to each question and return the signatures"""
+        signatures = minhash_signatures([q.get("question", "") for q in questions])
+        for question, signature, bands in zip(questions, signatures, lsh_band_keys(signatures)):
+            question["minhash"] = signature.tolist()
+            question["lsh_bands"] = bands
+        return signatures
+
+    async def filter_duplicates(self, questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return the questions that are not near-duplicates of stored ones or of each other
+
+        Tags and hints of a rejected question are merged into the question it duplicates,
+        and the rejected question's ``duplicate_of`` is set to that question's ID.
+        """
+        if not questions:
+            return []
+
+        signatures = self.annotate(questions)
+        unique: List[Dict[str, Any]] = []
+        unique_signatures: List[np.ndarray] = []
+        merges: List[UpdateOne] = []
+
+        for question, signature in zip(questions, signatures):
+            candidates = await self.collection.find(
+                {
+                    "topic_id": question.get("topic_id"),
+                    "lesson_id": question.get("lesson_id"),
+                    "lsh_bands": {"$in": question["lsh_bands"]}
+                },
+                {"_id": 0, "id": 1, "minhash": 1}
+            ).to_list(None)
+
+            duplicate_of = None
+            if candidates:
+                stored = np.array([c["minhash"] for c in candidates], dtype=np.uint64)
+                similarity = estimate_similarity(signature, stored)
+                best = int(similarity.argmax())
+                if similarity[best] >= self.threshold:
+                    duplicate_of = candidates[best]["id"]
+
+            if duplicate_of is None and unique_signatures:
+                same_scope = [
+                    i for i, kept in enumerate(unique)
+                    if kept.get("topic_id") == question.get("topic_id") and kept.get("lesson_id") == question.get("lesson_id")
+                ]
+                if same_scope:
+                    similarity = estimate_similarity(signature, np.array([unique_signatures[i] for i in same_scope]))
+                    best = int(similarity.argmax())
+                    if similarity[best] >= self.threshold:
+                        question["duplicate_of"] = unique[same_scope[best]]["id"]
+                        continue
+
+            if duplicate_of is not None:
+                question["duplicate_of"] = duplicate_of
+                merges.append(UpdateOne(
+                    {"id": duplicate_of},
+                    {"$addToSet": {
+                        "tags": {"$each": question.get("tags", [])},
+                        "hints": {"$each": question.get("hints", [])}
+                    }}
+                ))
+                continue
+
+            unique.append(question)
+            unique_signatures.append(signature)
+
+        if merges:
+            await self.collection.bulk_write(merges, ordered=False)
+        return unique
+
+    async def dedupe_collection(self, batch_size: int = 1000) -> Dict[str, int]:
+        """Batch job: backfill signatures and delete near-duplicates across the collection
+
+        Questions are streamed in (topic_id, lesson_id, created_at) order so only one
+        scope's LSH buckets are held in memory; the oldest question of a cluster is kept.
+        """
+        stats = {"scanned": 0, "duplicates_removed": 0, "scopes": 0}
+        scope: Tuple[Any, Any] = None
+        buckets: Dict[str, List[int]] = {}
+        kept_signatures: List[np.ndarray] = []
+        kept_ids: List[str] = []
+
+        cursor = self.collection.find(
+            {}, {"_id": 0, "id": 1, "topic_id": 1, "lesson_id": 1, "question": 1, "tags": 1, "hints": 1}
+        ).sort([("topic_id", 1), ("lesson_id", 1), ("created_at", 1)])\
+            .allow_disk_use(True)\
+            .batch_size(batch_size)
+
+        batch: List[Dict[str, Any]] = []
+        async for question in cursor:
+            batch.append(question)
+            if len(batch) >= batch_size:
+                scope = await self._dedupe_batch(batch, scope, buckets, kept_signatures, kept_ids, stats)
+                batch = []
+        if batch:
+            await self._dedupe_batch(batch, scope, buckets, kept_signatures, kept_ids, stats)
+
+        logger.info(f"Question dedup finished: {stats}")
+        return stats
+
+    async def _dedupe_batch(self, batch, scope, buckets, kept_signatures, kept_ids, stats):
+        signatures = minhash_signatures([q.get("question", "") for q in batch])
+        band_keys = lsh_band_keys(signatures)
+        updates: List[UpdateOne] = []
+        duplicate_ids: List[str] = []
+
+        for question, signature, bands in zip(batch, signatures, band_keys):
+            question_scope = (question.get("topic_id"), question.get("lesson_id"))
+            if question_scope != scope:
+                scope = question_scope
+                buckets.clear()
+                kept_signatures.clear()
+                kept_ids.clear()
+                stats["scopes"] += 1
+            stats["scanned"] += 1
+
+            candidate_rows = sorted({row for band in bands for row in buckets.get(band, [])})
+            if candidate_rows:
+                similarity = estimate_similarity(signature, np.array([kept_signatures[i] for i in candidate_rows]))
+                best = int(similarity.argmax())
+                if similarity[best] >= self.threshold:
+                    duplicate_ids.append(question["id"])
+                    updates.append(UpdateOne(
+                        {"id": kept_ids[candidate_rows[best]]},
+                        {"$addToSet": {
+                            "tags": {"$each": question.get("tags", [])},
+                            "hints": {"$each": question.get("hints", [])}
+                        }}
+                    ))
+                    continue
+
+            row = len(kept_ids)
+            kept_ids.append(question["id"])
+            kept_signatures.append(signature)
+            for band in bands:
+                buckets.setdefault(band, []).append(row)
+            updates.append(UpdateOne(
+                {"id": question["id"]},
+                {"$set": {"minhash": signature.tolist(), "lsh_bands": bands}}
+            ))
+
+        if updates:
+            await self.collection.bulk_write(updates, ordered=False)
+        if duplicate_ids:
+            await self.collection.delete_many({"id": {"$in": duplicate_ids}})
+            stats["duplicates_removed"] += len(duplicate_ids)
+        return scope
+
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        deduplicator = QuestionDeduplicator(client[os.environ['DB_NAME']].questions)
+        await deduplicator.ensure_indexes()
+        print(await deduplicator.dedupe_collection())
+        client.close()
+
+    asyncio.run(main())
@@ -0,0 +1,211 @@
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+from models import QuestionType
+from question_dedup import QuestionDeduplicator
+import asyncio
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+PoolKey = Tuple[str, int, str]  # (topic_id, difficulty, question type value)
+
+POOL_PROJECTION = {"_id": 0, "minhash": 0, "lsh_bands": 0}
+
+
+class QuestionPool:
+    """Pool of pre-generated AI questions per (topic_id, difficulty, question_type)
+
+    Requests draw from the pool and never wait on the LLM; background workers top a
+    key back up whenever a draw leaves fewer than ``low_water`` unseen questions.
+    A user's draws skip the questions they have seen, so they move through the pool;
+    anonymous draws take a random sample instead. Refill decisions count the pool in
+    the collection, so every server worker sees the same depth; ``depth`` only keeps
+    the last count for metrics.
+    """
+
+    def __init__(self, db, ai_service, low_water: int = 20, refill_batch: int = 10,
+                 max_depth: int = 500, workers: int = 2):
+        self.db = db
+        self.ai_service = ai_service
+        self.pool_collection = db.question_pool
+        self.deduplicator = QuestionDeduplicator(self.pool_collection)
+        self.seen_collection = db.user_seen_questions
+        self.low_water = low_water
+        self.refill_batch = refill_batch
+        self.max_depth = max_depth
+        self.worker_count = workers
+        self._queue: "asyncio.Queue[Tuple[PoolKey, float]]" = asyncio.Queue()
+        self._pending: set = set()
+        self._workers: List[asyncio.Task] = []
+        self.depth: Dict[PoolKey, int] = {}
+        self.metrics = {"draws": 0, "questions_served": 0, "refills": 0, "refill_failures": 0,
+                        "questions_added": 0, "last_refill_lag": 0.0, "max_refill_lag": 0.0}
+
+    async def ensure_indexes(self):
+        """Create indexes backing pool draws and seen-question lookups"""
+        await self.pool_collection.create_index("id", unique=True)
+        await self.pool_collection.create_index(
+            [("topic_id", 1), ("difficulty", 1), ("type", 1), ("created_at", 1)]
+        )
+        await self.deduplicator.ensure_indexes()
+        await self.seen_collection.create_index([("user_id", 1), ("question_id", 1)], unique=True)
+        await self.seen_collection.create_index(
+            [("user_id", 1), ("topic_id", 1), ("difficulty", 1), ("type", 1)]
+        )
+
+    async def start(self):
+        """Load pool depths, start refill workers and top up keys below the low-water mark"""
+        counts = await self.pool_collection.aggregate([
+            {"$group": {
+                "_id": {"topic_id": "$topic_id", "difficulty": "$difficulty", "type": "$type"},
+                "count": {"$sum": 1}
+            }}
+        ]).to_list(None)
+        for row in counts:
+            key = (row["_id"]["topic_id"], row["_id"]["difficulty"], row["_id"]["type"])
+            self.depth[key] = row["count"]
+
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+        for key, depth in self.depth.items():
+            if depth < self.low_water:
+                self.request_refill(key)
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def draw(self, topic_id: str, difficulty: int, question_type: QuestionType,
+                   count: int = 5, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Draw up to ``count`` pooled questions the user has not seen yet"""
+        key = (topic_id, difficulty, question_type.value)
+        key_filter = {"topic_id": topic_id, "difficulty": difficulty, "type": question_type.value}
+
+        seen_ids = []
+        if user_id:
+            seen = await self.seen_collection.find(
+                {"user_id": user_id, **key_filter}, {"question_id": 1, "_id": 0}
+            ).to_list(None)
+            seen_ids = [doc["question_id"] for doc in seen]
+
+            questions = await self.pool_collection.find(
+                {**key_filter, "id": {"$nin": seen_ids}}, POOL_PROJECTION
+            ).sort("created_at", 1).limit(count).to_list(None)
+        else:
+            # Nothing records what anonymous users saw, so rotate through the pool at random
+            questions = await self.pool_collection.aggregate([
+                {"$match": key_filter},
+                {"$sample": {"size": count}},
+                {"$project": POOL_PROJECTION}
+            ]).to_list(None)
+
+        if user_id and questions:
+            try:
+                await self.seen_collection.insert_many([
+                    {"user_id": user_id, "question_id": q["id"], **key_filter, "seen_at": datetime.utcnow()}
+                    for q in questions
+                ], ordered=False)
+            except BulkWriteError:
+                # Concurrent draws may already have recorded some of these
+                pass
+
+        self.metrics["draws"] += 1
+        self.metrics["questions_served"] += len(questions)
+
+        # Keep enough unseen questions around for this user's next draw
+        unseen_left = await self._count(key) - len(seen_ids) - len(questions)
+        if unseen_left < self.low_water:
+            self.request_refill(key)
+
+        return questions
+
+    async def _count(self, key: PoolKey) -> int:
+        """Pooled questions for ``key``, counted in the collection"""
+        topic_id, difficulty, question_type = key
+        depth = await self.pool_collection.count_documents(
+            {"topic_id": topic_id, "difficulty": difficulty, "type": question_type}
+        )
+        self.depth[key] = depth
+        return depth
+
+    def request_refill(self, key: PoolKey):
+        """Queue a refill for ``key`` unless one is already pending or the pool is full"""
+        if key in self._pending or self.depth.get(key, 0) >= self.max_depth:
+            return
+        self._pending.add(key)
+        self._queue.put_nowait((key, time.monotonic()))
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "pending_refills": len(self._pending),
+            "pool_depth": [
+                {"topic_id": topic_id, "difficulty": difficulty, "type": question_type, "depth": depth}
+                for (topic_id, difficulty, question_type), depth in sorted(self.depth.items())
+            ]
+        }
+
+    async def _worker(self):
+        while True:
+            key, requested_at = await self._queue.get()
+            try:
+                await self._refill(key)
+            except Exception as e:
+                self.metrics["refill_failures"] += 1
+                logger.error(f"Question pool refill failed for {key}: {e}")
+            finally:
+                lag = time.monotonic() - requested_at
+                self.metrics["last_refill_lag"] = lag
+                self.metrics["max_refill_lag"] = max(self.metrics["max_refill_lag"], lag)
+                self._pending.discard(key)
+                self._queue.task_done()
+
+    async def _refill(self, key: PoolKey):
+        # Another worker may have filled the key since the refill was queued
+        if await self._count(key) >= self.max_depth:
+            return
+        topic_id, difficulty, question_type = key
+        questions = await self.ai_service.generate_questions(
+            topic_id=topic_id,
+            lesson_id="general",
+            difficulty=difficulty,
+            question_type=QuestionType(question_type),
+            count=self.refill_batch,
+            use_cache=False
+        )
+        if not questions:
+            self.metrics["refill_failures"] += 1
+            return
+
+        # Paraphrases of already pooled questions would only pad the depth count
+        questions = await self.deduplicator.filter_duplicates(questions)
+        if not questions:
+            return
+
+        now = datetime.utcnow()
+        for question in questions:
+            question["created_at"] = now
+
+        try:
+            result = await self.pool_collection.insert_many(questions, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Concurrent refills of the same content collide on the content-derived ID
+            inserted = e.details.get("nInserted", 0)
+
+        await self._count(key)
+        self.metrics["refills"] += 1
+        self.metrics["questions_added"] += inserted
+
+
+def lesson_copy(question: Dict[str, Any], lesson_id: str) -> Dict[str, Any]:
+    """Attach a pooled question to a lesson under a stable per-lesson ID"""
+    copy = {k: v for k, v in question.items() if k != "created_at"}
+    copy["id"] = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{question['id']}/{lesson_id}"))
+    copy["lesson_id"] = lesson_id
+    return copy
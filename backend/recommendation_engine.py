@@ -0,0 +1,127 @@
+from typing import Dict, List, Any
+from datetime import datetime
+import uuid
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+
+# Completed lessons scoring below this are offered for review
+REVIEW_SCORE_THRESHOLD = 80
+# Days after which a weak lesson is fully due for review
+REVIEW_HALF_LIFE_DAYS = 7.0
+MAX_REVIEWS = 3
+
+
+def _best_score(progress: Dict[str, Any]) -> float:
+    """Best score of a progress row; legacy rows written before ``best_score`` only have ``score``
+
+    A row with no score at all counts as done without flagging the lesson for review.
+    """
+    for field in ("best_score", "score"):
+        if progress.get(field) is not None:
+            return progress[field]
+    return 100.0
+
+
+class LocalRecommender:
+    """Deterministic recommender over the curriculum prerequisite graph
+
+    Scores every lesson at once with NumPy from the user's progress: unlocked lessons
+    they have not done yet are ranked by difficulty fit, topic momentum and lesson
+    order, and weak completed lessons are ranked for review by score and time since.
+    """
+
+    def __init__(self, db, curriculum):
+        self.db = db
+        self.curriculum = curriculum
+        self.user_progress_collection = db.user_progress
+
+    async def recommend(self, user_id: str, user_profile: Dict[str, Any], limit: int = 8) -> List[Dict[str, Any]]:
+        """Rank lessons for a user; costs one indexed progress query plus array math"""
+        snapshot = self.curriculum.snapshot
+        if snapshot.size == 0:
+            return []
+
+        progress = await self.user_progress_collection.find(
+            {"user_id": user_id},
+            {"_id": 0, "lesson_id": 1, "best_score": 1, "score": 1, "last_accessed": 1}
+        ).to_list(None)
+
+        return self.rank(snapshot, user_id, user_profile, progress, limit)
+
+    def rank(self, snapshot, user_id: str, user_profile: Dict[str, Any],
+             progress: List[Dict[str, Any]], limit: int = 8) -> List[Dict[str, Any]]:
+        n = snapshot.size
+        now = (datetime.utcnow() - EPOCH).total_seconds()
+
+        # Fold progress rows into per-lesson vectors
+        rows = [p for p in progress if p.get("lesson_id") in snapshot.lesson_index]
+        ordinals = np.array([snapshot.lesson_index[p["lesson_id"]] for p in rows], dtype=np.int64)
+        scores = np.array([_best_score(p) for p in rows], dtype=np.float64)
+        seen_at = np.array(
+            [(p["last_accessed"] - EPOCH).total_seconds() if p.get("last_accessed") else 0.0 for p in rows],
+            dtype=np.float64
+        )
+
+        best_score = np.full(n, np.nan)
+        last_seen = np.zeros(n)
+        if len(rows):
+            best_score[ordinals] = -np.inf
+            np.maximum.at(best_score, ordinals, scores)
+            np.maximum.at(last_seen, ordinals, seen_at)
+
+        completed = snapshot.completed_mask(user_profile.get("lessons_completed", [])) | ~np.isnan(best_score)
+        unlocked = snapshot.unlocked_mask(completed)
+        days_since = np.where(last_seen > 0, (now - last_seen) / 86400.0, 0.0)
+
+        # Topic momentum: recency-weighted activity per topic, normalized to [0, 1]
+        n_topics = len(snapshot.topics)
+        topic_slot = np.where(snapshot.lesson_topic < 0, n_topics, snapshot.lesson_topic)
+        recency = np.where(last_seen > 0, np.exp(-days_since / REVIEW_HALF_LIFE_DAYS), 0.0)
+        topic_activity = np.bincount(topic_slot, weights=recency, minlength=n_topics + 1)
+        momentum = topic_activity[topic_slot] / max(topic_activity.max(), 1e-9)
+
+        level = user_profile.get("level", 1)
+        difficulty_fit = np.clip(1.0 - np.abs(snapshot.lesson_difficulty - level) / 4.0, 0.0, 1.0)
+        order_bonus = 1.0 / (1.0 + snapshot.lesson_order)
+
+        next_score = np.where(
+            unlocked & ~completed,
+            0.5 * difficulty_fit + 0.3 * momentum + 0.2 * order_bonus,
+            -np.inf
+        )
+
+        weak = completed & (np.nan_to_num(best_score, nan=100.0) < REVIEW_SCORE_THRESHOLD)
+        review_need = (100.0 - np.nan_to_num(best_score, nan=100.0)) / 100.0 \
+            * (1.0 - np.exp(-days_since / REVIEW_HALF_LIFE_DAYS))
+        review_score = np.where(weak, 0.3 + 0.7 * review_need, -np.inf)
+
+        picks = []
+        for kind, values, cap in (("review", review_score, MAX_REVIEWS), ("lesson", next_score, limit)):
+            candidates = np.flatnonzero(np.isfinite(values))
+            if len(candidates) > cap:
+                candidates = candidates[np.argpartition(-values[candidates], cap - 1)[:cap]]
+            picks.extend((float(values[i]), kind, int(i)) for i in candidates)
+
+        picks.sort(key=lambda pick: -pick[0])
+        recommendations = []
+        for rank, (score, kind, i) in enumerate(picks[:limit]):
+            lesson = snapshot.lessons[i]
+            if kind == "review":
+                reason = f"You scored {int(best_score[i])}% here; a quick review will lock it in."
+            else:
+                reason = "Unlocked and matched to your current level."
+            recommendations.append({
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "type": kind,
+                "content_id": lesson["id"],
+                "title": lesson.get("title", ""),
+                "reason": reason,
+                "priority": max(5 - rank, 1),
+                "confidence_score": round(min(max(score, 0.0), 1.0), 3),
+                "is_viewed": False,
+                "is_accepted": False,
+                "source": "local"
+            })
+        return recommendations
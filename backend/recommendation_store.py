@@ -0,0 +1,74 @@
+from typing import Dict, List, Any
+from datetime import datetime, timedelta
+from pymongo import UpdateOne, DeleteMany
+from models import AIRecommendation
+import uuid
+
+
+class RecommendationStore:
+    """Versioned per-user recommendation sets
+
+    Every user profile carries a ``recommendations_version`` counter that lesson
+    completions and achievement awards bump. A stored set is served only while its
+    version matches the profile and it has not expired; a TTL index removes expired
+    sets from the collection.
+    """
+
+    def __init__(self, db, ttl: int = 24 * 3600):
+        self.recommendations_collection = db.ai_recommendations
+        self.ttl = ttl
+
+    async def ensure_indexes(self):
+        """Create indexes backing set lookups and expiry"""
+        await self.recommendations_collection.create_index("id", unique=True)
+        await self.recommendations_collection.create_index([("user_id", 1), ("version", 1), ("priority", -1)])
+        await self.recommendations_collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, user_id: str, version: int) -> List[Dict[str, Any]]:
+        """Get the user's fresh set for ``version``, or an empty list"""
+        return await self.recommendations_collection.find(
+            {"user_id": user_id, "version": version, "expires_at": {"$gt": datetime.utcnow()}},
+            {"_id": 0}
+        ).sort("priority", -1).to_list(None)
+
+    async def save(self, user_id: str, version: int, recommendations: List[Dict[str, Any]],
+                   source: str = "ai") -> List[Dict[str, Any]]:
+        """Replace the user's set for ``version`` in one bulk write"""
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        documents = []
+        for rec_data in recommendations:
+            rec = AIRecommendation(**{
+                "source": source,
+                **rec_data,
+                # Stable IDs so re-saving a set overwrites rows instead of adding more
+                "id": str(uuid.uuid5(
+                    uuid.NAMESPACE_URL,
+                    f"{user_id}/{version}/{rec_data.get('type')}/{rec_data.get('content_id')}"
+                )),
+                "user_id": user_id,
+                "version": version,
+                "expires_at": expires_at
+            })
+            documents.append(rec.dict())
+
+        operations = [
+            UpdateOne(
+                {"id": doc["id"]},
+                {
+                    "$set": {k: v for k, v in doc.items() if k != "created_at"},
+                    "$setOnInsert": {"created_at": doc["created_at"]}
+                },
+                upsert=True
+            )
+            for doc in documents
+        ]
+        # Drop superseded versions and rows the new set no longer contains; never touch newer versions
+        operations.append(DeleteMany({
+            "user_id": user_id,
+            "version": {"$lte": version},
+            "id": {"$nin": [doc["id"] for doc in documents]}
+        }))
+        await self.recommendations_collection.bulk_write(operations, ordered=False)
+
+        documents.sort(key=lambda doc: -doc["priority"])
+        return documents
@@ -0,0 +1,255 @@
+from typing import Dict, List, Set, Any, Optional, Iterator
+from datetime import datetime, date
+from pathlib import Path
+from models import QuestionResponse
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_SCHEMA = pa.schema([
+    ("answered_at", pa.timestamp("ms")),
+    ("user_id", pa.string()),
+    ("topic_id", pa.string()),
+    ("lesson_id", pa.string()),
+    ("question_id", pa.string()),
+    ("is_correct", pa.bool_()),
+    ("time_taken", pa.int32()),
+])
+
+# Repeated IDs compress to small dictionaries within each file
+DICTIONARY_COLUMNS = ["user_id", "topic_id", "lesson_id", "question_id"]
+
+# Compacted files record the part files they replace, one row group per part
+SOURCE_PARTS_KEY = b"source_parts"
+
+# Every worker compacts finished days; a lock file in the day directory lets one at a
+# time in, and a lock older than this is left by a dead compactor and taken over
+COMPACT_LOCK_NAME = ".compact.lock"
+COMPACT_LOCK_SECONDS = 3600
+
+
+class ResponseLog:
+    """Append-only log of per-question answers stored as day-partitioned Parquet files
+
+    Answers are buffered in memory as columns and flushed every ``flush_interval``
+    seconds (or once ``max_buffer`` rows are waiting) to
+    ``base_dir/day=YYYY-MM-DD/part-*.parquet``. Once a day is over its part files are
+    compacted into one, which keeps each part as a row group and lists the part names
+    in its metadata, so readers that track processed files can skip what they have read.
+    Parts listed by a compacted file are never read again, even if a crash left them
+    on disk; the next compaction of that day removes them.
+    """
+
+    def __init__(self, base_dir: str, flush_interval: int = 60, max_buffer: int = 50000):
+        self.base_dir = Path(base_dir)
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: Dict[str, List[Any]] = self._empty_buffer()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._size_flush = None
+        self._last_flush_day: Optional[date] = None
+        self.stats = {"rows_logged": 0, "rows_flushed": 0, "files_written": 0, "flush_failures": 0}
+
+    @staticmethod
+    def _empty_buffer() -> Dict[str, List[Any]]:
+        return {field.name: [] for field in RESPONSE_SCHEMA}
+
+    def append(self, user_id: str, lesson_id: str, topic_id: str,
+               responses: List[QuestionResponse], answered_at: Optional[datetime] = None):
+        """Buffer a lesson's answers; never blocks on disk"""
+        answered_at = answered_at or datetime.utcnow()
+        for response in responses:
+            self._buffer["answered_at"].append(answered_at)
+            self._buffer["user_id"].append(user_id)
+            self._buffer["topic_id"].append(topic_id)
+            self._buffer["lesson_id"].append(lesson_id)
+            self._buffer["question_id"].append(response.question_id)
+            self._buffer["is_correct"].append(response.is_correct)
+            self._buffer["time_taken"].append(response.time_taken)
+        self.stats["rows_logged"] += len(responses)
+
+        if len(self._buffer["question_id"]) >= self.max_buffer and not self._flush_lock.locked():
+            self._size_flush = asyncio.create_task(self.flush())
+
+    async def start(self):
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        await self.flush()
+
+    async def flush(self) -> int:
+        """Write buffered answers to Parquet; returns the number of rows written"""
+        async with self._flush_lock:
+            rows, self._buffer = self._buffer, self._empty_buffer()
+            count = len(rows["question_id"])
+            if not count:
+                return 0
+            try:
+                files = await asyncio.to_thread(self._write, rows)
+            except Exception as e:
+                # Put the rows back in front of anything buffered meanwhile and retry next time
+                for column, values in rows.items():
+                    self._buffer[column] = values + self._buffer[column]
+                self.stats["flush_failures"] += 1
+                logger.error(f"Response log flush failed: {e}")
+                return 0
+            self.stats["rows_flushed"] += count
+            self.stats["files_written"] += files
+            return count
+
+    def _write(self, rows: Dict[str, List[Any]]) -> int:
+        table = pa.Table.from_pydict(rows, schema=RESPONSE_SCHEMA)
+        days = pc.strftime(table["answered_at"], format="%Y-%m-%d")
+        files = 0
+        for day in pc.unique(days).to_pylist():
+            part = table.filter(pc.equal(days, day))
+            directory = self.base_dir / f"day={day}"
+            directory.mkdir(parents=True, exist_ok=True)
+            self._write_file(part, directory / f"part-{datetime.utcnow():%H%M%S}-{uuid.uuid4().hex[:8]}.parquet")
+            files += 1
+        return files
+
+    @staticmethod
+    def _write_file(table: pa.Table, path: Path):
+        # Dot-prefixed temporary name: dataset scans skip it until the rename
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        pq.write_table(table, tmp_path, compression="zstd", use_dictionary=DICTIONARY_COLUMNS)
+        tmp_path.rename(path)
+
+    def compact(self, day: date) -> bool:
+        """Merge a finished day's part files into a single file; False if there was nothing to do"""
+        directory = self.base_dir / f"day={day.isoformat()}"
+        if not directory.is_dir():
+            return False
+        lock = self._lock(directory)
+        if lock is None:
+            return False
+        try:
+            files = sorted(directory.glob("[!.]*.parquet"))
+            covered = self._covered_parts(files)
+            # Finish an earlier compaction that stopped before removing its parts
+            for name in covered:
+                (directory / name).unlink(missing_ok=True)
+
+            parts = [
+                (part, pq.read_table(part, schema=RESPONSE_SCHEMA))
+                for part in files if part.name.startswith("part-") and part.name not in covered
+            ]
+            parts = [(part, table) for part, table in parts if table.num_rows]
+            if len(parts) < 2:
+                return False
+            schema = RESPONSE_SCHEMA.with_metadata({SOURCE_PARTS_KEY: json.dumps([part.name for part, _ in parts])})
+            path = directory / f"compact-{uuid.uuid4().hex[:8]}.parquet"
+            tmp_path = path.with_name(f".{path.name}.tmp")
+            with pq.ParquetWriter(tmp_path, schema, compression="zstd", use_dictionary=DICTIONARY_COLUMNS) as writer:
+                for _, table in parts:
+                    writer.write_table(table.replace_schema_metadata(schema.metadata), row_group_size=table.num_rows)
+            tmp_path.rename(path)
+            for part, _ in parts:
+                part.unlink()
+            return True
+        finally:
+            lock.unlink(missing_ok=True)
+
+    @staticmethod
+    def _lock(directory: Path) -> Optional[Path]:
+        """Create the day's compaction lock file; None if another compactor holds it"""
+        lock = directory / COMPACT_LOCK_NAME
+        for _ in range(2):
+            try:
+                os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return lock
+            except FileExistsError:
+                try:
+                    if time.time() - lock.stat().st_mtime < COMPACT_LOCK_SECONDS:
+                        return None
+                    lock.unlink()
+                except FileNotFoundError:
+                    pass
+        return None
+
+    def _covered_parts(self, files: List[Path]) -> Set[str]:
+        """Names of files already held by a compacted file among ``files``
+
+        A compacted file whose parts are all held by an earlier one is a duplicate and
+        is covered too.
+        """
+        covered: Set[str] = set()
+        for path in files:
+            if not path.name.startswith("compact-"):
+                continue
+            sources = set(self.source_parts(path) or [])
+            if sources and sources <= covered:
+                covered.add(path.name)
+            covered |= sources
+        return covered
+
+    def days(self) -> List[str]:
+        """Day partitions present in the log, oldest first"""
+        if not self.base_dir.exists():
+            return []
+        return sorted(d.name[len("day="):] for d in self.base_dir.glob("day=*") if d.is_dir())
+
+    def day_files(self, day: str) -> List[Path]:
+        """Finished Parquet files of a day partition, without parts a compacted file already holds"""
+        files = sorted((self.base_dir / f"day={day}").glob("[!.]*.parquet"))
+        covered = self._covered_parts(files)
+        return [path for path in files if path.name not in covered]
+
+    @staticmethod
+    def source_parts(path: Path) -> Optional[List[str]]:
+        """Part files a compacted file replaces, in row group order; None for a part file"""
+        metadata = pq.read_schema(path).metadata or {}
+        return json.loads(metadata[SOURCE_PARTS_KEY]) if SOURCE_PARTS_KEY in metadata else None
+
+    @staticmethod
+    def read_file(path: Path, columns: Optional[List[str]] = None, row_groups: Optional[List[int]] = None,
+                  batch_size: int = 100000) -> Iterator[pa.RecordBatch]:
+        """Stream one file in record batches, optionally only some of its row groups"""
+        parquet_file = pq.ParquetFile(path)
+        return parquet_file.iter_batches(batch_size=batch_size, columns=columns or RESPONSE_SCHEMA.names,
+                                         row_groups=row_groups)
+
+    def scan(self, columns: Optional[List[str]] = None, since: Optional[date] = None,
+             batch_size: int = 100000) -> Iterator[pa.RecordBatch]:
+        """Stream logged answers in record batches, optionally only from ``since`` onwards"""
+        files = [
+            str(path)
+            for day in self.days() if since is None or day >= since.isoformat()
+            for path in self.day_files(day)
+        ]
+        if not files:
+            return iter(())
+        dataset = ds.dataset(
+            files, format="parquet", schema=RESPONSE_SCHEMA.append(pa.field("day", pa.string())),
+            partitioning=ds.partitioning(pa.schema([("day", pa.string())]), flavor="hive"),
+            partition_base_dir=str(self.base_dir)
+        )
+        return dataset.to_batches(columns=columns or RESPONSE_SCHEMA.names, batch_size=batch_size)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+            today = datetime.utcnow().date()
+            if self._last_flush_day and self._last_flush_day < today:
+                try:
+                    await asyncio.to_thread(self.compact, self._last_flush_day)
+                except Exception as e:
+                    logger.error(f"Response log compaction failed for {self._last_flush_day}: {e}")
+            self._last_flush_day = today
@@ -0,0 +1,197 @@
+from typing import Dict, List, Any, Optional
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from models import QuestionResponse
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+DAY_SECONDS = 86400.0
+
+# SM-2 parameters
+INITIAL_EASINESS = 2.5
+MIN_EASINESS = 1.3
+FIRST_INTERVAL_DAYS = 1.0
+SECOND_INTERVAL_DAYS = 6.0
+MAX_INTERVAL_DAYS = 365.0
+
+# Answer times (seconds) separating "easy" and "hesitant" correct answers
+FAST_ANSWER_SECONDS = 10
+SLOW_ANSWER_SECONDS = 30
+
+
+def grade_responses(is_correct: np.ndarray, time_taken: np.ndarray) -> np.ndarray:
+    """Map answers to SM-2 quality grades: 5/4/3 for fast/normal/slow correct answers, 1 for misses"""
+    correct_grade = np.where(time_taken <= FAST_ANSWER_SECONDS, 5,
+                             np.where(time_taken <= SLOW_ANSWER_SECONDS, 4, 3))
+    return np.where(is_correct, correct_grade, 1)
+
+
+def sm2_step(easiness: np.ndarray, interval: np.ndarray, repetitions: np.ndarray,
+             grade: np.ndarray):
+    """Apply one SM-2 review to arrays of memory states; returns new (easiness, interval, repetitions)"""
+    passed = grade >= 3
+    miss = 5 - grade
+    new_easiness = np.maximum(MIN_EASINESS, easiness + 0.1 - miss * (0.08 + miss * 0.02))
+
+    grown = np.select(
+        [repetitions == 0, repetitions == 1],
+        [FIRST_INTERVAL_DAYS, SECOND_INTERVAL_DAYS],
+        interval * new_easiness
+    )
+    new_interval = np.where(passed, np.minimum(grown, MAX_INTERVAL_DAYS), FIRST_INTERVAL_DAYS)
+    new_repetitions = np.where(passed, repetitions + 1, 0)
+    return new_easiness, new_interval, new_repetitions
+
+
+class ReviewScheduler:
+    """SM-2 spaced-repetition scheduling of individual questions
+
+    Each (user, question) pair has a memory state in ``review_states`` with a
+    ``next_due`` timestamp; the (user_id, next_due) index turns "what is due" into a
+    range scan. ``interval_modifier`` stretches or shrinks every interval and can be
+    applied to existing states with ``reschedule_all``.
+    """
+
+    def __init__(self, db, interval_modifier: float = 1.0, batch_size: int = 5000):
+        self.review_states_collection = db.review_states
+        self.interval_modifier = interval_modifier
+        self.batch_size = batch_size
+
+    async def ensure_indexes(self):
+        """Create indexes backing state upserts and due-item scans"""
+        await self.review_states_collection.create_index([("user_id", 1), ("question_id", 1)], unique=True)
+        await self.review_states_collection.create_index([("user_id", 1), ("next_due", 1)])
+
+    async def record_responses(self, user_id: str, lesson_id: str, topic_id: str,
+                               responses: List[QuestionResponse],
+                               reviewed_at: Optional[datetime] = None) -> int:
+        """Update memory states from a lesson's answers; returns the number of questions scheduled"""
+        # A question answered twice in one lesson counts once, with the last answer
+        latest = {response.question_id: response for response in responses}
+        if not latest:
+            return 0
+        reviewed_at = reviewed_at or datetime.utcnow()
+
+        question_ids = list(latest)
+        existing = await self.review_states_collection.find(
+            {"user_id": user_id, "question_id": {"$in": question_ids}},
+            {"_id": 0, "question_id": 1, "easiness": 1, "interval_days": 1, "repetitions": 1, "last_reviewed": 1}
+        ).to_list(None)
+        states = {state["question_id"]: state for state in existing}
+        # Answers already applied at this review time (a replayed lesson) are not stepped again
+        question_ids = [
+            q for q in question_ids
+            if not (q in states and states[q].get("last_reviewed") and states[q]["last_reviewed"] >= reviewed_at)
+        ]
+        if not question_ids:
+            return 0
+
+        easiness = np.array([states.get(q, {}).get("easiness", INITIAL_EASINESS) for q in question_ids])
+        interval = np.array([states.get(q, {}).get("interval_days", 0.0) for q in question_ids])
+        repetitions = np.array([states.get(q, {}).get("repetitions", 0) for q in question_ids])
+        grade = grade_responses(
+            np.array([latest[q].is_correct for q in question_ids]),
+            np.array([latest[q].time_taken for q in question_ids])
+        )
+
+        easiness, interval, repetitions = sm2_step(easiness, interval, repetitions, grade)
+        next_due = self._due_dates(np.full(len(question_ids), self._seconds(reviewed_at)), interval)
+
+        operations = [
+            UpdateOne(
+                {"user_id": user_id, "question_id": question_id},
+                {
+                    "$set": {
+                        "lesson_id": lesson_id,
+                        "topic_id": topic_id,
+                        "easiness": float(easiness[i]),
+                        "interval_days": float(interval[i]),
+                        "repetitions": int(repetitions[i]),
+                        "last_grade": int(grade[i]),
+                        "last_reviewed": reviewed_at,
+                        "next_due": next_due[i]
+                    },
+                    "$inc": {"reviews": 1, "lapses": int(grade[i] < 3)},
+                    "$setOnInsert": {"created_at": reviewed_at}
+                },
+                upsert=True
+            )
+            for i, question_id in enumerate(question_ids)
+        ]
+        await self.review_states_collection.bulk_write(operations, ordered=False)
+        return len(operations)
+
+    async def get_due(self, user_id: str, limit: int = 20, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Most overdue review items first"""
+        return await self.review_states_collection.find(
+            {"user_id": user_id, "next_due": {"$lte": now or datetime.utcnow()}},
+            {"_id": 0}
+        ).sort("next_due", 1).limit(limit).to_list(None)
+
+    async def reschedule_all(self, user_id: Optional[str] = None) -> int:
+        """Recompute ``next_due`` for every stored state (or one user's) with the current modifier
+
+        States are read in ``_id`` order in batches and rescheduled with array math, so
+        the job's memory use is bounded by ``batch_size``.
+        """
+        query: Dict[str, Any] = {"user_id": user_id} if user_id else {}
+        last_id = None
+        updated = 0
+
+        while True:
+            batch_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+            batch = await self.review_states_collection.find(
+                batch_query, {"_id": 1, "interval_days": 1, "last_reviewed": 1}
+            ).sort("_id", 1).limit(self.batch_size).to_list(None)
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+
+            batch = [state for state in batch if state.get("last_reviewed")]
+            if batch:
+                next_due = self._due_dates(
+                    np.array([self._seconds(state["last_reviewed"]) for state in batch]),
+                    np.array([state.get("interval_days", FIRST_INTERVAL_DAYS) for state in batch])
+                )
+                await self.review_states_collection.bulk_write([
+                    UpdateOne({"_id": state["_id"]}, {"$set": {"next_due": next_due[i]}})
+                    for i, state in enumerate(batch)
+                ], ordered=False)
+                updated += len(batch)
+
+        return updated
+
+    def _due_dates(self, reviewed_seconds: np.ndarray, interval_days: np.ndarray) -> List[datetime]:
+        due_seconds = reviewed_seconds + interval_days * self.interval_modifier * DAY_SECONDS
+        # Mongo stores millisecond precision; round so stored and computed values agree
+        return [EPOCH + timedelta(milliseconds=int(ms)) for ms in np.round(due_seconds * 1000)]
+
+    @staticmethod
+    def _seconds(moment: datetime) -> float:
+        return (moment - EPOCH).total_seconds()
+
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        scheduler = ReviewScheduler(
+            client[os.environ['DB_NAME']],
+            interval_modifier=float(os.environ.get('REVIEW_INTERVAL_MODIFIER', '1.0'))
+        )
+        await scheduler.ensure_indexes()
+        print(f"Rescheduled {await scheduler.reschedule_all()} review states")
+        client.close()
+
+    asyncio.run(main())
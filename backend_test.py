@@ -14,6 +14,11 @@ from typing import Dict, Any, List
 # Backend URL from environment
 BACKEND_URL = "https://finlingo-hub.preview.emergentagent.com/api"
 
+# Progress summary must stay this small however many lessons a user has done; this
+# mirrors progress_analytics.SUMMARY_BUDGET_BYTES, which tests/test_progress_analytics.py
+# checks against a seeded 5,000-lesson user (about 7.5 KB)
+PROGRESS_SUMMARY_BUDGET_BYTES = 16 * 1024
+
 class FinlingoBackendTester:
     def __init__(self):
         self.session = None
@@ -263,6 +268,47 @@ class FinlingoBackendTester:
             self.log_test("Discussions Retrieval", False, f"Exception: {str(e)}")
             return False
     
+    async def test_discussion_reply_thread(self):
+        """Test nested replies come back as a tree"""
+        if not self.test_discussion_id:
+            self.log_test("Discussion Reply Thread", False, "No test discussion ID available")
+            return False
+            
+        try:
+            replies_url = f"{BACKEND_URL}/discussions/{self.test_discussion_id}/replies"
+            reply_data = {"content": "Top-level reply", "author_id": self.test_user_id}
+            async with self.session.post(replies_url, params=reply_data) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    self.log_test("Discussion Reply Thread", False, f"HTTP {response.status}: {error_text}")
+                    return False
+                parent = await response.json()
+            
+            nested_data = {"content": "Nested reply", "author_id": self.test_user_id, "parent_reply_id": parent["id"]}
+            async with self.session.post(replies_url, params=nested_data) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    self.log_test("Discussion Reply Thread", False, f"HTTP {response.status}: {error_text}")
+                    return False
+            
+            async with self.session.get(replies_url) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    roots = data.get("replies", [])
+                    if roots and roots[0]["id"] == parent["id"] and len(roots[0]["replies"]) == 1:
+                        self.log_test("Discussion Reply Thread", True, f"Retrieved thread with {data['count']} replies", data)
+                        return True
+                    else:
+                        self.log_test("Discussion Reply Thread", False, f"Unexpected thread shape: {data}")
+                        return False
+                else:
+                    error_text = await response.text()
+                    self.log_test("Discussion Reply Thread", False, f"HTTP {response.status}: {error_text}")
+                    return False
+        except Exception as e:
+            self.log_test("Discussion Reply Thread", False, f"Exception: {str(e)}")
+            return False
+    
     async def test_lesson_completion_flow(self):
         """Test lesson completion flow"""
         if not self.test_user_id:
@@ -320,10 +366,14 @@ class FinlingoBackendTester:
         try:
             async with self.session.get(f"{BACKEND_URL}/users/{self.test_user_id}/progress") as response:
                 if response.status == 200:
-                    data = await response.json()
-                    required_sections = ["profile", "statistics"]
+                    body = await response.read()
+                    data = json.loads(body)
+                    required_sections = ["profile", "topics", "recent_activities", "statistics"]
+                    if len(body) > PROGRESS_SUMMARY_BUDGET_BYTES:
+                        self.log_test("User Progress Analytics", False, f"Summary is {len(body)} bytes, budget is {PROGRESS_SUMMARY_BUDGET_BYTES}")
+                        return False
                     if all(section in data for section in required_sections):
-                        self.log_test("User Progress Analytics", True, "Retrieved user progress analytics", data)
+                        self.log_test("User Progress Analytics", True, f"Retrieved user progress analytics ({len(body)} bytes)", data)
                         return True
                     else:
                         missing_sections = [section for section in required_sections if section not in data]
@@ -337,6 +387,40 @@ class FinlingoBackendTester:
             self.log_test("User Progress Analytics", False, f"Exception: {str(e)}")
             return False
     
+    async def test_user_progress_pages(self):
+        """Test paginated per-lesson progress"""
+        if not self.test_user_id:
+            self.log_test("User Progress Pages", False, "No test user ID available")
+            return False
+            
+        try:
+            url = f"{BACKEND_URL}/users/{self.test_user_id}/progress/lessons"
+            lesson_ids = []
+            cursor = None
+            # One row per page so the cursor is exercised even for a fresh test user
+            for _ in range(10):
+                params = {"limit": 1, **({"cursor": cursor} if cursor else {})}
+                async with self.session.get(url, params=params) as response:
+                    if response.status != 200:
+                        error_text = await response.text()
+                        self.log_test("User Progress Pages", False, f"HTTP {response.status}: {error_text}")
+                        return False
+                    data = await response.json()
+                lesson_ids.extend(item["lesson_id"] for item in data["items"])
+                cursor = data["next_cursor"]
+                if not cursor:
+                    break
+            
+            if lesson_ids:
+                self.log_test("User Progress Pages", True, f"Paged through {len(lesson_ids)} progress rows")
+                return True
+            else:
+                self.log_test("User Progress Pages", False, "No progress rows after lesson completion")
+                return False
+        except Exception as e:
+            self.log_test("User Progress Pages", False, f"Exception: {str(e)}")
+            return False
+    
     async def run_all_tests(self):
         """Run all backend tests"""
         print("🚀 Starting Enhanced Finlingo Backend Tests")
@@ -363,10 +447,12 @@ class FinlingoBackendTester:
             # Community features tests
             await self.test_discussion_creation()
             await self.test_discussions_retrieval()
+            await self.test_discussion_reply_thread()
             
             # Enhanced educational features tests
             await self.test_lesson_completion_flow()
             await self.test_user_progress_analytics()
+            await self.test_user_progress_pages()
             
         finally:
             await self.cleanup_session()
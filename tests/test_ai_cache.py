@@ -0,0 +1,237 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import ai_cache
+from ai_cache import CachedFailureError, ResponseCache
+
+START = datetime(2026, 3, 1, 12, 0)
+
+
+class Clock(datetime):
+    """Stands in for ``datetime`` inside ai_cache so tests choose ``utcnow``"""
+
+    current = START
+
+    @classmethod
+    def utcnow(cls):
+        return cls.current
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    Clock.current = START
+    monkeypatch.setattr(ai_cache, "datetime", Clock)
+    return Clock
+
+
+def advance(clock, seconds):
+    clock.current += timedelta(seconds=seconds)
+
+
+class FakeFetch:
+    """Returns numbered responses, or raises while ``fail`` is set"""
+
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    async def __call__(self):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("provider down")
+        return f"response-{self.calls}"
+
+
+def make_collection():
+    return AsyncMongoMockClient()["test"]["ai_response_cache"]
+
+
+def test_fresh_entries_are_hits(clock):
+    async def run():
+        cache = ResponseCache(make_collection(), ttl=60, stale_ttl=60)
+        fetch = FakeFetch()
+
+        assert await cache.get_or_fetch("k", fetch) == "response-1"
+        advance(clock, 59)
+        assert await cache.get_or_fetch("k", fetch) == "response-1"
+        assert fetch.calls == 1
+        assert cache.stats["misses"] == 1 and cache.stats["hits"] == 1
+        assert cache.get_stats()["hit_rate"] == 0.5
+
+    asyncio.run(run())
+
+
+def test_stale_entries_are_served_while_refreshed_behind_the_caller(clock):
+    async def run():
+        cache = ResponseCache(make_collection(), ttl=60, stale_ttl=60)
+        fetch = FakeFetch()
+        await cache.get_or_fetch("k", fetch)
+
+        advance(clock, 90)
+        assert await cache.get_or_fetch("k", fetch) == "response-1"
+        # A second stale read while the refresh runs does not start another one
+        assert await cache.get_or_fetch("k", fetch) == "response-1"
+        await asyncio.gather(*cache._refreshing.values())
+
+        assert fetch.calls == 2
+        assert cache.stats["stale_hits"] == 2 and cache.stats["refreshes"] == 1
+        assert await cache.get_or_fetch("k", fetch) == "response-2"
+        assert cache.stats["hits"] == 1
+
+    asyncio.run(run())
+
+
+def test_failed_refresh_keeps_the_stale_response(clock):
+    async def run():
+        cache = ResponseCache(make_collection(), ttl=60, stale_ttl=60, negative_ttl=30)
+        fetch = FakeFetch()
+        await cache.get_or_fetch("k", fetch)
+
+        advance(clock, 90)
+        fetch.fail = True
+        assert await cache.get_or_fetch("k", fetch) == "response-1"
+        await asyncio.gather(*cache._refreshing.values())
+
+        assert cache.stats["refreshes"] == 0
+        assert await cache.get_or_fetch("k", fetch) == "response-1"
+
+    asyncio.run(run())
+
+
+def test_expired_entries_are_misses(clock):
+    async def run():
+        cache = ResponseCache(make_collection(), ttl=60, stale_ttl=60)
+        fetch = FakeFetch()
+        await cache.get_or_fetch("k", fetch)
+
+        advance(clock, 120)
+        assert await cache.get_or_fetch("k", fetch) == "response-2"
+        assert cache.stats["misses"] == 2 and cache.stats["stale_hits"] == 0
+
+    asyncio.run(run())
+
+
+def test_failures_are_cached_for_the_negative_ttl(clock):
+    async def run():
+        cache = ResponseCache(make_collection(), ttl=60, negative_ttl=30)
+        fetch = FakeFetch()
+        fetch.fail = True
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_fetch("k", fetch)
+        with pytest.raises(CachedFailureError):
+            await cache.get_or_fetch("k", fetch)
+        assert fetch.calls == 1 and cache.stats["negative_hits"] == 1
+
+        # Once the failure expires the provider is tried again, and a success replaces it
+        advance(clock, 30)
+        fetch.fail = False
+        assert await cache.get_or_fetch("k", fetch) == "response-2"
+        assert "error" not in await cache.collection.find_one({"key": "k"})
+
+    asyncio.run(run())
+
+
+def test_invalid_responses_are_not_cached(clock):
+    async def run():
+        cache = ResponseCache(make_collection())
+        fetch = FakeFetch()
+
+        def reject(response):
+            raise ValueError("not JSON")
+
+        with pytest.raises(ValueError):
+            await cache.get_or_fetch("k", fetch, validate=reject)
+        assert await cache.get_or_fetch("k", fetch) == "response-2"
+
+    asyncio.run(run())
+
+
+def test_lru_evicts_the_least_recently_used_entry(clock):
+    async def run():
+        collection = make_collection()
+        cache = ResponseCache(collection, max_entries=2)
+        fetch = FakeFetch()
+
+        for key in ("a", "b"):
+            await cache.get_or_fetch(key, fetch)
+        await cache.get_or_fetch("a", fetch)
+        await cache.get_or_fetch("c", fetch)
+
+        assert list(cache._entries) == ["a", "c"]
+        assert cache.stats["evictions"] == 1
+        # The evicted entry is still served from the shared collection
+        assert await cache.get_or_fetch("b", fetch) == "response-2"
+        assert fetch.calls == 3 and cache.stats["evictions"] == 2
+
+    asyncio.run(run())
+
+
+def test_stored_entries_are_pruned_to_the_bound(clock):
+    async def run():
+        collection = make_collection()
+        cache = ResponseCache(collection, max_stored_entries=3, prune_every=2)
+        fetch = FakeFetch()
+
+        for key in "abcde":
+            await cache.get_or_fetch(key, fetch)
+            advance(clock, 1)
+
+        # Pruned after the 2nd and 4th writes; the 5th waits for the next round
+        assert await collection.count_documents({}) == 4
+        assert cache.stats["pruned"] == 1
+        assert await collection.find_one({"key": "a"}) is None
+
+        await cache.get_or_fetch("f", fetch)
+        assert sorted([doc["key"] async for doc in collection.find()]) == ["d", "e", "f"]
+
+    asyncio.run(run())
+
+
+def test_invalidation_reaches_other_workers(clock):
+    async def run():
+        collection = make_collection()
+        first = ResponseCache(collection, local_ttl=0)
+        second = ResponseCache(collection, local_ttl=0)
+        fetch = FakeFetch()
+
+        assert await first.get_or_fetch("k", fetch) == "response-1"
+        assert await second.get_or_fetch("k", fetch) == "response-1"
+
+        await first.invalidate("k")
+        assert await second.get_or_fetch("k", fetch) == "response-2"
+
+    asyncio.run(run())
+
+
+def test_local_copies_are_trusted_within_the_local_ttl(clock):
+    async def run():
+        collection = make_collection()
+        cache = ResponseCache(collection, local_ttl=60)
+        fetch = FakeFetch()
+        await cache.get_or_fetch("k", fetch)
+
+        await collection.delete_one({"key": "k"})
+        assert await cache.get_or_fetch("k", fetch) == "response-1"
+
+    asyncio.run(run())
+
+
+def test_invalidate_cancels_a_pending_refresh(clock):
+    async def run():
+        cache = ResponseCache(make_collection(), ttl=60, stale_ttl=60)
+        fetch = FakeFetch()
+        await cache.get_or_fetch("k", fetch)
+
+        advance(clock, 90)
+        await cache.get_or_fetch("k", fetch)
+        await cache.invalidate("k")
+        await asyncio.sleep(0)
+
+        assert await cache.collection.count_documents({}) == 0
+        assert cache._refreshing == {}
+
+    asyncio.run(run())
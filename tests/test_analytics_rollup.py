@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from analytics_rollup import AnalyticsRollup
+from curriculum import CurriculumService, CurriculumSnapshot
+
+ACTIVITIES = 120
+
+
+class YieldingCollection:
+    """Lets other tasks run after each checkpoint read, as a real server round trip would"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_one(self, *args, **kwargs):
+        document = await self.collection.find_one(*args, **kwargs)
+        await asyncio.sleep(0)
+        return document
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+async def seed(db):
+    curriculum = CurriculumService(db, refresh_interval=0)
+    curriculum.snapshot = CurriculumSnapshot(
+        [{"id": "budgeting", "order": 1}],
+        [{"id": "lesson-1", "topic_id": "budgeting", "order": 1}]
+    )
+    start = datetime.utcnow() - timedelta(hours=1)
+    await db.user_activities.insert_many([
+        {"id": f"activity-{i:04d}", "user_id": f"user-{i % 30}", "activity_type": "lesson_completed",
+         "content_id": "lesson-1", "xp_earned": 10 * (i % 5 + 1),
+         "metadata": {"score": 50 + i % 50, "time_spent": 60 + i}, "created_at": start + timedelta(seconds=i)}
+        for i in range(ACTIVITIES)
+    ])
+    return curriculum
+
+
+async def day_total(rollup):
+    today = datetime.utcnow().date()
+    result = await rollup.query(today - timedelta(days=1), today)
+    return result["total"]
+
+
+def test_concurrent_runs_do_not_double_count():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        curriculum = await seed(db)
+        workers = [AnalyticsRollup(db, curriculum, batch_size=25, interval=0) for _ in range(2)]
+        await workers[0].ensure_indexes()
+        for worker in workers:
+            worker.state_collection = YieldingCollection(worker.state_collection)
+
+        results = await asyncio.gather(*(worker.run() for worker in workers))
+        await workers[0].run()
+
+        assert sum(r["activities"] for r in results) <= ACTIVITIES
+        total = await day_total(workers[0])
+        assert total["count"] == ACTIVITIES
+        assert total["xp"] == sum(10 * (i % 5 + 1) for i in range(ACTIVITIES))
+        assert abs(total["distinct_users"] - 30) <= 2
+        assert total["xp_median"] is not None and 15 <= total["xp_median"] <= 63
+
+    asyncio.run(run())
+
+
+def test_batch_taken_over_after_a_crash_is_not_counted_twice():
+    class CrashAfterFold(AnalyticsRollup):
+        async def _fold(self, activities, batch_id):
+            await super()._fold(activities, batch_id)
+            raise RuntimeError("worker died before the checkpoint")
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        curriculum = await seed(db)
+        crashed = CrashAfterFold(db, curriculum, batch_size=50, interval=0, lease_seconds=0)
+        await crashed.ensure_indexes()
+        try:
+            await crashed.run()
+        except RuntimeError:
+            pass
+        state = await db.analytics_rollup_state.find_one({"_id": "user_activities"})
+        assert state["pending"]["id"] == "activity-0049"
+
+        survivor = AnalyticsRollup(db, curriculum, batch_size=50, interval=0)
+        stats = await survivor.run()
+        assert stats["activities"] == ACTIVITIES
+        assert (await day_total(survivor))["count"] == ACTIVITIES
+        state = await db.analytics_rollup_state.find_one({"_id": "user_activities"})
+        assert "pending" not in state and state["id"] == f"activity-{ACTIVITIES - 1:04d}"
+
+    asyncio.run(run())
@@ -0,0 +1,151 @@
+import asyncio
+from datetime import datetime
+
+from mongomock_motor import AsyncMongoMockClient
+
+from author_service import AuthorSnapshotService
+
+
+async def seed(db, posts=5, replies=3):
+    await db.user_profiles.insert_one({"id": "author", "username": "old", "display_name": "Old Name",
+                                       "avatar_url": None})
+    await db.discussions.insert_many([
+        {"id": f"d{i}", "author_id": "author", "author_username": "old", "created_at": datetime.utcnow()}
+        for i in range(posts)
+    ] + [{"id": "other", "author_id": "someone", "author_username": "someone", "created_at": datetime.utcnow()}])
+    for i in range(replies):
+        await db.discussion_replies.insert_one(
+            {"id": f"r{i}", "author_id": "author", "author_username": "old", "created_at": datetime.utcnow()}
+        )
+
+
+async def rename(db, service, username):
+    await db.user_profiles.update_one({"id": "author"}, {"$set": {"username": username}})
+    profile = await db.user_profiles.find_one({"id": "author"})
+    await service.schedule_fanout("author", profile)
+
+
+async def finish(service):
+    await asyncio.gather(*service._fanout_tasks.values())
+
+
+async def usernames(collection, author_id="author"):
+    return {doc["author_username"] async for doc in collection.find({"author_id": author_id})}
+
+
+def test_snapshots_are_cached_until_max_age():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await seed(db)
+        service = AuthorSnapshotService(db, max_age=0.05)
+
+        assert (await service.get_snapshot("author"))["username"] == "old"
+        # A change written through another worker
+        await db.user_profiles.update_one({"id": "author"}, {"$set": {"username": "new"}})
+        assert (await service.get_snapshot("author"))["username"] == "old"
+
+        await asyncio.sleep(0.06)
+        assert (await service.get_snapshot("author"))["username"] == "new"
+        assert await service.get_snapshot("missing") is None
+
+    asyncio.run(run())
+
+
+def test_cache_is_bounded_and_invalidated():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await db.user_profiles.insert_many([{"id": f"u{i}", "username": f"user-{i}"} for i in range(3)])
+        service = AuthorSnapshotService(db, cache_size=2)
+
+        for i in range(3):
+            await service.get_snapshot(f"u{i}")
+        assert list(service._cache) == ["u1", "u2"]
+
+        await db.user_profiles.update_one({"id": "u2"}, {"$set": {"username": "renamed"}})
+        service.invalidate("u2")
+        assert (await service.get_snapshot("u2"))["username"] == "renamed"
+
+    asyncio.run(run())
+
+
+def test_fanout_rewrites_every_post_in_batches():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await seed(db)
+        service = AuthorSnapshotService(db, batch_size=2, max_age=0)
+        await service.ensure_indexes()
+
+        await rename(db, service, "new")
+        assert (await service.get_snapshot("author"))["username"] == "new"
+        await finish(service)
+
+        assert await usernames(db.discussions) == {"new"}
+        assert await usernames(db.discussion_replies) == {"new"}
+        assert await usernames(db.discussions, "someone") == {"someone"}
+        job = await db.author_fanout_jobs.find_one({"user_id": "author"})
+        assert job["status"] == "completed"
+        assert set(job["checkpoints"]) == {"discussions", "discussion_replies"}
+
+    asyncio.run(run())
+
+
+def test_interrupted_fanout_resumes_from_its_checkpoint():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await seed(db, posts=4, replies=0)
+        ids = [doc["_id"] async for doc in db.discussions.find({"author_id": "author"}).sort("_id", 1)]
+        await db.author_fanout_jobs.insert_one({
+            "user_id": "author", "status": "running", "snapshot": {"username": "new"},
+            "checkpoints": {"discussions": ids[1]}
+        })
+        service = AuthorSnapshotService(db, batch_size=1)
+
+        await service.resume_pending_jobs()
+        await finish(service)
+
+        rows = {doc["_id"]: doc["author_username"] async for doc in db.discussions.find({"author_id": "author"})}
+        # Batches before the checkpoint were written before the interruption
+        assert [rows[_id] for _id in ids] == ["old", "old", "new", "new"]
+
+    asyncio.run(run())
+
+
+def test_newer_change_restarts_the_fanout():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await seed(db)
+        service = AuthorSnapshotService(db, batch_size=1, max_age=0)
+
+        await rename(db, service, "first")
+        await asyncio.sleep(0)
+        await rename(db, service, "second")
+        await finish(service)
+
+        assert await usernames(db.discussions) == {"second"}
+        assert await usernames(db.discussion_replies) == {"second"}
+
+    asyncio.run(run())
+
+
+def test_posts_written_from_a_stale_cache_are_settled():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await seed(db)
+        stale_worker = AuthorSnapshotService(db, max_age=0.2)
+        updating_worker = AuthorSnapshotService(db, max_age=0.2)
+        await stale_worker.get_snapshot("author")
+
+        await rename(db, updating_worker, "new")
+        # Let the batches finish; the fan-out now waits for cached copies to expire
+        await asyncio.sleep(0.05)
+        assert await usernames(db.discussions) == {"new"}
+
+        author = await stale_worker.get_snapshot("author")
+        await db.discussions.insert_one({"id": "late", "author_id": "author", "created_at": datetime.utcnow(),
+                                         **stale_worker.embed(author)})
+        assert await usernames(db.discussions) == {"old", "new"}
+
+        await finish(updating_worker)
+        assert await usernames(db.discussions) == {"new"}
+
+    asyncio.run(run())
@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+from mongomock_motor import AsyncMongoMockClient
+
+from ai_service import AIService, LLMGateway
+from batch_generate import BatchRunner, expand_manifest, load_checkpoint
+from question_dedup import QuestionDeduplicator
+
+QUESTION_TEXTS = [
+    "What is the main purpose of creating a monthly budget?",
+    "How does compound interest differ from simple interest?",
+    "Why is an emergency fund important before investing in stocks?",
+    "What happens to bond prices when interest rates rise?",
+    "Which factor has the largest impact on your credit score?",
+    "What is inflation and how does it affect purchasing power?",
+]
+
+
+class FakeTransport:
+    """Answers question prompts with canned questions; fails prompts containing ``fail_on``"""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.calls = 0
+
+    async def complete(self, system_message, prompt):
+        self.calls += 1
+        if self.fail_on and self.fail_on in prompt:
+            raise ConnectionError("provider unavailable")
+        start = (self.calls - 1) * 3 % len(QUESTION_TEXTS)
+        return json.dumps([
+            {"question": QUESTION_TEXTS[(start + i) % len(QUESTION_TEXTS)], "options": ["a", "b"],
+             "correct_answer": "a", "explanation": "Because."}
+            for i in range(3)
+        ])
+
+    async def stream(self, system_message, prompt):
+        yield await self.complete(system_message, prompt)
+
+
+MANIFEST = {
+    "topics": [{"topic_id": "budgeting", "lessons": ["lesson-1", "lesson-2"]}],
+    "difficulties": [1, 2],
+    "question_types": ["multiple-choice"],
+    "questions_per_cell": 3,
+}
+
+
+def runner(tmp_path, transport):
+    collection = AsyncMongoMockClient()["test"].questions
+    ai_service = AIService(gateway=LLMGateway(transport, max_retries=0))
+    return BatchRunner(ai_service, collection, QuestionDeduplicator(collection), tmp_path / "checkpoint.jsonl", 2)
+
+
+def test_batch_run_stores_questions_and_checkpoints_cells(tmp_path):
+    async def run():
+        batch = runner(tmp_path, FakeTransport())
+        await batch.deduplicator.ensure_indexes()
+        cells = expand_manifest(MANIFEST)
+
+        await batch.run(cells)
+
+        assert batch.stats["cells_done"] == 4
+        assert batch.stats["questions_generated"] == 12
+        assert batch.stats["questions_inserted"] == await batch.questions_collection.count_documents({})
+        assert load_checkpoint(batch.checkpoint) == {cell["key"] for cell in cells}
+
+    asyncio.run(run())
+
+
+def test_failed_cells_are_not_checkpointed(tmp_path):
+    async def run():
+        batch = runner(tmp_path, FakeTransport(fail_on="Difficulty level: 2/5"))
+        await batch.deduplicator.ensure_indexes()
+
+        await batch.run(expand_manifest(MANIFEST))
+
+        assert (batch.stats["cells_done"], batch.stats["cells_failed"]) == (2, 2)
+        assert load_checkpoint(batch.checkpoint) == {"budgeting|lesson-1|1|multiple-choice",
+                                                     "budgeting|lesson-2|1|multiple-choice"}
+
+    asyncio.run(run())
+
+
+def test_questions_already_stored_under_the_same_id_are_not_counted(tmp_path):
+    async def run():
+        batch = runner(tmp_path, FakeTransport())
+        await batch.deduplicator.ensure_indexes()
+        cell = expand_manifest(MANIFEST)[0]
+        questions = await batch.ai_service.generate_questions(
+            topic_id=cell["topic_id"], lesson_id=cell["lesson_id"], difficulty=cell["difficulty"],
+            question_type=cell["question_type"], count=3, use_cache=False
+        )
+        # Stored by a writer that did not record signatures, so dedup cannot see it
+        await batch.questions_collection.insert_one({"id": questions[0]["id"], "topic_id": "budgeting"})
+        batch.ai_service.gateway.transport.calls = 0
+
+        assert await batch._generate_cell(cell) == 2
+        assert await batch.questions_collection.count_documents({"id": questions[0]["id"]}) == 1
+
+    asyncio.run(run())
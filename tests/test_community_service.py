@@ -0,0 +1,132 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from community_service import CommunityService, _hot_score_expression, _increment_and_rescore, compute_hot_score
+
+
+def reply(reply_id, minutes, parent=None, **fields):
+    return {"id": reply_id, "discussion_id": "thread", "content": reply_id, "author_id": "author",
+            "parent_reply_id": parent, "upvotes": 0,
+            "created_at": datetime(2026, 1, 1) + timedelta(minutes=minutes), **fields}
+
+
+def test_legacy_replies_get_paths_and_the_thread_pages_to_the_end():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await db.discussions.insert_one({"id": "thread", "title": "Budgets", "reply_seq": 1})
+        await db.discussion_replies.insert_many([
+            # Written before replies had paths, one with an empty path
+            reply("legacy-1", 0),
+            reply("legacy-2", 1, parent="legacy-1"),
+            reply("legacy-3", 2, path=""),
+            reply("legacy-4", 3, parent="legacy-2"),
+            # A reply with a path whose parent is a legacy reply started a new segment
+            reply("current-1", 4, parent="legacy-3", path="00000001", depth=0),
+        ])
+        service = CommunityService(db, author_snapshots=None)
+        await service.ensure_indexes()
+
+        rows = {r["id"]: r async for r in db.discussion_replies.find({})}
+        assert rows["legacy-1"]["path"] == "00000002" and rows["legacy-1"]["depth"] == 0
+        assert rows["legacy-2"]["path"] == "00000002.00000003" and rows["legacy-2"]["depth"] == 1
+        assert rows["legacy-4"]["path"] == "00000002.00000003.00000005" and rows["legacy-4"]["depth"] == 2
+        assert rows["current-1"]["path"] == "00000001"
+        assert (await db.discussions.find_one({"id": "thread"}))["reply_seq"] == 5
+        assert (await service.backfill_reply_paths())["replies"] == 0
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            page = await service.get_reply_thread("thread", cursor=cursor, limit=1)
+            pages += 1
+            stack = list(page["replies"])
+            while stack:
+                node = stack.pop()
+                seen.append(node["id"])
+                stack.extend(node["replies"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+            assert pages < 10
+        assert sorted(seen) == sorted(rows)
+
+    asyncio.run(run())
+
+
+def test_paging_stops_at_a_reply_without_a_path():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await db.discussion_replies.insert_many([reply("legacy-1", 0), reply("legacy-2", 1, path="")])
+        service = CommunityService(db, author_snapshots=None)
+
+        page = await service.get_reply_thread("thread", limit=1)
+        assert page["count"] == 1
+        assert page["next_cursor"] is None
+
+    asyncio.run(run())
+
+
+DISCUSSIONS = [
+    {"id": "popular", "upvotes": 120, "downvotes": 7, "reply_count": 30, "created_at": datetime(2026, 2, 3, 4, 5)},
+    {"id": "disliked", "upvotes": 1, "downvotes": 9, "reply_count": 1, "created_at": datetime(2025, 6, 1)},
+    {"id": "balanced", "upvotes": 3, "downvotes": 4, "reply_count": 2, "created_at": datetime(2025, 12, 31, 23, 59)},
+    {"id": "one-vote", "upvotes": 1, "downvotes": 0, "reply_count": 0, "created_at": datetime(2026, 3, 1)},
+    {"id": "before-epoch", "upvotes": 2, "downvotes": 0, "reply_count": 0, "created_at": datetime(2024, 7, 1)},
+    # Counters missing on documents written before they existed count as zero
+    {"id": "legacy", "created_at": datetime(2025, 3, 4, 5, 6, 7)},
+]
+
+
+def python_score(doc):
+    return compute_hot_score(doc.get("upvotes", 0), doc.get("downvotes", 0), doc.get("reply_count", 0),
+                             doc["created_at"])
+
+
+def test_hot_score_expression_matches_the_python_score():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await db.discussions.insert_many([dict(doc) for doc in DISCUSSIONS])
+
+        scored = {doc["id"]: doc["hot_score"] async for doc in db.discussions.aggregate(
+            [{"$project": {"id": 1, "hot_score": _hot_score_expression()}}]
+        )}
+
+        for doc in DISCUSSIONS:
+            assert scored[doc["id"]] == pytest.approx(python_score(doc), abs=1e-9)
+
+    asyncio.run(run())
+
+
+def test_increment_rescores_in_the_same_write():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        doc = dict(DISCUSSIONS[1])
+        await db.discussions.insert_one(dict(doc))
+
+        await db.discussions.update_one({"id": doc["id"]}, _increment_and_rescore("upvotes"))
+
+        stored = await db.discussions.find_one({"id": doc["id"]})
+        assert stored["upvotes"] == doc["upvotes"] + 1
+        assert stored["hot_score"] == pytest.approx(python_score(stored), abs=1e-9)
+
+    asyncio.run(run())
+
+
+def test_startup_backfill_scores_only_unscored_discussions():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await db.discussions.insert_many([dict(doc) for doc in DISCUSSIONS])
+        # Scored at creation or by an earlier backfill; left as it is
+        await db.discussions.update_one({"id": "popular"}, {"$set": {"hot_score": 1.5}})
+        service = CommunityService(db, author_snapshots=None)
+
+        await service.ensure_indexes()
+
+        rows = {doc["id"]: doc async for doc in db.discussions.find({})}
+        assert rows["popular"]["hot_score"] == 1.5
+        for doc in DISCUSSIONS[1:]:
+            assert rows[doc["id"]]["hot_score"] == pytest.approx(python_score(doc), abs=1e-9)
+
+    asyncio.run(run())
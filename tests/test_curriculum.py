@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from curriculum import CurriculumSnapshot
+
+
+def lesson(topic, index, prerequisites=()):
+    return {"id": f"{topic}-{index}", "topic_id": topic, "order": index, "prerequisites": list(prerequisites)}
+
+
+def two_topic_curriculum():
+    """70 + 70 lessons, so both topics and several prerequisites straddle 64-bit words"""
+    topics = [{"id": "basics", "order": 1}, {"id": "investing", "order": 2, "prerequisites": ["basics"]}]
+    lessons = [lesson("basics", i, [f"basics-{i - 1}"] if i else []) for i in range(70)]
+    lessons += [lesson("investing", i, ["basics-63"] if i == 0 else [f"investing-{i - 1}"]) for i in range(70)]
+    return CurriculumSnapshot(topics, lessons)
+
+
+def reference_locked(snapshot, completed):
+    """Locked lessons and topics computed directly from the prerequisite lists"""
+    topic_lessons = {topic["id"]: {l["id"] for l in snapshot.lessons if l["topic_id"] == topic["id"]}
+                     for topic in snapshot.topics}
+    locked_topics = {
+        topic["id"] for topic in snapshot.topics
+        if any(not topic_lessons[p] <= completed for p in topic.get("prerequisites", []))
+    }
+    locked_lessons = {
+        l["id"] for l in snapshot.lessons
+        if l["topic_id"] in locked_topics or not set(l["prerequisites"]) <= completed
+    }
+    return locked_lessons, locked_topics
+
+
+def test_locked_ids_across_word_boundary():
+    snapshot = two_topic_curriculum()
+    assert snapshot.words == 3
+
+    completed = {f"basics-{i}" for i in range(66)}
+    locked_lessons, locked_topics = snapshot.locked_ids(completed)
+
+    # basics-66 needs basics-65 (word 1) and is open; basics-67 needs basics-66
+    assert "basics-66" not in locked_lessons
+    assert "basics-67" in locked_lessons
+    # investing needs every lesson of basics, including bits 64-69
+    assert locked_topics == {"investing"}
+    assert "investing-0" in locked_lessons
+
+    locked_lessons, locked_topics = snapshot.locked_ids({f"basics-{i}" for i in range(70)})
+    assert locked_topics == set()
+    assert "investing-0" not in locked_lessons
+    assert "investing-1" in locked_lessons
+
+
+def test_locked_ids_match_reference_for_random_progress():
+    snapshot = two_topic_curriculum()
+    rng = np.random.default_rng(3)
+    for _ in range(50):
+        completed = {l for l in snapshot.lesson_ids if rng.random() < 0.8}
+        assert snapshot.locked_ids(completed) == reference_locked(snapshot, completed)
+
+
+def test_topological_order_puts_prerequisites_first():
+    snapshot = two_topic_curriculum()
+    position = {snapshot.lesson_ids[i]: p for p, i in enumerate(snapshot.topological_order.tolist())}
+    assert len(position) == snapshot.size
+    for l in snapshot.lessons:
+        assert all(position[p] < position[l["id"]] for p in l["prerequisites"])
+    assert max(position[f"basics-{i}"] for i in range(70)) < position["investing-0"]
+
+
+def test_lesson_cycle_is_rejected():
+    lessons = [lesson("basics", 0, ["basics-1"]), lesson("basics", 1, ["basics-0"])]
+    with pytest.raises(ValueError, match="Prerequisite cycle"):
+        CurriculumSnapshot([{"id": "basics"}], lessons)
+
+
+def test_mixed_topic_and_lesson_cycle_is_rejected():
+    # investing requires all of basics, but a basics lesson requires an investing lesson
+    topics = [{"id": "basics", "order": 1}, {"id": "investing", "order": 2, "prerequisites": ["basics"]}]
+    lessons = [lesson("basics", 0), lesson("basics", 1, ["investing-0"]), lesson("investing", 0)]
+    with pytest.raises(ValueError, match="Prerequisite cycle"):
+        CurriculumSnapshot(topics, lessons)
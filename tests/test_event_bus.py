@@ -0,0 +1,81 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from event_bus import EventBus
+from gamification_service import GamificationService
+from models import AchievementType
+
+
+def activity(index, user_id="user-1", xp=10, gems=1):
+    return {
+        "id": f"activity-{index}",
+        "user_id": user_id,
+        "activity_type": "lesson_completed",
+        "xp_earned": xp,
+        "gems_earned": gems,
+        "created_at": datetime(2026, 1, 1) + timedelta(seconds=index)
+    }
+
+
+def test_new_consumer_starts_at_tail():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await db.user_activities.insert_many([activity(i) for i in range(3)])
+        seen = []
+
+        async def handler(batch):
+            seen.extend(record["id"] for record in batch)
+
+        bus = EventBus(db)
+        bus.register("totals", handler)
+        bus.consumers["totals"].offset = await bus._load_offset("totals")
+        await bus.drain()
+        assert seen == []
+
+        await db.user_activities.insert_one(activity(3))
+        await bus.drain()
+        assert seen == ["activity-3"]
+        assert (await db.event_offsets.find_one({"_id": "totals"}))["id"] == "activity-3"
+
+    asyncio.run(run())
+
+
+def test_redelivered_mixed_batch_applies_only_new_activities():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        service = GamificationService(db)
+        await db.user_profiles.insert_one({"id": "user-1", "total_xp": 0, "total_gems": 0})
+        activities = [activity(i) for i in range(3)]
+
+        await service.apply_activity_totals(activities[:2])
+        await service.apply_activity_totals(activities)
+        await service.apply_activity_totals(activities)
+
+        profile = await db.user_profiles.find_one({"id": "user-1"})
+        assert profile["total_xp"] == 30
+        assert profile["total_gems"] == 3
+
+    asyncio.run(run())
+
+
+def test_concurrent_checks_award_an_achievement_once():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        service = GamificationService(db)
+        await service.ensure_indexes()
+        await db.achievements.insert_one({
+            "id": "first-lesson", "type": AchievementType.LESSONS, "is_active": True,
+            "requirement": {"lessons_completed": 1}, "reward_xp": 50, "reward_gems": 10
+        })
+        await db.user_profiles.insert_one({"id": "user-1", "lessons_completed": ["lesson-1"]})
+
+        await asyncio.gather(*(service.check_and_award_achievements("user-1", {}) for _ in range(5)))
+
+        assert await db.user_achievements.count_documents({"user_id": "user-1"}) == 1
+        profile = await db.user_profiles.find_one({"id": "user-1"})
+        assert profile["achievements"] == ["first-lesson"]
+        assert await db.user_activities.count_documents({"activity_type": "achievement_earned"}) == 1
+
+    asyncio.run(run())
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from hearts import HeartsService, refill_hearts
+
+REFILL = 60
+
+
+async def service_with(**profile):
+    db = AsyncMongoMockClient()["test"]
+    await db.user_profiles.insert_one({"id": "user-1", "max_hearts": 5, **profile})
+    return HeartsService(db, refill_seconds=REFILL), db
+
+
+def test_hearts_regenerate_across_several_intervals():
+    now = datetime(2026, 1, 1, 12, 0)
+    last = now - timedelta(seconds=3.5 * REFILL)
+
+    hearts = refill_hearts({"hearts": 1, "max_hearts": 5, "last_heart_refill": last}, REFILL, now)
+
+    assert hearts["hearts"] == 4
+    # Whole periods are consumed; the half period carries over to the next heart
+    assert hearts["last_heart_refill"] == last + timedelta(seconds=3 * REFILL)
+    assert hearts["next_heart_at"] == last + timedelta(seconds=4 * REFILL)
+
+
+def test_regeneration_stops_at_max_hearts():
+    now = datetime(2026, 1, 1, 12, 0)
+    hearts = refill_hearts({"hearts": 2, "max_hearts": 5, "last_heart_refill": now - timedelta(days=1)}, REFILL, now)
+
+    assert hearts["hearts"] == 5
+    assert hearts["next_heart_at"] is None
+
+
+def test_spend_applies_pending_refills_in_the_same_update():
+    async def run():
+        last = datetime.utcnow() - timedelta(seconds=2.5 * REFILL)
+        service, db = await service_with(hearts=1, last_heart_refill=last)
+
+        hearts = await service.spend("user-1")
+
+        assert hearts["hearts"] == 2
+        stored = await db.user_profiles.find_one({"id": "user-1"})
+        assert stored["hearts"] == 2
+        assert abs((stored["last_heart_refill"] - (last + timedelta(seconds=2 * REFILL))).total_seconds()) < 0.01
+
+    asyncio.run(run())
+
+
+def test_spending_from_full_starts_the_refill_clock():
+    async def run():
+        service, db = await service_with(hearts=5, last_heart_refill=datetime.utcnow() - timedelta(days=2))
+
+        hearts = await service.spend("user-1")
+
+        assert hearts["hearts"] == 4
+        assert abs((hearts["next_heart_at"] - datetime.utcnow()).total_seconds() - REFILL) < 1
+
+    asyncio.run(run())
+
+
+def test_spend_at_zero_hearts_is_rejected():
+    async def run():
+        service, db = await service_with(hearts=0, last_heart_refill=datetime.utcnow())
+
+        assert await service.spend("user-1") is None
+        assert (await db.user_profiles.find_one({"id": "user-1"}))["hearts"] == 0
+        assert await service.spend("nobody") is None
+        assert await service.get("nobody") is None
+
+        # Once a heart has regenerated it can be spent
+        await db.user_profiles.update_one(
+            {"id": "user-1"}, {"$set": {"last_heart_refill": datetime.utcnow() - timedelta(seconds=REFILL + 1)}}
+        )
+        assert (await service.spend("user-1"))["hearts"] == 0
+
+    asyncio.run(run())
+
+
+def test_concurrent_spends_never_go_below_zero():
+    async def run():
+        service, db = await service_with(hearts=3, last_heart_refill=datetime.utcnow())
+
+        results = await asyncio.gather(*(service.spend("user-1") for _ in range(6)))
+
+        assert sum(result is not None for result in results) == 3
+        assert sorted(result["hearts"] for result in results if result) == [0, 1, 2]
+        assert (await service.get("user-1"))["hearts"] == 0
+
+    asyncio.run(run())
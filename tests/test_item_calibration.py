@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+from mongomock_motor import AsyncMongoMockClient
+
+from item_calibration import ABILITY_BINS, ItemCalibrator, ability_bins, fit_2pl
+from models import QuestionResponse
+from response_log import ResponseLog
+
+
+def test_fit_2pl_recovers_synthetic_items():
+    rng = np.random.default_rng(7)
+    discrimination = np.array([0.8, 1.0, 1.5, 2.0])
+    difficulty = np.array([-1.5, 0.0, 0.5, 1.2])
+    theta = rng.normal(0.0, 1.2, size=20000)
+
+    p = 1.0 / (1.0 + np.exp(-discrimination[:, None] * (theta - difficulty[:, None])))
+    correct = rng.random(p.shape) < p
+    bins = ability_bins(theta)
+    bin_answers = np.stack([np.bincount(bins, minlength=ABILITY_BINS) for _ in discrimination]).astype(float)
+    bin_correct = np.stack([np.bincount(bins, weights=row, minlength=ABILITY_BINS) for row in correct])
+
+    fitted_a, fitted_b = fit_2pl(bin_answers, bin_correct)
+
+    assert np.allclose(fitted_b, difficulty, atol=0.15)
+    assert np.allclose(fitted_a, discrimination, rtol=0.2)
+
+
+def responses(count, correct=True):
+    return [QuestionResponse(question_id=f"q{i}", user_answer="a", is_correct=correct, time_taken=5)
+            for i in range(count)]
+
+
+def test_late_and_compacted_files_are_read_once(tmp_path):
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        log = ResponseLog(str(tmp_path))
+        calibrator = ItemCalibrator(db, log)
+        now = datetime.utcnow().replace(hour=12, minute=0)
+
+        log.append("user-1", "lesson-1", "topic-1", responses(3), answered_at=now)
+        await log.flush()
+        assert (await calibrator.run())["responses"] == 3
+
+        # Rows answered before the last run but flushed after it
+        log.append("user-2", "lesson-1", "topic-1", responses(2), answered_at=now - timedelta(seconds=30))
+        await log.flush()
+        assert (await calibrator.run())["responses"] == 2
+
+        # Compacting replaces processed parts; only the newest part is unread
+        log.append("user-3", "lesson-1", "topic-1", responses(4, correct=False), answered_at=now)
+        await log.flush()
+        assert log.compact(now.date())
+        assert (await calibrator.run())["responses"] == 4
+        assert (await calibrator.run())["responses"] == 0
+
+        item = await db.item_calibration.find_one({"question_id": "q0"})
+        assert item["response_count"] == 3
+
+    asyncio.run(run())
+
+
+def test_a_run_that_dies_mid_file_is_not_counted_twice(tmp_path):
+    class DiesAfterTwoBatches(ItemCalibrator):
+        applied = 0
+
+        async def _accumulate(self, batch, batch_key):
+            if self.applied == 2:
+                raise RuntimeError("calibration job killed")
+            await super()._accumulate(batch, batch_key)
+            self.applied += 1
+
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        log = ResponseLog(str(tmp_path))
+        now = datetime.utcnow().replace(hour=12, minute=0)
+        # Separate days, so the files are read in this order
+        log.append("user-1", "lesson-1", "topic-1", responses(3), answered_at=now - timedelta(days=1))
+        await log.flush()
+        log.append("user-2", "lesson-1", "topic-1", responses(10), answered_at=now)
+        await log.flush()
+
+        crashed = DiesAfterTwoBatches(db, log, batch_size=4)
+        await crashed.ensure_indexes()
+        try:
+            await crashed.run()
+        except RuntimeError:
+            pass
+
+        # The first file was checkpointed; the second is replayed from its first batch
+        stats = await ItemCalibrator(db, log, batch_size=4).run()
+        assert stats["responses"] == 10
+        abilities = {doc["user_id"]: doc async for doc in db.irt_abilities.find({})}
+        assert abilities["user-1"]["answers"] == 3
+        assert abilities["user-2"]["answers"] == 10
+        items = [doc async for doc in db.item_calibration.find({})]
+        assert sum(item["response_count"] for item in items) == 13
+        assert not any(item["stale"] for item in items)
+
+    asyncio.run(run())
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from json_stream import JSONArrayStreamParser, parse_json_array
+
+
+def feed_in_chunks(text, size):
+    parser = JSONArrayStreamParser()
+    elements = []
+    for start in range(0, len(text), size):
+        elements += parser.feed(text[start:start + size])
+    return elements + parser.close(), parser.errors
+
+
+def assert_every_split(text, expected, errors=0):
+    """Every chunk size, from one character at a time to the whole text, gives the same result"""
+    for size in range(1, len(text) + 1):
+        assert feed_in_chunks(text, size) == (expected, errors), f"chunk size {size}"
+
+
+def test_splits_inside_strings_and_escapes():
+    elements = [{"q": 'say "hi", then [ok] {x}'}, {"q": "back\\slash \\\" and é"}]
+    assert_every_split(json.dumps(elements), elements)
+    assert_every_split(json.dumps(elements, ensure_ascii=False), elements)
+
+
+def test_nested_arrays_and_objects_are_one_element():
+    elements = [[1, [2, 3]], {"a": [4, {"b": [5]}]}, 6, "seven", None]
+    assert_every_split(json.dumps(elements), elements)
+
+
+def test_prose_and_code_fences_before_the_array_are_ignored():
+    text = 'Here are your questions:\n```json\n[{"q": 1}, {"q": 2}]\n```\nGood luck!'
+    assert_every_split(text, [{"q": 1}, {"q": 2}])
+
+
+def test_elements_are_emitted_as_soon_as_they_complete():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('[{"q": 1}') == [{"q": 1}]
+    assert parser.feed(', {"q": ') == []
+    assert parser.feed('2}, 3') == [{"q": 2}]
+    assert parser.feed(']') == [3]
+    assert parser.finished
+    assert parser.feed(', {"q": 4}]') == []
+
+
+def test_truncated_tail_is_dropped_and_counted():
+    text = '[{"q": 1}, {"q": "cut off'
+    for size in range(1, len(text) + 1):
+        assert feed_in_chunks(text, size) == ([{"q": 1}], 1)
+    assert feed_in_chunks('[{"q": 1}, {"q": [2, 3', 5) == ([{"q": 1}], 1)
+
+
+def test_malformed_middle_element_is_skipped():
+    assert_every_split('[{"q": 1}, {"q": }, {"q": 3}]', [{"q": 1}, {"q": 3}], errors=1)
+    assert_every_split('[{"q": 1}, nonsense, {"q": 3}]', [{"q": 1}, {"q": 3}], errors=1)
+
+
+def test_unbalanced_closer_resynchronises():
+    assert feed_in_chunks('[{"q": 1}, }, {"q": 3}]', 2) == ([{"q": 1}, {"q": 3}], 1)
+
+
+def test_parse_json_array_salvages_or_raises():
+    assert parse_json_array('```json\n[{"q": 1}, {"q": }]\n```') == [{"q": 1}]
+    assert parse_json_array("[]") == []
+    with pytest.raises(ValueError):
+        parse_json_array("I cannot help with that.")
+    with pytest.raises(ValueError):
+        parse_json_array('[{"q": }, {"q": ]')
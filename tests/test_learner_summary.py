@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+from mongomock_motor import AsyncMongoMockClient
+
+from curriculum import CurriculumService, CurriculumSnapshot
+from gamification_service import GamificationService
+from learner_summary import LearnerSummaryBuilder, estimate_tokens
+from models import AchievementType
+
+TOPICS = 300
+
+
+def test_summary_trims_completed_topics_to_the_budget():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        topics = [{"id": f"personal-finance-topic-{t}", "order": t} for t in range(TOPICS)]
+        curriculum = CurriculumService(db, refresh_interval=0)
+        curriculum.snapshot = CurriculumSnapshot(topics, [])
+        builder = LearnerSummaryBuilder(db, curriculum, token_budget=400)
+
+        profile = {"id": "user-1", "level": 3, "topics_completed": [topic["id"] for topic in topics]}
+        summary = await builder.get_summary("user-1", profile)
+
+        assert estimate_tokens(json.dumps(summary)) <= builder.token_budget
+        assert 0 < len(summary["topics_completed"]) < TOPICS
+        assert summary["topics_completed"] == profile["topics_completed"][:len(summary["topics_completed"])]
+        assert len(profile["topics_completed"]) == TOPICS
+
+    asyncio.run(run())
+
+
+def test_cached_summary_is_rebuilt_after_profile_changes():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        builder = LearnerSummaryBuilder(db, CurriculumService(db, refresh_interval=0))
+        profile = {"id": "user-1", "level": 1, "total_xp": 40, "lessons_completed": []}
+        await db.user_profiles.insert_one(dict(profile))
+
+        assert (await builder.get_summary("user-1", profile))["total_xp"] == 40
+        # A profile updated elsewhere no longer matches the cached summary
+        changed = {**profile, "total_xp": 140, "lessons_completed": ["lesson-1"]}
+        summary = await builder.get_summary("user-1", changed)
+        assert summary["total_xp"] == 140 and summary["lessons_completed"] == 1
+
+        # Awarding an achievement drops the cached summary
+        await db.achievements.insert_one({
+            "id": "first-lesson", "type": AchievementType.SPECIAL, "is_active": True,
+            "requirement": {"perfect_lesson": True}, "reward_xp": 0, "reward_gems": 0
+        })
+        gamification = GamificationService(db, learner_summaries=builder)
+        awarded = await gamification.check_and_award_achievements("user-1", {"lesson_score": 100})
+        assert [a["id"] for a in awarded] == ["first-lesson"]
+        assert "user-1" not in builder._cache
+
+    asyncio.run(run())
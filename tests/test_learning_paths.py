@@ -0,0 +1,62 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from curriculum import CurriculumService, CurriculumSnapshot
+from learning_paths import LearningPathService
+
+
+def curriculum(db):
+    service = CurriculumService(db, refresh_interval=0)
+    service.snapshot = CurriculumSnapshot(
+        [{"id": "budgeting", "order": 1}],
+        [
+            {"id": "lesson-1", "topic_id": "budgeting", "order": 1, "title": "Why Budget?"},
+            {"id": "lesson-2", "topic_id": "budgeting", "order": 2, "title": "The 50/30/20 Rule",
+             "prerequisites": ["lesson-1"]},
+            {"id": "lesson-3", "topic_id": "budgeting", "order": 3, "title": "Tracking Spending",
+             "prerequisites": ["lesson-2"]},
+        ]
+    )
+    return service
+
+
+def test_candidate_lessons_skip_completed_in_prerequisite_order():
+    db = AsyncMongoMockClient()["test"]
+    service = LearningPathService(db, curriculum(db))
+
+    candidates = service.candidate_lessons(["lesson-1"])
+
+    assert [c["lesson_id"] for c in candidates] == ["lesson-2", "lesson-3"]
+    assert candidates[0]["title"] == "The 50/30/20 Rule"
+
+
+def test_completion_advances_generated_path():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        service = LearningPathService(db, curriculum(db))
+        path = service.prepare({
+            "id": "path-1", "user_id": "user-1", "is_active": True,
+            "recommended_lessons": [
+                {"lesson_id": "lesson-2", "order": 1},
+                # Matched on its title when the model left out the ID
+                {"title": "tracking spending ", "order": 2},
+                {"lesson_id": "made-up", "title": "Crypto Basics", "order": 3},
+            ]
+        }, lessons_completed=["lesson-1"])
+        assert path["lesson_ids"] == ["lesson-2", "lesson-3"]
+        await db.learning_paths.insert_one(dict(path))
+
+        assert await service.record_lesson_completed("user-1", "lesson-2") == 1
+        assert await service.record_lesson_completed("user-1", "lesson-2") == 0
+        stored = await db.learning_paths.find_one({"id": "path-1"})
+        assert stored["lessons_done"] == 1
+        assert stored["progress"] == 50.0
+        assert stored["completed_at"] is None
+
+        await service.record_lesson_completed("user-1", "lesson-3")
+        stored = await db.learning_paths.find_one({"id": "path-1"})
+        assert stored["progress"] == 100.0
+        assert stored["completed_at"] is not None
+
+    asyncio.run(run())
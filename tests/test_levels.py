@@ -0,0 +1,44 @@
+import asyncio
+from datetime import datetime
+
+import numpy as np
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from gamification_service import GamificationService
+from levels import LevelTable
+
+
+def test_level_lookups_agree():
+    table = LevelTable.from_config("0,500,1500,4000,10000")
+    xp = np.array([0, 499, 500, 1499, 1500, 9999, 10000, 10 ** 6])
+
+    assert [table.level_for(int(x)) for x in xp] == [1, 1, 2, 2, 3, 4, 5, 5]
+    assert table.levels_for(xp).tolist() == [table.level_for(int(x)) for x in xp]
+
+
+def test_thresholds_are_validated():
+    with pytest.raises(ValueError):
+        LevelTable([100, 200])
+    with pytest.raises(ValueError):
+        LevelTable([0, 500, 500])
+
+
+def test_one_level_up_per_level_crossed():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        service = GamificationService(db, levels=LevelTable.from_config("0,500,1500,4000"))
+        await service.ensure_indexes()
+        await db.user_profiles.insert_one({"id": "user-1", "total_xp": 100, "level": 1})
+
+        await service.apply_activity_totals([{
+            "id": "activity-1", "user_id": "user-1", "activity_type": "lesson_completed",
+            "xp_earned": 1500, "gems_earned": 0, "created_at": datetime(2026, 1, 1)
+        }])
+
+        profile = await db.user_profiles.find_one({"id": "user-1"})
+        assert (profile["total_xp"], profile["level"]) == (1600, 3)
+        level_ups = await db.user_activities.find({"activity_type": "level_up"}).to_list(None)
+        assert sorted((a["metadata"]["previous_level"], a["metadata"]["level"]) for a in level_ups) == [(1, 2), (2, 3)]
+
+    asyncio.run(run())
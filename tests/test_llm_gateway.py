@@ -0,0 +1,223 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import ai_service
+from ai_service import AIService, CircuitBreaker, CircuitOpenError, HTTPTransport, LLMGateway
+
+
+class FakeLLMServer:
+    """Local completion endpoint speaking HTTPTransport's protocol
+
+    The first ``fail_next`` requests answer 503; ``/stream`` sends ``chunks`` as
+    separate pieces of a chunked body.
+    """
+
+    def __init__(self):
+        self.fail_next = 0
+        self.requests = []
+        self.chunks = ['[{"question": "a"}', ', {"question": "b"}]']
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.requests.append((self.path, body, self.headers.get("Authorization")))
+                if server.fail_next:
+                    server.fail_next -= 1
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if self.path == "/stream":
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; charset=utf-8")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for chunk in server.chunks:
+                        data = chunk.encode("utf-8")
+                        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                    return
+                payload = json.dumps({"text": f"echo: {body['prompt']}"}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def llm_server():
+    server = FakeLLMServer()
+    yield server
+    server.close()
+
+
+class SlowTransport:
+    """In-process transport that records how many calls overlap"""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def complete(self, system_message, prompt):
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return f"echo: {prompt}"
+
+
+def test_retries_with_backoff_against_a_failing_server(llm_server, monkeypatch):
+    delays = []
+    monkeypatch.setattr(ai_service.random, "uniform", lambda low, high: delays.append(high) or 0)
+    llm_server.fail_next = 2
+    gateway = LLMGateway(HTTPTransport(llm_server.url, api_key="secret"), max_retries=2, backoff_base=0.5)
+
+    assert asyncio.run(gateway.complete("system", "budget")) == "echo: budget"
+
+    assert len(llm_server.requests) == 3
+    assert llm_server.requests[0][2] == "Bearer secret"
+    assert gateway.stats["retries"] == 2
+    # Full jitter over an exponentially growing window
+    assert delays == [0.5, 1.0]
+    assert gateway.breaker.state == "closed"
+
+
+def test_gives_up_after_the_last_retry(llm_server, monkeypatch):
+    monkeypatch.setattr(ai_service.random, "uniform", lambda low, high: 0)
+    llm_server.fail_next = 5
+    gateway = LLMGateway(HTTPTransport(llm_server.url), max_retries=1)
+
+    with pytest.raises(Exception):
+        asyncio.run(gateway.complete("system", "budget"))
+    assert len(llm_server.requests) == 2
+    assert gateway.stats["failures"] == 1
+
+
+def test_breaker_opens_and_recovers_through_a_half_open_probe(llm_server):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    gateway = LLMGateway(HTTPTransport(llm_server.url), max_retries=0, breaker=breaker)
+
+    async def run():
+        llm_server.fail_next = 2
+        for prompt in ("one", "two"):
+            with pytest.raises(Exception):
+                await gateway.complete("system", prompt)
+        assert breaker.state == "open"
+
+        # Open: rejected without reaching the server
+        with pytest.raises(CircuitOpenError):
+            await gateway.complete("system", "three")
+        assert len(llm_server.requests) == 2
+        assert gateway.stats["rejected"] == 1
+
+        await asyncio.sleep(0.15)
+        assert breaker.state == "half_open"
+        # A failed probe opens the circuit again straight away
+        llm_server.fail_next = 1
+        with pytest.raises(Exception):
+            await gateway.complete("system", "probe-1")
+        assert breaker.state == "open"
+
+        await asyncio.sleep(0.15)
+        assert await gateway.complete("system", "probe-2") == "echo: probe-2"
+        assert breaker.state == "closed"
+        assert await gateway.complete("system", "after") == "echo: after"
+
+    asyncio.run(run())
+
+
+def test_half_open_lets_a_single_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_concurrency_is_capped():
+    transport = SlowTransport()
+    gateway = LLMGateway(transport, max_concurrency=2)
+
+    async def run():
+        return await asyncio.gather(*(gateway.complete("system", f"prompt-{i}") for i in range(6)))
+
+    assert asyncio.run(run()) == [f"echo: prompt-{i}" for i in range(6)]
+    assert transport.calls == 6
+    assert transport.max_active == 2
+
+
+def test_identical_prompts_in_flight_are_coalesced():
+    transport = SlowTransport()
+    gateway = LLMGateway(transport)
+
+    async def run():
+        return await asyncio.gather(*(gateway.complete("system", "same") for _ in range(5)))
+
+    assert asyncio.run(run()) == ["echo: same"] * 5
+    assert transport.calls == 1
+    assert gateway.stats["coalesced"] == 4
+    assert gateway.get_stats()["in_flight"] == 0
+
+
+def test_stream_yields_server_chunks(llm_server):
+    gateway = LLMGateway(HTTPTransport(llm_server.url))
+
+    async def run():
+        return [chunk async for chunk in gateway.stream("system", "questions")]
+
+    assert "".join(asyncio.run(run())) == "".join(llm_server.chunks)
+    assert llm_server.requests[0][0] == "/stream"
+
+
+def test_injected_gateway_needs_no_provider_key(monkeypatch):
+    monkeypatch.delenv("EMERGENT_LLM_KEY", raising=False)
+    monkeypatch.delenv("LLM_BASE_URL", raising=False)
+    gateway = LLMGateway(SlowTransport())
+
+    assert AIService(gateway=gateway).gateway is gateway
+    with pytest.raises(ValueError):
+        AIService()
+
+
+def test_stream_base_url_streams_over_http_while_completions_use_the_provider(llm_server, monkeypatch):
+    monkeypatch.setenv("EMERGENT_LLM_KEY", "test-key")
+    monkeypatch.delenv("LLM_BASE_URL", raising=False)
+    monkeypatch.setenv("LLM_STREAM_BASE_URL", llm_server.url)
+    gateway = AIService().gateway
+
+    async def run():
+        return [chunk async for chunk in gateway.stream("system", "questions")]
+
+    assert isinstance(gateway.transport, ai_service.EmergentTransport)
+    assert "".join(asyncio.run(run())) == "".join(llm_server.chunks)
+    assert llm_server.requests[0][0] == "/stream"
@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from event_bus import EventBus
+from gamification_service import GamificationService
+from outbox import OutboxDispatcher, new_entry
+
+
+def test_late_entry_reaches_totals_through_the_bus():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        bus = EventBus(db, settle_seconds=0)
+        service = GamificationService(db, event_bus=bus)
+        bus.register("totals", service.apply_activity_totals)
+        dispatcher = OutboxDispatcher(db, "user_progress")
+
+        async def handler(entry):
+            # Mirrors the server's lesson completion handler
+            await service.record_user_activity(
+                user_id=entry["payload"]["user_id"],
+                activity_type="lesson_completed",
+                xp_earned=entry["payload"]["xp_earned"],
+                metadata={"completed_at": entry["created_at"]},
+                activity_id=entry["id"]
+            )
+
+        dispatcher.register("lesson_completed", handler)
+        await service.ensure_indexes()
+        await db.user_profiles.insert_one({"id": "user-1", "total_xp": 0, "total_gems": 0})
+
+        # An entry written an hour ago whose first attempts failed is applied after newer activity
+        late = new_entry("lesson_completed", {"user_id": "user-1", "xp_earned": 40})
+        late["created_at"] = late["next_attempt_at"] = datetime.utcnow() - timedelta(hours=1)
+        await service.record_user_activity(user_id="user-1", activity_type="lesson_completed", xp_earned=10)
+        await bus.drain()
+
+        await db.user_progress.insert_one({"id": "progress-1", "outbox": [late]})
+        await dispatcher.run_once()
+        await bus.drain()
+
+        profile = await db.user_profiles.find_one({"id": "user-1"})
+        assert profile["total_xp"] == 50
+        activity = await db.user_activities.find_one({"id": late["id"]})
+        # Mongo stores milliseconds
+        assert abs(activity["metadata"]["completed_at"] - late["created_at"]) < timedelta(milliseconds=1)
+        assert activity["created_at"] > late["created_at"]
+
+        # Replaying the same entry changes nothing
+        await db.user_progress.update_one({"id": "progress-1"}, {"$set": {"outbox": [late]}})
+        await dispatcher.run_once()
+        await bus.drain()
+        assert (await db.user_profiles.find_one({"id": "user-1"}))["total_xp"] == 50
+
+    asyncio.run(run())
+
+
+def test_concurrent_dispatchers_run_an_entry_once():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        calls = []
+
+        async def handler(entry):
+            await asyncio.sleep(0)
+            calls.append(entry["id"])
+
+        dispatchers = [OutboxDispatcher(db, "user_progress") for _ in range(3)]
+        for dispatcher in dispatchers:
+            dispatcher.register("lesson_completed", handler)
+        entry = new_entry("lesson_completed", {})
+        entry["next_attempt_at"] -= timedelta(seconds=1)
+        await db.user_progress.insert_one({"id": "progress-1", "outbox": [entry]})
+
+        await asyncio.gather(*(dispatcher.run_once() for dispatcher in dispatchers))
+
+        assert calls == [entry["id"]]
+        assert (await db.user_progress.find_one({"id": "progress-1"}))["outbox"] == []
+
+    asyncio.run(run())
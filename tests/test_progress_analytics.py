@@ -0,0 +1,55 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from curriculum import CurriculumService, CurriculumSnapshot
+from models import UserProfile
+from progress_analytics import SUMMARY_BUDGET_BYTES, ProgressAnalytics
+
+TOPICS = 25
+LESSONS_PER_TOPIC = 200
+
+
+def test_summary_of_a_5000_lesson_user_fits_the_budget():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        topics = [{"id": f"topic-{t}", "order": t} for t in range(TOPICS)]
+        lessons = [
+            {"id": f"topic-{t}-lesson-{l}", "topic_id": f"topic-{t}", "order": l}
+            for t in range(TOPICS) for l in range(LESSONS_PER_TOPIC)
+        ]
+        curriculum = CurriculumService(db, refresh_interval=0)
+        curriculum.snapshot = CurriculumSnapshot(topics, lessons)
+
+        now = datetime.utcnow()
+        profile = UserProfile(id="user-1", username="learner", email="learner@example.com").dict()
+        profile.update({
+            "lessons_completed": [lesson["id"] for lesson in lessons],
+            "topics_completed": [topic["id"] for topic in topics],
+            "achievements": [f"achievement-{i}" for i in range(40)],
+            "total_xp": 50 * len(lessons)
+        })
+        await db.user_profiles.insert_one(profile)
+        await db.user_progress.insert_many([
+            {"id": f"progress-{i}", "user_id": "user-1", "lesson_id": lesson["id"], "topic_id": lesson["topic_id"],
+             "best_score": 80 + i % 20, "time_spent": 300, "last_accessed": now - timedelta(minutes=i)}
+            for i, lesson in enumerate(lessons)
+        ])
+        await db.user_activities.insert_many([
+            {"id": f"activity-{i}", "user_id": "user-1", "activity_type": "lesson_completed",
+             "content_id": lesson["id"], "xp_earned": 50, "gems_earned": 5,
+             "metadata": {"score": 90, "time_spent": 300}, "created_at": now - timedelta(minutes=i)}
+            for i, lesson in enumerate(lessons)
+        ])
+
+        summary = await ProgressAnalytics(db, curriculum).get_summary("user-1")
+
+        body = json.dumps(summary, default=str).encode()
+        assert summary["statistics"]["total_lessons_completed"] == len(lessons)
+        assert summary["statistics"]["lessons_attempted"] == len(lessons)
+        assert len(summary["topics"]) == TOPICS
+        assert len(body) <= SUMMARY_BUDGET_BYTES, f"summary is {len(body)} bytes"
+
+    asyncio.run(run())
@@ -0,0 +1,126 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import DuplicateKeyError
+
+from curriculum import CurriculumService, CurriculumSnapshot
+from gamification_service import GamificationService
+from models import AchievementType
+from progress_service import MASTERY_ALPHA, ProgressService
+
+
+def legacy_row(lesson_id, score, minutes):
+    moment = datetime(2026, 1, 1) + timedelta(minutes=minutes)
+    return {"id": f"{lesson_id}-{minutes}", "user_id": "user-1", "lesson_id": lesson_id, "topic_id": "budgeting",
+            "status": "completed", "score": score, "attempts": 1, "time_spent": 60, "mastery_level": 0.0,
+            "progress_percentage": 100.0, "created_at": moment, "last_accessed": moment}
+
+
+def test_migrate_duplicates_sets_mastery_on_every_row():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        service = ProgressService(db, CurriculumService(db, refresh_interval=0))
+        await db.user_progress.insert_many([
+            legacy_row("lesson-1", 60, 0),
+            legacy_row("lesson-1", 100, 10),
+            legacy_row("lesson-2", 95, 20),
+            legacy_row("lesson-3", 70, 30),
+        ])
+
+        stats = await service.migrate_duplicates()
+
+        assert stats["groups_folded"] == 1
+        assert stats["documents_removed"] == 1
+        rows = {row["lesson_id"]: row async for row in db.user_progress.find({})}
+        assert len(rows) == 3
+        assert rows["lesson-1"]["mastery_level"] == round(MASTERY_ALPHA * 1.0 + (1 - MASTERY_ALPHA) * 0.6, 4)
+        assert rows["lesson-2"]["mastery_level"] == 0.95
+        assert rows["lesson-2"]["status"] == "mastered"
+        assert rows["lesson-3"]["mastery_level"] == 0.7
+        assert rows["lesson-3"]["status"] == "completed"
+        assert rows["lesson-3"]["best_score"] == 70
+
+        # Running the migration again changes nothing
+        assert (await service.migrate_duplicates())["mastery_recomputed"] == 0
+
+    asyncio.run(run())
+
+
+def test_lessons_missing_from_the_snapshot_count_towards_their_topic():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        # The snapshot predates both lessons
+        service = ProgressService(db, CurriculumService(db, refresh_interval=0))
+        await service.ensure_indexes()
+        await db.lessons.insert_many([
+            {"id": "lesson-1", "topic_id": "budgeting"},
+            {"id": "lesson-2", "topic_id": "budgeting"},
+        ])
+        await db.user_profiles.insert_one({"id": "user-1"})
+
+        assert await service.record_first_completion("user-1", "lesson-1") is None
+        assert await service.record_first_completion("user-1", "lesson-2") == "budgeting"
+        assert await service.get_completed_topics("user-1") == ["budgeting"]
+        assert (await db.user_profiles.find_one({"id": "user-1"}))["topics_completed"] == ["budgeting"]
+
+        # Topic achievements read the same counters
+        await db.achievements.insert_one({
+            "id": "budget-master", "type": AchievementType.TOPICS, "is_active": True,
+            "requirement": {"topics_completed": ["budgeting"]}, "reward_xp": 0, "reward_gems": 0
+        })
+        gamification = GamificationService(db, progress_service=service)
+        awarded = await gamification.check_and_award_achievements("user-1", {})
+        assert [a["id"] for a in awarded] == ["budget-master"]
+
+    asyncio.run(run())
+
+
+class LosesUpsertRace:
+    """Counter collection whose first upsert loses the insert race to ``racer``"""
+
+    def __init__(self, collection, racer):
+        self.collection = collection
+        self.racer = racer
+
+    async def find_one_and_update(self, *args, **kwargs):
+        if kwargs.get("upsert") and self.racer:
+            racer, self.racer = self.racer, None
+            await racer()
+            raise DuplicateKeyError("E11000 duplicate key error")
+        return await self.collection.find_one_and_update(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def test_concurrent_first_completions_of_different_lessons_both_count():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        curriculum = CurriculumService(db, refresh_interval=0)
+        curriculum.snapshot = CurriculumSnapshot(
+            [{"id": "budgeting", "order": 1}],
+            [{"id": "lesson-1", "topic_id": "budgeting", "order": 1},
+             {"id": "lesson-2", "topic_id": "budgeting", "order": 2}]
+        )
+        other = ProgressService(db, curriculum)
+        await other.ensure_indexes()
+        service = ProgressService(db, curriculum)
+        await db.user_profiles.insert_one({"id": "user-1"})
+        service.topic_progress_collection = LosesUpsertRace(
+            service.topic_progress_collection,
+            lambda: other.record_first_completion("user-1", "lesson-2", completion_id="completion-2")
+        )
+
+        assert await service.record_first_completion("user-1", "lesson-1", completion_id="completion-1") == "budgeting"
+        counter = await db.topic_progress.find_one({"user_id": "user-1", "topic_id": "budgeting"})
+        assert counter["lessons_done"] == 2
+        assert await service.get_completed_topics("user-1") == ["budgeting"]
+
+        # Replaying either completion changes nothing
+        assert await service.record_first_completion("user-1", "lesson-1", completion_id="completion-1") is None
+        assert await other.record_first_completion("user-1", "lesson-2", completion_id="completion-2") is None
+        counter = await db.topic_progress.find_one({"user_id": "user-1", "topic_id": "budgeting"})
+        assert counter["lessons_done"] == 2
+
+    asyncio.run(run())
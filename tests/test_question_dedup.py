@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime, timedelta
+from itertools import combinations
+
+from mongomock_motor import AsyncMongoMockClient
+
+from question_dedup import (
+    DUPLICATE_THRESHOLD, QuestionDeduplicator, estimate_similarity, lsh_band_keys, minhash_signatures
+)
+
+QUESTIONS = [
+    "What is the main purpose of creating a monthly budget?",
+    "Which account type usually offers the highest interest for long-term savings?",
+    "How does compound interest differ from simple interest?",
+    "What percentage of income does the 50/30/20 rule assign to needs?",
+    "Why is an emergency fund important before investing in stocks?",
+    "What happens to bond prices when interest rates rise?",
+    "Which factor has the largest impact on your credit score?",
+    "What is the difference between a Roth IRA and a traditional IRA?",
+    "How can diversification reduce the risk of an investment portfolio?",
+    "What does an annual percentage rate (APR) on a credit card measure?",
+    "Why do index funds typically have lower fees than actively managed funds?",
+    "What is inflation and how does it affect purchasing power?",
+]
+
+NEAR_DUPLICATES = [
+    "What's the main purpose of creating a monthly budget??",
+    "Which account type usually offers the highest interest for long term savings",
+    "How does compound interest differ from simple interest, exactly?",
+    "What percentage of your income does the 50/30/20 rule assign to needs?",
+    "Why is an emergency fund important before you invest in stocks?",
+    "What happens to bond prices when interest rates go up?",
+    "Which factor has the biggest impact on your credit score?",
+    "What is the difference between a Roth IRA and a Traditional IRA account?",
+    "How can diversification reduce the risk of your investment portfolio?",
+    "What does the annual percentage rate (APR) on a credit card measure?",
+    "Why do index funds typically have lower fees than actively-managed funds?",
+    "What is inflation, and how does it affect your purchasing power?",
+]
+
+
+def flagged(signatures, bands, i, j):
+    """Whether LSH makes (i, j) a candidate pair and the signatures confirm it"""
+    if not set(bands[i]) & set(bands[j]):
+        return False
+    return estimate_similarity(signatures[i], signatures[j][None, :])[0] >= DUPLICATE_THRESHOLD
+
+
+def test_lsh_recall_and_precision_on_near_duplicates():
+    texts = QUESTIONS + NEAR_DUPLICATES
+    signatures = minhash_signatures(texts)
+    bands = lsh_band_keys(signatures)
+    n = len(QUESTIONS)
+
+    recall = sum(flagged(signatures, bands, i, n + i) for i in range(n)) / n
+    false_pairs = sum(
+        flagged(signatures, bands, i, j)
+        for i, j in combinations(range(len(texts)), 2)
+        if i % n != j % n
+    )
+
+    assert recall >= 0.9
+    assert false_pairs == 0
+
+
+def question(question_id, text, lesson_id="lesson-1"):
+    return {"id": question_id, "topic_id": "budgeting", "lesson_id": lesson_id, "question": text,
+            "tags": [question_id], "hints": []}
+
+
+def test_filter_duplicates_points_rejects_at_the_kept_question():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        deduplicator = QuestionDeduplicator(db.questions)
+        stored = question("stored", QUESTIONS[0])
+        deduplicator.annotate([stored])
+        await db.questions.insert_one(stored)
+
+        batch = [
+            question("new-1", NEAR_DUPLICATES[0]),
+            question("new-2", QUESTIONS[1]),
+            question("new-3", NEAR_DUPLICATES[1]),
+            question("other-lesson", QUESTIONS[0], lesson_id="lesson-2"),
+        ]
+        unique = await deduplicator.filter_duplicates(batch)
+
+        assert [q["id"] for q in unique] == ["new-2", "other-lesson"]
+        assert batch[0]["duplicate_of"] == "stored"
+        assert batch[2]["duplicate_of"] == "new-2"
+        assert (await db.questions.find_one({"id": "stored"}))["tags"] == ["stored", "new-1"]
+
+    asyncio.run(run())
+
+
+def test_dedupe_collection_keeps_the_oldest_of_each_cluster():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        deduplicator = QuestionDeduplicator(db.questions)
+        await deduplicator.ensure_indexes()
+        texts = NEAR_DUPLICATES + QUESTIONS
+        await db.questions.insert_many([
+            {**question(f"q{i}", text), "created_at": datetime(2026, 1, 1) + timedelta(minutes=i)}
+            for i, text in enumerate(texts)
+        ])
+
+        stats = await deduplicator.dedupe_collection(batch_size=5)
+
+        assert stats["duplicates_removed"] == len(QUESTIONS)
+        remaining = await db.questions.distinct("id")
+        assert sorted(remaining) == sorted(f"q{i}" for i in range(len(NEAR_DUPLICATES)))
+
+    asyncio.run(run())
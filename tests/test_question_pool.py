@@ -0,0 +1,117 @@
+import asyncio
+import json
+import random
+
+from mongomock_motor import AsyncMongoMockClient
+
+from ai_service import AIService, LLMGateway
+from models import QuestionType
+from question_pool import QuestionPool
+
+KEY = ("budgeting", 1, QuestionType.MULTIPLE_CHOICE.value)
+WORDS = ("budget income expense saving interest credit loan mortgage index fund bond stock dividend tax "
+         "inflation pension insurance premium deductible equity asset liability rent salary fee").split()
+
+
+class FakeTransport:
+    """Answers each prompt with ``count`` unrelated questions"""
+
+    def __init__(self, seed=1):
+        self.rng = random.Random(seed)
+
+    async def complete(self, system_message, prompt):
+        count = int(prompt.split("Generate ")[1].split()[0])
+        return json.dumps([
+            {"question": " ".join(self.rng.sample(WORDS, 12)) + "?", "options": ["a", "b"],
+             "correct_answer": "a", "explanation": "Because."}
+            for _ in range(count)
+        ])
+
+
+def make_pool(db, seed=1, **kwargs):
+    return QuestionPool(db, AIService(gateway=LLMGateway(FakeTransport(seed))), **kwargs)
+
+
+async def filled_pool(db, questions=12, **kwargs):
+    pool = make_pool(db, refill_batch=questions, **kwargs)
+    await pool.ensure_indexes()
+    await pool._refill(KEY)
+    assert await db.question_pool.count_documents({}) == questions
+    return pool
+
+
+def draw(pool, **kwargs):
+    return pool.draw("budgeting", 1, QuestionType.MULTIPLE_CHOICE, **kwargs)
+
+
+def test_user_draws_skip_questions_already_seen():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        pool = await filled_pool(db, low_water=0)
+
+        drawn = [[q["id"] for q in await draw(pool, count=5, user_id="user-1")] for _ in range(3)]
+
+        assert [len(ids) for ids in drawn] == [5, 5, 2]
+        assert len({qid for ids in drawn for qid in ids}) == 12
+        assert await draw(pool, count=5, user_id="user-1") == []
+        # Another user starts from the beginning of the pool
+        assert len(await draw(pool, count=5, user_id="user-2")) == 5
+        assert pool.metrics["questions_served"] == 17
+
+    asyncio.run(run())
+
+
+def test_anonymous_draws_rotate_through_the_pool():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        pool = await filled_pool(db, low_water=0)
+
+        served = set()
+        for _ in range(20):
+            questions = await draw(pool, count=3)
+            assert len(questions) == 3 and "minhash" not in questions[0]
+            served.update(q["id"] for q in questions)
+
+        assert len(served) > 3
+
+    asyncio.run(run())
+
+
+def test_draw_queues_a_refill_below_the_low_water_mark():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        pool = await filled_pool(db, low_water=10)
+
+        await draw(pool, count=1, user_id="user-1")
+        assert KEY not in pool._pending
+
+        await draw(pool, count=2, user_id="user-1")
+        assert KEY in pool._pending
+
+    asyncio.run(run())
+
+
+def test_refill_decisions_use_the_depth_in_the_collection():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        # Two server workers sharing one pool collection
+        first = await filled_pool(db, low_water=0)
+        second = make_pool(db, seed=2, low_water=5, refill_batch=6, max_depth=18)
+
+        await second.start()
+        second.request_refill(KEY)
+        await second._queue.join()
+        await second.stop()
+        assert await db.question_pool.count_documents({}) == 18
+
+        # The first worker never saw the refill, but counts the collection
+        first.low_water, first.max_depth = 30, 18
+        await draw(first, count=1)
+        assert first.depth[KEY] == 18
+        assert KEY not in first._pending
+
+        # A refill queued before the pool filled up does not overfill it
+        await second._refill(KEY)
+        assert await db.question_pool.count_documents({}) == 18
+
+    asyncio.run(run())
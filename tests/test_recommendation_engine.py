@@ -0,0 +1,142 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from curriculum import CurriculumService, CurriculumSnapshot
+from recommendation_engine import MAX_REVIEWS, LocalRecommender
+
+TOPICS = [{"id": "basics", "order": 1}, {"id": "investing", "order": 2, "prerequisites": ["basics"]}]
+
+
+def lesson(topic, index, difficulty=1, prerequisites=()):
+    return {"id": f"{topic}-{index}", "topic_id": topic, "order": index, "difficulty": difficulty,
+            "title": f"{topic.title()} {index}", "prerequisites": list(prerequisites)}
+
+
+LESSONS = [
+    lesson("basics", 0),
+    lesson("basics", 1, prerequisites=["basics-0"]),
+    lesson("basics", 2, prerequisites=["basics-0"]),
+    lesson("basics", 3, difficulty=3, prerequisites=["basics-0"]),
+    lesson("basics", 4, prerequisites=["basics-1"]),
+    lesson("investing", 0, difficulty=2),
+]
+
+
+def snapshot():
+    return CurriculumSnapshot(TOPICS, LESSONS)
+
+
+def progress(lesson_id, days_ago=10, **fields):
+    return {"lesson_id": lesson_id, "last_accessed": datetime.utcnow() - timedelta(days=days_ago), **fields}
+
+
+def rank(rows, profile=None, limit=8):
+    profile = profile or {"level": 1, "lessons_completed": [row["lesson_id"] for row in rows]}
+    recommender = LocalRecommender(AsyncMongoMockClient()["test"], None)
+    return recommender.rank(snapshot(), "user-1", profile, rows, limit)
+
+
+def by_kind(recommendations, kind):
+    return [r["content_id"] for r in recommendations if r["type"] == kind]
+
+
+def test_new_user_gets_the_first_unlocked_lesson():
+    recommendations = rank([], {"level": 1, "lessons_completed": []})
+
+    assert by_kind(recommendations, "lesson") == ["basics-0"]
+    assert by_kind(recommendations, "review") == []
+
+
+def test_only_unlocked_lessons_not_done_yet_are_recommended():
+    recommendations = rank([progress("basics-0", best_score=100)])
+
+    # basics-4 needs basics-1, and investing needs every basics lesson
+    assert set(by_kind(recommendations, "lesson")) == {"basics-1", "basics-2", "basics-3"}
+    assert by_kind(recommendations, "review") == []
+
+
+def test_difficulty_fit_follows_the_level():
+    rows = [progress("basics-0", best_score=100)]
+
+    beginner = by_kind(rank(rows, {"level": 1, "lessons_completed": ["basics-0"]}), "lesson")
+    advanced = by_kind(rank(rows, {"level": 3, "lessons_completed": ["basics-0"]}), "lesson")
+
+    assert beginner[-1] == "basics-3"
+    assert advanced[0] == "basics-3"
+
+
+def test_weak_lessons_are_reviewed_weakest_first_and_capped():
+    rows = [progress(f"basics-{i}", best_score=score) for i, score in enumerate((40, 70, 55, 95, 10))]
+
+    recommendations = rank(rows)
+
+    reviews = [r for r in recommendations if r["type"] == "review"]
+    assert [r["content_id"] for r in reviews] == ["basics-4", "basics-0", "basics-2"][:MAX_REVIEWS]
+    assert reviews[0]["reason"].startswith("You scored 10%")
+    assert by_kind(recommendations, "lesson") == ["investing-0"]
+
+
+def test_recent_weak_lessons_wait_before_review():
+    rows = [progress("basics-0", days_ago=0, best_score=50), progress("basics-1", days_ago=20, best_score=60)]
+
+    reviews = [r for r in rank(rows) if r["type"] == "review"]
+
+    assert [r["content_id"] for r in reviews] == ["basics-1", "basics-0"]
+    assert reviews[0]["confidence_score"] > reviews[1]["confidence_score"]
+
+
+def test_legacy_rows_without_best_score_use_their_score():
+    rows = [
+        # Written before best_score existed
+        progress("basics-0", score=95),
+        progress("basics-1", score=40),
+        # No score recorded at all
+        progress("basics-2"),
+    ]
+
+    recommendations = rank(rows)
+
+    reviews = [r for r in recommendations if r["type"] == "review"]
+    assert [r["content_id"] for r in reviews] == ["basics-1"]
+    assert reviews[0]["reason"].startswith("You scored 40%")
+    assert set(by_kind(recommendations, "lesson")) == {"basics-3", "basics-4"}
+
+
+def test_best_attempt_counts_when_rows_repeat():
+    rows = [progress("basics-0", best_score=30), progress("basics-0", best_score=90)]
+
+    assert by_kind(rank(rows), "review") == []
+
+
+def test_limit_and_priorities():
+    rows = [progress("basics-0", best_score=20)]
+
+    recommendations = rank(rows, limit=2)
+
+    assert len(recommendations) == 2
+    assert [r["priority"] for r in recommendations] == [5, 4]
+    assert all(r["source"] == "local" and r["user_id"] == "user-1" for r in recommendations)
+
+
+def test_recommend_reads_progress_from_the_collection():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await db.topics.insert_many([dict(topic) for topic in TOPICS])
+        await db.lessons.insert_many([dict(row) for row in LESSONS])
+        await db.user_progress.insert_many([
+            {"user_id": "user-1", **progress("basics-0", score=35)},
+            {"user_id": "someone-else", **progress("basics-1", best_score=10)},
+        ])
+        curriculum = CurriculumService(db)
+        await curriculum.refresh()
+        recommender = LocalRecommender(db, curriculum)
+
+        recommendations = await recommender.recommend("user-1", {"level": 1, "lessons_completed": ["basics-0"]})
+
+        assert by_kind(recommendations, "review") == ["basics-0"]
+        assert set(by_kind(recommendations, "lesson")) == {"basics-1", "basics-2", "basics-3"}
+        assert await LocalRecommender(db, CurriculumService(db)).recommend("user-1", {}) == []
+
+    asyncio.run(run())
@@ -0,0 +1,100 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from recommendation_store import RecommendationStore
+
+
+def rec(content_id, priority=1, kind="lesson"):
+    return {"type": kind, "content_id": content_id, "reason": "Next up.", "confidence_score": 0.5,
+            "priority": priority}
+
+
+async def make_store(**kwargs):
+    store = RecommendationStore(AsyncMongoMockClient()["test"], **kwargs)
+    await store.ensure_indexes()
+    return store
+
+
+async def content_ids(store, user_id, version):
+    return [r["content_id"] for r in await store.get(user_id, version)]
+
+
+def test_saved_set_is_served_for_its_version_by_priority():
+    async def run():
+        store = await make_store()
+
+        saved = await store.save("user-1", 3, [rec("a", 1), rec("b", 5), rec("c", 3)], source="local")
+
+        assert [r["content_id"] for r in saved] == ["b", "c", "a"]
+        assert await content_ids(store, "user-1", 3) == ["b", "c", "a"]
+        assert {r["source"] for r in await store.get("user-1", 3)} == {"local"}
+        assert await store.get("user-2", 3) == []
+
+    asyncio.run(run())
+
+
+def test_version_bump_stops_serving_the_old_set():
+    async def run():
+        store = await make_store()
+        await store.save("user-1", 1, [rec("a"), rec("b")])
+
+        # A lesson completion or achievement bumped the profile's recommendations_version
+        assert await store.get("user-1", 2) == []
+
+        await store.save("user-1", 2, [rec("c")])
+        assert await content_ids(store, "user-1", 2) == ["c"]
+        # Superseded versions are deleted, not just hidden
+        assert await store.recommendations_collection.count_documents({"user_id": "user-1"}) == 1
+
+    asyncio.run(run())
+
+
+def test_resaving_a_version_replaces_its_rows():
+    async def run():
+        store = await make_store()
+        first = await store.save("user-1", 1, [rec("a"), rec("b")])
+
+        second = await store.save("user-1", 1, [rec("b", 4), rec("c")])
+
+        assert await content_ids(store, "user-1", 1) == ["b", "c"]
+        # Stable IDs: the row for "b" was updated in place
+        assert {r["id"] for r in first} & {r["id"] for r in second} == {second[0]["id"]}
+        assert await store.recommendations_collection.count_documents({}) == 2
+
+    asyncio.run(run())
+
+
+def test_late_save_for_an_old_version_keeps_the_newer_set():
+    async def run():
+        store = await make_store()
+        await store.save("user-1", 2, [rec("new")])
+
+        # An enrichment started before the version bump finishes afterwards
+        await store.save("user-1", 1, [rec("old")])
+
+        assert await content_ids(store, "user-1", 2) == ["new"]
+
+    asyncio.run(run())
+
+
+def test_expired_sets_are_not_served():
+    async def run():
+        store = await make_store(ttl=0)
+        await store.save("user-1", 1, [rec("a")])
+
+        assert await store.get("user-1", 1) == []
+
+    asyncio.run(run())
+
+
+def test_other_users_are_untouched():
+    async def run():
+        store = await make_store()
+        await store.save("user-2", 1, [rec("theirs")])
+
+        await store.save("user-1", 5, [rec("mine")])
+
+        assert await content_ids(store, "user-2", 1) == ["theirs"]
+
+    asyncio.run(run())
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+
+from models import QuestionResponse
+from response_log import COMPACT_LOCK_NAME, COMPACT_LOCK_SECONDS, ResponseLog
+
+DAY = datetime(2026, 3, 1, 12, 0)
+
+
+def responses(count):
+    return [QuestionResponse(question_id=f"q{i}", user_answer="a", is_correct=i % 2 == 0, time_taken=5)
+            for i in range(count)]
+
+
+def scanned_rows(log, **kwargs):
+    return sum(batch.num_rows for batch in log.scan(**kwargs))
+
+
+async def write_parts(log, parts, rows_per_part=3):
+    for i in range(parts):
+        log.append(f"user-{i}", "lesson-1", "budgeting", responses(rows_per_part), answered_at=DAY)
+        await log.flush()
+
+
+def test_flush_writes_day_partitions_and_scan_reads_them(tmp_path):
+    async def run():
+        log = ResponseLog(str(tmp_path))
+        log.append("user-1", "lesson-1", "budgeting", responses(4), answered_at=DAY)
+        log.append("user-1", "lesson-2", "budgeting", responses(2), answered_at=DAY + timedelta(days=1))
+
+        assert await log.flush() == 6
+        assert await log.flush() == 0
+        assert log.days() == ["2026-03-01", "2026-03-02"]
+        assert log.stats["files_written"] == 2
+        assert scanned_rows(log) == 6
+        assert scanned_rows(log, since=(DAY + timedelta(days=1)).date()) == 2
+        days = {b.to_pydict()["day"][0] for b in log.scan(columns=["question_id", "day"]) if b.num_rows}
+        assert days == {"2026-03-01", "2026-03-02"}
+
+    asyncio.run(run())
+
+
+def test_compact_merges_parts_without_changing_the_rows(tmp_path):
+    async def run():
+        log = ResponseLog(str(tmp_path))
+        await write_parts(log, 3)
+        assert len(log.day_files("2026-03-01")) == 3
+
+        assert log.compact(DAY.date())
+        files = log.day_files("2026-03-01")
+        assert len(files) == 1 and files[0].name.startswith("compact-")
+        assert len(log.source_parts(files[0])) == 3
+        assert scanned_rows(log) == 9
+        assert not (tmp_path / "day=2026-03-01" / COMPACT_LOCK_NAME).exists()
+        # Nothing left to merge
+        assert not log.compact(DAY.date())
+
+    asyncio.run(run())
+
+
+def test_parts_left_by_an_interrupted_compaction_are_not_read_twice(tmp_path):
+    async def run():
+        log = ResponseLog(str(tmp_path))
+        await write_parts(log, 2)
+        directory = tmp_path / "day=2026-03-01"
+        saved = tmp_path / "saved"
+        shutil.copytree(directory, saved)
+
+        assert log.compact(DAY.date())
+        # The compactor died after the rename, before removing its parts
+        for part in saved.glob("part-*.parquet"):
+            shutil.copy(part, directory / part.name)
+
+        assert [path.name[:8] for path in log.day_files("2026-03-01")] == ["compact-"]
+        assert scanned_rows(log) == 6
+
+        # The next compaction finishes the cleanup
+        assert not log.compact(DAY.date())
+        assert not list(directory.glob("part-*.parquet"))
+        assert scanned_rows(log) == 6
+
+    asyncio.run(run())
+
+
+def test_compaction_waits_for_the_lock_and_takes_over_a_stale_one(tmp_path):
+    async def run():
+        log = ResponseLog(str(tmp_path))
+        await write_parts(log, 2)
+        lock = tmp_path / "day=2026-03-01" / COMPACT_LOCK_NAME
+        lock.touch()
+
+        # Another worker is compacting this day
+        assert not log.compact(DAY.date())
+        assert len(log.day_files("2026-03-01")) == 2
+
+        stale = time.time() - COMPACT_LOCK_SECONDS - 1
+        os.utime(lock, (stale, stale))
+        assert log.compact(DAY.date())
+        assert len(log.day_files("2026-03-01")) == 1
+        assert not lock.exists()
+        assert scanned_rows(log) == 6
+
+    asyncio.run(run())
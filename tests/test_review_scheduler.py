@@ -0,0 +1,42 @@
+import numpy as np
+
+from review_scheduler import (
+    INITIAL_EASINESS, MAX_INTERVAL_DAYS, MIN_EASINESS, grade_responses, sm2_step
+)
+
+
+def review(state, grade):
+    easiness, interval, repetitions = sm2_step(
+        np.array([state[0]]), np.array([state[1]]), np.array([state[2]]), np.array([grade])
+    )
+    return float(easiness[0]), float(interval[0]), int(repetitions[0])
+
+
+def test_grades_reflect_correctness_and_answer_time():
+    grades = grade_responses(np.array([True, True, True, False]), np.array([5, 20, 60, 5]))
+    assert grades.tolist() == [5, 4, 3, 1]
+
+
+def test_intervals_and_easiness_follow_sm2():
+    state = (INITIAL_EASINESS, 0.0, 0)
+
+    state = review(state, 5)
+    assert state == (2.6, 1.0, 1)
+    state = review(state, 5)
+    assert np.isclose(state[0], 2.7) and state[1:] == (6.0, 2)
+    # Grade 4 leaves easiness unchanged and multiplies the interval by it
+    state = review(state, 4)
+    assert np.isclose(state[0], 2.7) and np.isclose(state[1], 16.2) and state[2] == 3
+    # A miss resets the schedule and lowers easiness
+    state = review(state, 1)
+    assert np.isclose(state[0], 2.16) and state[1:] == (1.0, 0)
+
+
+def test_easiness_floor_and_interval_cap():
+    state = (INITIAL_EASINESS, 0.0, 0)
+    for _ in range(20):
+        state = review(state, 3)
+    assert state[0] == MIN_EASINESS
+
+    state = (INITIAL_EASINESS, 300.0, 5)
+    assert review(state, 5)[1] == MAX_INTERVAL_DAYS